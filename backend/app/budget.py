@@ -0,0 +1,93 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from app.executor import InferenceExecutor
+from models.instrumentation import instrumentation
+
+
+class LatencyBudget:
+    """Choose the quality tier of each request from the latency expected at the current load.
+
+    Service times are tracked per group and tier as an exponentially weighted average
+    per unit of work. A request gets the best tier whose expected latency (the rounds of
+    requests queued ahead of it on the group's pool, plus its own service time) fits its
+    budget: the request's own budget or the group's target, whichever is smaller. A tier
+    without measurements is assumed to fit, so the next one down is tried when it is
+    needed. When no tier fits the cheapest is served, and the pool's bounded queue sheds
+    what is left.
+    """
+
+    def __init__(self, executor: InferenceExecutor, tiers: Dict[str, List[str]], targets_ms: Dict[str, float],
+                 smoothing: float = 0.2):
+        self.executor = executor
+        self.tiers = tiers  # best first
+        self.targets_ms = targets_ms  # 0 means no target
+        self.smoothing = smoothing
+        self._seconds: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+        # Metrics
+        self._served: Dict[tuple, int] = {}
+
+    def choose(self, group: str, budget_ms: Optional[float] = None, size: float = 1.0) -> str:
+        """The best tier of the group expected to finish within budget_ms and the group's target."""
+        tiers = self.tiers[group]
+        targets = [t for t in (self.targets_ms.get(group), budget_ms) if t]
+        tier = tiers[0]
+        if targets:
+            limit = min(targets) / 1000.0
+            rounds = self._rounds(group)
+            with self._lock:
+                for tier in tiers:
+                    seconds = self._seconds.get((group, tier))
+                    if seconds is None or (rounds + 1) * seconds * size <= limit:
+                        break
+        return tier
+
+    def tiers_from_best(self, group: str, tier: str) -> List[str]:
+        """The tiers of the group at least as good as tier, best first."""
+        tiers = self.tiers[group]
+        return tiers[:tiers.index(tier) + 1]
+
+    def record(self, group: str, tier: str):
+        """Count a response served at the tier."""
+        with self._lock:
+            self._served[(group, tier)] = self._served.get((group, tier), 0) + 1
+        instrumentation.count("quality_tier_total", group=group, tier=tier)
+
+    @contextmanager
+    def measure(self, group: str, tier: str, size: float = 1.0):
+        """Time the block and, if it succeeds, update the tier's service time."""
+        rounds = self._rounds(group)
+        start = time.perf_counter()
+        yield
+        # Time spent waiting behind other requests is not part of the service time
+        seconds = (time.perf_counter() - start) / (rounds + 1) / size
+        with self._lock:
+            previous = self._seconds.get((group, tier))
+            self._seconds[(group, tier)] = seconds if previous is None else \
+                previous + self.smoothing * (seconds - previous)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                group: {
+                    "target_ms": self.targets_ms.get(group) or None,
+                    "tiers": {
+                        tier: {
+                            "served": self._served.get((group, tier), 0),
+                            "service_ms": round(1000.0 * self._seconds[(group, tier)], 1)
+                            if (group, tier) in self._seconds else None,
+                        }
+                        for tier in tiers
+                    },
+                }
+                for group, tiers in self.tiers.items()
+            }
+
+    def _rounds(self, group: str) -> int:
+        # Full rounds of the pool's concurrency already running or queued
+        pool = self.executor.pools[group].stats()
+        return pool["pending"] // pool["concurrency"]
@@ -0,0 +1,125 @@
+import asyncio
+import copy
+import hashlib
+import json
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from app.executor import ClientDisconnected
+from app.result_cache import normalize_text
+
+# How request texts are normalized before they are compared
+NORMALIZERS: Dict[str, Callable[[str], str]] = {
+    "exact": lambda text: text,
+    "whitespace": normalize_text,
+    "casefold": lambda text: normalize_text(text).casefold(),
+}
+
+
+class _Flight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class RequestCoalescer:
+    """Single-flight execution of identical concurrent requests.
+
+    The first request for a key starts the computation as a task of its own. Requests
+    with the same key that arrive while it runs wait for that task instead of starting
+    another, and every waiter gets its result, or its exception. Each waiter receives
+    its own copy of the result, so callers are free to mutate it. A waiter that
+    disconnects or is cancelled only stops waiting; the computation is cancelled once
+    no waiter is left.
+    """
+
+    def __init__(self, normalization: str = "whitespace", enabled: bool = True, disconnect_poll_interval: float = 0.25):
+        if normalization not in NORMALIZERS:
+            raise ValueError(f"Unknown key normalization {normalization!r}; expected one of {', '.join(NORMALIZERS)}")
+        self.normalization = normalization
+        self.normalize = NORMALIZERS[normalization]
+        self.enabled = enabled
+        self.disconnect_poll_interval = disconnect_poll_interval
+        self._flights: Dict[str, _Flight] = {}
+
+        # Metrics per namespace
+        self._counts: Dict[str, Dict[str, int]] = {}
+
+    def key(self, namespace: str, text: str, params: Dict) -> str:
+        payload = json.dumps([namespace, self.normalize(text), params], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    async def run(
+        self,
+        namespace: str,
+        text: str,
+        params: Dict,
+        compute: Callable[[], Awaitable[Any]],
+        is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None
+    ) -> Any:
+        """Await compute() for this text and params, sharing it with identical requests in flight.
+
+        Raises ClientDisconnected when is_disconnected reports that this caller has gone away.
+        """
+        if not self.enabled:
+            # Every request runs alone, but still stops when its client goes away
+            task = asyncio.ensure_future(compute())
+            try:
+                return await self._wait(task, is_disconnected)
+            finally:
+                if not task.done():
+                    task.cancel()
+
+        key = self.key(namespace, text, params)
+        counts = self._counts.setdefault(namespace, {"runs": 0, "coalesced": 0, "errors": 0, "cancelled": 0})
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._flights[key] = _Flight(asyncio.ensure_future(compute()))
+            flight.task.add_done_callback(lambda task: self._finish(namespace, key, flight))
+            counts["runs"] += 1
+        else:
+            # One model run saved
+            counts["coalesced"] += 1
+
+        flight.waiters += 1
+        try:
+            return copy.deepcopy(await self._wait(flight.task, is_disconnected))
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                flight.task.cancel()
+
+    def stats(self) -> Dict:
+        return {
+            "enabled": int(self.enabled),
+            "in_flight": len(self._flights),
+            **{namespace: dict(counts) for namespace, counts in self._counts.items()},
+        }
+
+    async def _wait(self, task: asyncio.Task, is_disconnected: Optional[Callable[[], Awaitable[bool]]]) -> Any:
+        # Neither shield nor wait cancels the shared task when this waiter is cancelled
+        if is_disconnected is None:
+            return await asyncio.shield(task)
+        watcher = asyncio.ensure_future(self._watch_disconnect(is_disconnected))
+        try:
+            done, _ = await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+            if task in done:
+                return task.result()
+            raise ClientDisconnected("client disconnected before the result was ready")
+        finally:
+            watcher.cancel()
+
+    async def _watch_disconnect(self, is_disconnected: Callable[[], Awaitable[bool]]):
+        while not await is_disconnected():
+            await asyncio.sleep(self.disconnect_poll_interval)
+
+    def _finish(self, namespace: str, key: str, flight: _Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        counts = self._counts[namespace]
+        if flight.task.cancelled():
+            counts["cancelled"] += 1
+        elif flight.task.exception() is not None:
+            # Retrieved here too, so a failure nobody waited for is not logged as unhandled
+            counts["errors"] += 1
@@ -0,0 +1,215 @@
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional
+
+
+def _discard_result(future: asyncio.Future):
+    """Retrieve an abandoned result so asyncio does not log it as unhandled."""
+    if not future.cancelled():
+        future.exception()
+
+
+class InferenceError(Exception):
+    """Base class for errors raised by the inference executor."""
+
+
+class ExecutorOverloaded(InferenceError):
+    """The pool's queue is full and the request was shed."""
+
+
+class InferenceTimeout(InferenceError):
+    """The request did not finish within its timeout."""
+
+
+class ClientDisconnected(InferenceError):
+    """The client went away before the result was ready."""
+
+
+class ModelPool:
+    """A fixed number of worker threads for one model plus a bounded wait queue."""
+
+    def __init__(self, name: str, concurrency: int = 1, max_queue: int = 16, timeout: Optional[float] = None):
+        self.name = name
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=f"infer-{name}")
+        self._lock = threading.Lock()
+        self._futures = set()  # submitted and not done, cancelled on shutdown
+
+        # Metrics
+        self._pending = 0
+        self._completed = 0
+        self._rejected = 0
+        self._timed_out = 0
+        self._cancelled = 0
+
+    def submit(self, fn: Callable, *args, **kwargs):
+        """Schedule fn on the pool, shedding load when running plus queued work is at capacity."""
+        with self._lock:
+            if self._pending >= self.concurrency + self.max_queue:
+                self._rejected += 1
+                raise ExecutorOverloaded(f"{self.name} queue is full")
+            self._pending += 1
+
+        # Carry context variables (e.g. per-request state) into the worker thread
+        context = contextvars.copy_context()
+        future = self._executor.submit(context.run, fn, *args, **kwargs)
+        with self._lock:
+            self._futures.add(future)
+        future.add_done_callback(self._on_done)
+        return future
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "concurrency": self.concurrency,
+                "max_queue": self.max_queue,
+                "pending": self._pending,
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "timed_out": self._timed_out,
+                "cancelled": self._cancelled,
+            }
+
+    def shutdown(self):
+        # Queued calls are cancelled; shutdown(cancel_futures=True) would need Python 3.9
+        with self._lock:
+            futures = list(self._futures)
+        for future in futures:
+            future.cancel()
+        self._executor.shutdown(wait=False)
+
+    def _on_done(self, future):
+        with self._lock:
+            self._futures.discard(future)
+            self._pending -= 1
+            if future.cancelled():
+                self._cancelled += 1
+            else:
+                self._completed += 1
+
+    def _record_timeout(self):
+        with self._lock:
+            self._timed_out += 1
+
+
+class InferenceExecutor:
+    """Runs blocking model calls on per-model thread pools without blocking the event loop."""
+
+    def __init__(self, disconnect_poll_interval: float = 0.25):
+        self.pools: Dict[str, ModelPool] = {}
+        self.disconnect_poll_interval = disconnect_poll_interval
+
+    def add_pool(self, name: str, concurrency: int = 1, max_queue: int = 16, timeout: Optional[float] = None) -> ModelPool:
+        pool = ModelPool(name, concurrency=concurrency, max_queue=max_queue, timeout=timeout)
+        self.pools[name] = pool
+        return pool
+
+    async def run(
+        self,
+        pool_name: str,
+        fn: Callable,
+        *args,
+        timeout: Optional[float] = None,
+        is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None,
+        **kwargs
+    ) -> Any:
+        """Run fn on the named pool and await its result.
+
+        Raises ExecutorOverloaded when the pool is full, InferenceTimeout when the
+        timeout expires and ClientDisconnected when is_disconnected reports that the
+        caller has gone away. Work that has not started yet is dropped; work that is
+        already running finishes in the background and its result is discarded.
+        """
+        pool = self.pools[pool_name]
+        timeout = timeout if timeout is not None else pool.timeout
+        future = pool.submit(fn, *args, **kwargs)
+        result = asyncio.wrap_future(future)
+
+        watcher = None
+        if is_disconnected is not None:
+            watcher = asyncio.ensure_future(self._watch_disconnect(is_disconnected))
+
+        try:
+            waiters = {result} if watcher is None else {result, watcher}
+            done, _ = await asyncio.wait(waiters, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+            if result in done:
+                return result.result()
+
+            future.cancel()
+            result.add_done_callback(_discard_result)
+            if watcher is not None and watcher in done:
+                raise ClientDisconnected(f"client disconnected while waiting on {pool_name}")
+            pool._record_timeout()
+            raise InferenceTimeout(f"{pool_name} did not respond within {timeout}s")
+        except asyncio.CancelledError:
+            future.cancel()
+            result.add_done_callback(_discard_result)
+            raise
+        finally:
+            if watcher is not None:
+                watcher.cancel()
+
+    async def stream(self, pool_name: str, fn: Callable, *args, timeout: Optional[float] = None, **kwargs) -> AsyncIterator:
+        """Iterate a blocking generator on the named pool, yielding its items as they arrive.
+
+        The timeout applies to the wait for each item. When the consumer stops early
+        (e.g. the client disconnects) the generator is closed on its worker thread.
+        """
+        pool = self.pools[pool_name]
+        timeout = timeout if timeout is not None else pool.timeout
+        loop = asyncio.get_running_loop()
+        items = asyncio.Queue()
+        stop = threading.Event()
+        end = object()
+
+        def emit(item, error=None):
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(items.put_nowait, (item, error))
+
+        def pump():
+            iterator = fn(*args, **kwargs)
+            try:
+                for item in iterator:
+                    if stop.is_set():
+                        break
+                    emit(item)
+            except Exception as e:
+                emit(end, e)
+                return
+            finally:
+                if hasattr(iterator, "close"):
+                    iterator.close()
+            emit(end)
+
+        future = pool.submit(pump)
+        try:
+            while True:
+                try:
+                    item, error = await asyncio.wait_for(items.get(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pool._record_timeout()
+                    raise InferenceTimeout(f"{pool_name} produced nothing for {timeout}s")
+                if error is not None:
+                    raise error
+                if item is end:
+                    return
+                yield item
+        finally:
+            stop.set()
+            future.cancel()
+
+    def stats(self) -> Dict:
+        return {name: pool.stats() for name, pool in self.pools.items()}
+
+    def shutdown(self):
+        for pool in self.pools.values():
+            pool.shutdown()
+
+    async def _watch_disconnect(self, is_disconnected: Callable[[], Awaitable[bool]]):
+        while not await is_disconnected():
+            await asyncio.sleep(self.disconnect_poll_interval)
@@ -0,0 +1,159 @@
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from models.difficulty_adjuster import DifficultyAdjuster
+
+logger = logging.getLogger(__name__)
+
+
+class FeedbackOverloaded(Exception):
+    """Too many feedback events are waiting to be flushed."""
+
+
+class FeedbackAggregator:
+    """Queue feedback events in memory and flush aggregated counts in the background.
+
+    Events from all requests are collapsed into per-question (successes, failures)
+    counts and written on an interval or once enough events have accumulated, so a
+    class finishing a quiz costs a handful of transactions instead of one per answer.
+    A flush that keeps failing is retried up to max_flush_attempts times, after which
+    its events are dropped and counted.
+    """
+
+    def __init__(
+        self,
+        difficulty_adjuster: DifficultyAdjuster,
+        max_pending: int = 100000,
+        flush_interval_ms: float = 1000.0,
+        flush_threshold: int = 5000,
+        max_flush_attempts: int = 3
+    ):
+        self.difficulty_adjuster = difficulty_adjuster
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.flush_threshold = flush_threshold
+        self.max_flush_attempts = max_flush_attempts
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        self._pending = 0
+
+        # Metrics
+        self.events_received = 0
+        self.events_flushed = 0
+        self.flushes = 0
+        self.flush_failures = 0
+        self.rejected = 0
+        self.dropped = 0
+
+    def submit(self, events: List[Tuple[str, bool, Optional[str]]]):
+        """Queue (question_id, correct, student_id) events; raises FeedbackOverloaded when full."""
+        if self._queue is None:
+            raise RuntimeError("feedback aggregator is not running")
+        if self._pending + len(events) > self.max_pending:
+            self.rejected += len(events)
+            raise FeedbackOverloaded(f"{self._pending} feedback events are already waiting")
+
+        timestamp = datetime.now().isoformat()
+        self._queue.put_nowait([(qid, correct, student_id, timestamp) for qid, correct, student_id in events])
+        self._pending += len(events)
+        self.events_received += len(events)
+
+    def start(self):
+        """Start the background flush task on the running event loop."""
+        if self._task is None:
+            self._closing = False
+            self._queue = asyncio.Queue()
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        """Flush everything still queued and stop the background task."""
+        if self._task is None:
+            return
+        # Wake the task; it flushes what it holds, drains the queue and exits
+        self._closing = True
+        self._queue.put_nowait([])
+        await self._task
+        self._task = None
+
+    def stats(self) -> Dict:
+        return {
+            "pending": self._pending,
+            "received": self.events_received,
+            "flushed": self.events_flushed,
+            "flushes": self.flushes,
+            "flush_failures": self.flush_failures,
+            "rejected": self.rejected,
+            "dropped": self.dropped,
+        }
+
+    async def _run(self):
+        events = []
+        failed_attempts = 0
+        while not self._closing:
+            deadline = time.monotonic() + self.flush_interval
+            while len(events) < self.flush_threshold and not self._closing:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    events.extend(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            if events:
+                try:
+                    await self._flush(events)
+                    events = []
+                    failed_attempts = 0
+                except Exception:
+                    failed_attempts += 1
+                    self.flush_failures += 1
+                    if failed_attempts < self.max_flush_attempts:
+                        # Keep the events and retry on the next interval
+                        logger.warning("Feedback flush failed, will retry", exc_info=True)
+                    else:
+                        logger.exception("Feedback flush failed %d times, dropping %d events",
+                                         failed_attempts, len(events))
+                        self._drop(events)
+                        events = []
+                        failed_attempts = 0
+
+        # Final flush on shutdown
+        while not self._queue.empty():
+            events.extend(self._queue.get_nowait())
+        try:
+            await self._flush(events)
+        except Exception:
+            logger.exception("Final feedback flush failed, dropping %d events", len(events))
+            self._drop(events)
+
+    async def _flush(self, events: List[tuple]):
+        """Write the aggregated counts and the student attempts, then wait for the commit."""
+        if not events:
+            return
+
+        counts: Dict[str, List[int]] = {}
+        attempts = []
+        for qid, correct, student_id, timestamp in events:
+            count = counts.setdefault(qid, [0, 0])
+            count[0 if correct else 1] += 1
+            if student_id is not None:
+                attempts.append((student_id, qid, correct, timestamp))
+
+        # One write, so a failure never leaves the counts committed without the attempts
+        await asyncio.wrap_future(
+            self.difficulty_adjuster.update_counts({qid: tuple(c) for qid, c in counts.items()}, attempts)
+        )
+
+        self._pending -= len(events)
+        self.events_flushed += len(events)
+        self.flushes += 1
+
+    def _drop(self, events: List[tuple]):
+        self._pending -= len(events)
+        self.dropped += len(events)
@@ -0,0 +1,289 @@
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import re
+import shutil
+import uuid
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Iterable, Iterator, List, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from app.executor import InferenceError
+
+logger = logging.getLogger(__name__)
+
+
+class JobNotFound(Exception):
+    """No job with the given id exists."""
+
+
+class JobManager:
+    """Background jobs that summarize and generate questions for many documents.
+
+    Each job lives in its own directory: the documents (input.jsonl), the results written
+    so far (output.jsonl) and a checkpoint (state.json). Documents are processed in
+    batches; after each batch the new output lines are synced and the checkpoint records
+    how many documents and output bytes are done, so an interrupted job resumes after its
+    last complete batch when the server starts again. The running job holds a file lock,
+    so several API processes can share the directory without running a job twice.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        process_batch: Callable[[List[Dict], Dict], Awaitable[List[Dict]]],
+        batch_size: int = 8,
+        retry_delay_s: float = 5.0,
+        max_retries: int = 60
+    ):
+        self.directory = directory
+        self.process_batch = process_batch
+        self.batch_size = batch_size
+        self.retry_delay_s = retry_delay_s
+        self.max_retries = max_retries
+        os.makedirs(directory, exist_ok=True)
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self._running: Optional[str] = None
+
+        # Metrics
+        self._created = 0
+        self._completed = 0
+        self._failed = 0
+        self._documents = 0
+
+    def create(self, documents: Iterable[Dict], options: Dict) -> Dict:
+        """Store the documents of a new job and queue it; raises ValueError for an invalid document.
+
+        Each document needs a non-empty "text"; its "id" defaults to its position. Writing
+        the documents blocks, so the API calls this from a worker thread.
+        """
+        job_id = uuid.uuid4().hex
+        job_dir = self._job_dir(job_id)
+        os.makedirs(job_dir)
+        total = 0
+        try:
+            with open(os.path.join(job_dir, "input.jsonl"), "w") as f:
+                for index, document in enumerate(documents):
+                    if not isinstance(document, dict) or not isinstance(document.get("text"), str) \
+                            or not document["text"].strip():
+                        raise ValueError(f"document {index} has no text")
+                    f.write(json.dumps({"id": str(document.get("id", index)), "text": document["text"]}) + "\n")
+                    total += 1
+            if total == 0:
+                raise ValueError("the job has no documents")
+        except Exception:
+            shutil.rmtree(job_dir, ignore_errors=True)
+            raise
+
+        now = datetime.now().isoformat()
+        state = {
+            "job_id": job_id,
+            "status": "queued",
+            "options": options,
+            "total": total,
+            "processed": 0,
+            "failed": 0,
+            "output_bytes": 0,
+            "created_at": now,
+            "started_at": None,
+            "updated_at": now,
+            "finished_at": None,
+            "error": None,
+        }
+        self._write_state(state)
+        self._created += 1
+        if self._queue is not None:
+            # asyncio queues are not thread-safe
+            self._loop.call_soon_threadsafe(self._queue.put_nowait, job_id)
+        return state
+
+    def status(self, job_id: str) -> Dict:
+        state = self._read_state(job_id)
+        progress = state["processed"] / state["total"] if state["total"] else 1.0
+        return {**{k: v for k, v in state.items() if k != "output_bytes"}, "progress": round(progress, 4)}
+
+    def results(self, job_id: str, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+        """Yield the output lines checkpointed so far, as raw JSONL."""
+        remaining = self._read_state(job_id)["output_bytes"]
+        path = os.path.join(self._job_dir(job_id), "output.jsonl")
+        if remaining == 0 or not os.path.exists(path):
+            return
+        with open(path, "rb") as f:
+            while remaining > 0:
+                chunk = f.read(min(chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+    def start(self):
+        """Start the job runner on the running event loop and queue unfinished jobs, oldest first."""
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        unfinished = []
+        for job_id in os.listdir(self.directory):
+            try:
+                state = self._read_state(job_id)
+            except (JobNotFound, ValueError):
+                continue
+            if state["status"] in ("queued", "running"):
+                unfinished.append((state["created_at"], job_id))
+        for _, job_id in sorted(unfinished):
+            self._queue.put_nowait(job_id)
+        self._task = self._loop.create_task(self._run())
+
+    async def stop(self):
+        # The batch in progress is not checkpointed; it is redone when the job resumes
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def stats(self) -> Dict:
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "running": 1 if self._running is not None else 0,
+            "created": self._created,
+            "completed": self._completed,
+            "failed": self._failed,
+            "documents": self._documents,
+        }
+
+    async def _run(self):
+        while True:
+            job_id = await self._queue.get()
+            lock = self._claim(job_id)
+            if lock is None:
+                # Another process is running it
+                continue
+            self._running = job_id
+            try:
+                await self._run_job(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                state = await run_in_threadpool(self._read_state, job_id)
+                state.update(status="failed", error=str(e), finished_at=datetime.now().isoformat())
+                await run_in_threadpool(self._write_state, state)
+                self._failed += 1
+                logger.exception("Job %s failed", job_id)
+            finally:
+                self._running = None
+                lock.close()
+
+    async def _run_job(self, job_id: str):
+        # Writes and fsyncs block, so they run on worker threads rather than the event loop
+        state = await run_in_threadpool(self._read_state, job_id)
+        if state["status"] not in ("queued", "running"):
+            return
+        state["status"] = "running"
+        state["started_at"] = state["started_at"] or datetime.now().isoformat()
+        await run_in_threadpool(self._write_state, state)
+
+        job_dir = self._job_dir(job_id)
+        out = await run_in_threadpool(self._open_output, job_dir, state["output_bytes"])
+        try:
+            for batch in self._batches(job_dir, state["processed"]):
+                results = await self._process_with_retries(batch, state["options"])
+                checkpoint = asyncio.ensure_future(run_in_threadpool(self._checkpoint, out, state, batch, results))
+                try:
+                    await asyncio.shield(checkpoint)
+                except asyncio.CancelledError:
+                    # Finish the checkpoint before the file and the job's lock are released
+                    await checkpoint
+                    raise
+                self._documents += len(batch)
+        finally:
+            out.close()
+
+        state.update(status="completed", finished_at=datetime.now().isoformat())
+        await run_in_threadpool(self._write_state, state)
+        self._completed += 1
+
+    def _open_output(self, job_dir: str, output_bytes: int):
+        path = os.path.join(job_dir, "output.jsonl")
+        out = open(path, "r+b" if os.path.exists(path) else "wb")
+        # Drop anything written after the last checkpoint
+        out.truncate(output_bytes)
+        out.seek(output_bytes)
+        return out
+
+    def _checkpoint(self, out, state: Dict, batch: List[Dict], results: List[Dict]):
+        """Append the results of a batch, sync them and record them in the job's state."""
+        out.write(b"".join((json.dumps(result) + "\n").encode() for result in results))
+        out.flush()
+        os.fsync(out.fileno())
+
+        state["processed"] += len(batch)
+        state["failed"] += sum(1 for result in results if result.get("error"))
+        state["output_bytes"] = out.tell()
+        self._write_state(state)
+
+    async def _process_with_retries(self, batch: List[Dict], options: Dict) -> List[Dict]:
+        # Overload, timeouts and models that are still loading are waited out; other
+        # errors are reported per document by process_batch
+        for attempt in range(self.max_retries):
+            try:
+                return await self.process_batch(batch, options)
+            except InferenceError as e:
+                if attempt == self.max_retries - 1:
+                    raise
+                logger.warning("Job batch postponed (%s); retrying in %ss", e, self.retry_delay_s)
+                await asyncio.sleep(self.retry_delay_s)
+
+    def _batches(self, job_dir: str, skip: int) -> Iterator[List[Dict]]:
+        batch = []
+        with open(os.path.join(job_dir, "input.jsonl")) as f:
+            for index, line in enumerate(f):
+                if index < skip:
+                    continue
+                batch.append(json.loads(line))
+                if len(batch) == self.batch_size:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+
+    def _claim(self, job_id: str):
+        """Return the job's lock file held exclusively, or None if another process holds it."""
+        lock = open(os.path.join(self._job_dir(job_id), "lock"), "w")
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock.close()
+            return None
+        return lock
+
+    def _job_dir(self, job_id: str) -> str:
+        if not re.fullmatch(r"[0-9a-f]{32}", job_id):
+            raise JobNotFound(job_id)
+        return os.path.join(self.directory, job_id)
+
+    def _read_state(self, job_id: str) -> Dict:
+        try:
+            with open(os.path.join(self._job_dir(job_id), "state.json")) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise JobNotFound(job_id)
+
+    def _write_state(self, state: Dict):
+        # Written to a temporary file and renamed, so readers never see a partial checkpoint
+        state["updated_at"] = datetime.now().isoformat()
+        path = os.path.join(self._job_dir(state["job_id"]), "state.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
@@ -1,14 +1,36 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, File, Form, HTTPException, Request, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional
+from starlette.concurrency import run_in_threadpool
+from typing import AsyncIterator, Dict, List, Optional
+import asyncio
+import json
+import os
 import uvicorn
 
-from models.summarizer import TextSummarizer
-from models.question_generator import QuestionGenerator
-from models.distractor_generator import DistractorGenerator
-from models.quality_ranker import QualityRanker
-from models.difficulty_adjuster import DifficultyAdjuster
+from models.registry import registry
+from models.backends import inference_backend
+from models.instrumentation import instrumentation, stats_gauges
+from app.executor import InferenceExecutor, InferenceError, ExecutorOverloaded, InferenceTimeout
+from app.result_cache import ResultCache, make_key, normalize_text
+from app.feedback_pipeline import FeedbackAggregator, FeedbackOverloaded
+from app.startup import ComponentNotReady, StartupManager
+from app.model_workers import ModelWorkers, WorkerCrashed
+from app.jobs import JobManager, JobNotFound
+from app.budget import LatencyBudget
+from app.coalescing import RequestCoalescer
+from app.pipeline import (
+    summarizer,
+    question_generator,
+    difficulty_adjuster,
+    question_bank,
+    use_question_bank,
+    run_operation,
+    operation_group,
+    add_startup_group,
+    component_stats,
+)
 
 app = FastAPI(title="AI Study Assistant API")
 
@@ -21,16 +43,223 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize models
-summarizer = TextSummarizer()
-question_generator = QuestionGenerator()
-distractor_generator = DistractorGenerator()
-quality_ranker = QualityRanker()
-difficulty_adjuster = DifficultyAdjuster()
+# Stage timings and counters for /metrics; a disabled span costs one attribute check
+instrumentation.enabled = os.getenv("METRICS_ENABLED", "1") == "1"
+SERVER_TIMING = instrumentation.enabled and os.getenv("SERVER_TIMING", "0") == "1"
+
+# Load every model at import time so a pre-forking server (e.g. gunicorn --preload)
+# shares the weights copy-on-write across its workers
+if os.getenv("PRELOAD_MODELS", "0") == "1":
+    summarizer.ensure_nltk_data()
+    registry.prepare_for_fork()
+
+# Groups with SUMMARIZER_PROCESSES / QUESTION_PROCESSES > 0 run in model worker processes
+# instead of this one; the API process then holds none of their weights
+model_workers = ModelWorkers(
+    warmup=os.getenv("STARTUP_WARMUP", "1") == "1",
+    torch_threads=int(os.getenv("MODEL_WORKER_TORCH_THREADS", "0")) or None
+)
+GROUP_PROCESSES = {
+    "summarizer": int(os.getenv("SUMMARIZER_PROCESSES", "0")),
+    "questions": int(os.getenv("QUESTION_PROCESSES", "0")),
+}
+GROUP_CONCURRENCY = {
+    "summarizer": int(os.getenv("SUMMARIZER_WORKERS", "1")),
+    "questions": int(os.getenv("QUESTION_WORKERS", "4")),
+}
+GROUP_TIMEOUT = {
+    "summarizer": float(os.getenv("SUMMARIZER_TIMEOUT", "120")),
+    "questions": float(os.getenv("QUESTION_TIMEOUT", "120")),
+}
+
+# Models of the groups served here are loaded in the background after the server starts;
+# MODEL_STARTUP=lazy loads every model on its first request instead
+startup = StartupManager(
+    registry,
+    max_workers=int(os.getenv("STARTUP_LOAD_WORKERS", "4")),
+    warmup=os.getenv("STARTUP_WARMUP", "1") == "1"
+)
+for group, processes in GROUP_PROCESSES.items():
+    if processes > 0:
+        model_workers.add_group(group, processes=processes, concurrency=GROUP_CONCURRENCY[group],
+                                timeout=GROUP_TIMEOUT[group])
+    else:
+        add_startup_group(startup, group)
+LOCAL_GROUPS = [group for group in GROUP_PROCESSES if not model_workers.has_group(group)]
+
+# Blocking model calls run on per-model worker pools so the event loop stays responsive
+executor = InferenceExecutor()
+# With model workers, a pool's concurrency is the number of requests in flight across its processes
+executor.add_pool(
+    "summarizer",
+    concurrency=GROUP_CONCURRENCY["summarizer"] * max(1, GROUP_PROCESSES["summarizer"]),
+    max_queue=int(os.getenv("SUMMARIZER_QUEUE_SIZE", "16")),
+    timeout=GROUP_TIMEOUT["summarizer"]
+)
+executor.add_pool(
+    "questions",
+    concurrency=GROUP_CONCURRENCY["questions"] * max(1, GROUP_PROCESSES["questions"]),
+    max_queue=int(os.getenv("QUESTION_QUEUE_SIZE", "32")),
+    timeout=GROUP_TIMEOUT["questions"]
+)
+FEEDBACK_TIMEOUT = float(os.getenv("FEEDBACK_TIMEOUT", "10"))
+
+# With a latency target (global or per request), requests are served at a cheaper quality
+# tier when the queue ahead of them would make the full settings miss it
+budget = LatencyBudget(
+    executor,
+    tiers={"summarizer": list(summarizer.quality_tiers), "questions": list(question_generator.quality_tiers)},
+    targets_ms={
+        "summarizer": float(os.getenv("SUMMARIZER_LATENCY_TARGET_MS", "0")),
+        "questions": float(os.getenv("QUESTION_LATENCY_TARGET_MS", "0")),
+    }
+)
+
+# Bulk feedback is aggregated in memory and written in the background
+feedback_aggregator = FeedbackAggregator(
+    difficulty_adjuster,
+    max_pending=int(os.getenv("FEEDBACK_MAX_PENDING", "100000")),
+    flush_interval_ms=float(os.getenv("FEEDBACK_FLUSH_INTERVAL_MS", "1000")),
+    flush_threshold=int(os.getenv("FEEDBACK_FLUSH_THRESHOLD", "5000")),
+    max_flush_attempts=int(os.getenv("FEEDBACK_MAX_FLUSH_ATTEMPTS", "3"))
+)
+
+# Bulk jobs: documents are processed in batches of JOB_BATCH_SIZE, checkpointed after each batch
+jobs = JobManager(
+    directory=os.getenv("JOBS_DIR", "models/jobs"),
+    process_batch=lambda documents, options: process_job_batch(documents, options),
+    batch_size=int(os.getenv("JOB_BATCH_SIZE", "8"))
+)
+
+# Results keyed by normalized text, model and generation parameters
+result_cache = ResultCache(
+    max_bytes=int(os.getenv("RESULT_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+    ttl_seconds=float(os.getenv("RESULT_CACHE_TTL_SECONDS", str(24 * 3600))),
+    disk_dir=os.getenv("RESULT_CACHE_DIR") or None,
+    max_disk_bytes=int(os.getenv("RESULT_CACHE_MAX_DISK_BYTES", str(1024 * 1024 * 1024)))
+)
+# Derive a seed from the input when the request has none, so sampled question sets are reproducible
+CACHE_DETERMINISTIC = os.getenv("RESULT_CACHE_DETERMINISTIC", "0") == "1"
+
+# Identical requests in flight at the same time share one model run; texts are compared
+# after COALESCE_KEY_NORMALIZATION (exact, whitespace or casefold)
+coalescer = RequestCoalescer(
+    normalization=os.getenv("COALESCE_KEY_NORMALIZATION", "whitespace"),
+    enabled=os.getenv("COALESCE_REQUESTS", "1") == "1",
+    disconnect_poll_interval=executor.disconnect_poll_interval
+)
+
+# Batch sizes, queue depths and cache hit rates are read from the components on every scrape
+# Components of the groups served here report their stats directly, those in model workers
+# over the workers' sockets, labelled with the worker
+instrumentation.add_collector(lambda: (
+    gauge for name, stats in component_stats(LOCAL_GROUPS).items() for gauge in stats_gauges(name, stats)
+))
+instrumentation.add_collector(lambda: (
+    gauge
+    for group, workers in model_workers.stats(components=True).items()
+    for i, w in enumerate(workers) if w["components"]
+    for name, stats in w["components"].items()
+    for gauge in stats_gauges(name, stats, {"group": group, "worker": str(i)})
+))
+instrumentation.add_collector(lambda: stats_gauges("executor", executor.stats()))
+instrumentation.add_collector(lambda: stats_gauges("result_cache", result_cache.stats()))
+instrumentation.add_collector(lambda: stats_gauges("difficulty_store", difficulty_adjuster.store.stats()))
+instrumentation.add_collector(lambda: stats_gauges("student_history", difficulty_adjuster.history.stats()))
+instrumentation.add_collector(lambda: stats_gauges("feedback_aggregator", feedback_aggregator.stats()))
+instrumentation.add_collector(lambda: (
+    ("model_workers_in_flight", {"group": group, "worker": str(i)}, w["in_flight"])
+    for group, workers in model_workers.stats().items() for i, w in enumerate(workers)
+))
+instrumentation.add_collector(lambda: stats_gauges("jobs", jobs.stats()))
+instrumentation.add_collector(lambda: stats_gauges("budget", budget.stats()))
+instrumentation.add_collector(lambda: stats_gauges("coalescing", coalescer.stats()))
+
+if SERVER_TIMING:
+    @app.middleware("http")
+    async def server_timing(request: Request, call_next):
+        # Spans from executor threads are collected too: they run in a copy of this context
+        token = instrumentation.start_request()
+        try:
+            response = await call_next(request)
+        finally:
+            timing = instrumentation.finish_request(token)
+        if timing:
+            response.headers["Server-Timing"] = timing
+        return response
+
+@app.exception_handler(InferenceError)
+async def inference_error_handler(request: Request, exc: InferenceError):
+    if isinstance(exc, ComponentNotReady):
+        return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "5"})
+    if isinstance(exc, (ExecutorOverloaded, WorkerCrashed)):
+        return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "1"})
+    if isinstance(exc, InferenceTimeout):
+        return JSONResponse(status_code=504, content={"detail": str(exc)})
+    # ClientDisconnected: nobody is listening, 499 only shows up in access logs
+    return JSONResponse(status_code=499, content={"detail": str(exc)})
+
+@app.on_event("startup")
+def start_model_eviction():
+    # Started per worker process, after any fork
+    idle_seconds = float(os.getenv("MODEL_IDLE_EVICTION_SECONDS", "0"))
+    if idle_seconds > 0:
+        registry.start_idle_eviction(idle_seconds)
+
+@app.on_event("startup")
+def start_feedback_aggregator():
+    feedback_aggregator.start()
+
+@app.on_event("startup")
+def start_jobs():
+    # Unfinished jobs resume from their last checkpoint
+    jobs.start()
+
+@app.on_event("startup")
+def start_model_loading():
+    # Worker processes always load their models up front
+    model_workers.start()
+    if os.getenv("MODEL_STARTUP", "background") == "background":
+        startup.start()
+
+@app.on_event("shutdown")
+async def shutdown_executor():
+    # Flush queued feedback before the store's writer is drained
+    await feedback_aggregator.stop()
+    await jobs.stop()
+    executor.shutdown()
+    model_workers.shutdown()
+    difficulty_adjuster.close()
+    if question_bank is not None:
+        question_bank.close()
 
 class TextInput(BaseModel):
     text: str
     difficulty: Optional[str] = "medium"
+    use_cache: Optional[bool] = True  # False skips the cache lookup; the fresh result is still stored
+    seed: Optional[int] = None
+    latency_budget_ms: Optional[float] = None  # served at a cheaper quality tier if needed to meet it
+    student_id: Optional[str] = None  # questions target the difficulty that suits the student's recent accuracy
+
+class FeedbackEvent(BaseModel):
+    question_id: str
+    correct: bool
+    student_id: Optional[str] = None
+
+class FeedbackBatch(BaseModel):
+    events: List[FeedbackEvent]
+
+class JobDocument(BaseModel):
+    id: Optional[str] = None
+    text: str
+
+class JobOptions(BaseModel):
+    summarize: bool = True
+    generate_questions: bool = True
+    difficulty: Optional[str] = "medium"
+
+class JobRequest(JobOptions):
+    documents: List[JobDocument]
 
 class QuestionResponse(BaseModel):
     question: str
@@ -39,44 +268,441 @@ class QuestionResponse(BaseModel):
     difficulty: str
     quality_score: float
 
+def invoke(operation: str, *args, call_timeout: Optional[float] = None, **kwargs):
+    """Run a pipeline operation in this process, or on a model worker if its group has any.
+    
+    call_timeout replaces the group's default wait for a model worker, e.g. for a batch that
+    needs longer; pass the same timeout given to the executor.
+    """
+    group = operation_group(operation)
+    if model_workers.has_group(group):
+        return model_workers.call(group, operation, *args, timeout=call_timeout, **kwargs)
+    return run_operation(operation, *args, **kwargs)
+
+def iterate(operation: str, *args, call_timeout: Optional[float] = None, **kwargs):
+    """Like invoke, for operations that yield their results piece by piece."""
+    group = operation_group(operation)
+    if model_workers.has_group(group):
+        return model_workers.iterate(group, operation, *args, timeout=call_timeout, **kwargs)
+    return run_operation(operation, *args, **kwargs)
+
+def require(group: str):
+    """Raise ComponentNotReady while the models of a group are loading here or in its workers."""
+    (model_workers if model_workers.has_group(group) else startup).require(group)
+
+def readiness() -> Dict:
+    local, workers = startup.status(), model_workers.status()
+    return {
+        "ready": local["ready"] and workers["ready"],
+        "components": {**local["components"], **workers["components"]}
+    }
+
+async def cached_first(keys: List[str]) -> tuple:
+    """result_cache.get_first, on a worker thread when the cache has a disk tier."""
+    if result_cache.disk_dir:
+        return await run_in_threadpool(result_cache.get_first, keys)
+    return result_cache.get_first(keys)
+
+async def cached(key: str):
+    return (await cached_first([key]))[1]
+
+async def cache(key: str, value):
+    """result_cache.set, on a worker thread when the cache has a disk tier."""
+    if result_cache.disk_dir:
+        await run_in_threadpool(result_cache.set, key, value)
+    else:
+        result_cache.set(key, value)
+
+def summary_size(text: str) -> float:
+    # Roughly one generate call per input window of about 4 KB of text
+    return 1.0 + len(text) / 4096
+
+def summary_cache_key(text: str, streaming: bool = False, quality_tier: str = "full") -> str:
+    params = {
+        "max_length": 150,
+        "max_input_tokens": summarizer.max_input_tokens,
+        "chunk_overlap": summarizer.chunk_overlap,
+        "backend": inference_backend(),
+        **summarizer.generation_kwargs,
+        **summarizer.quality_tiers[quality_tier]
+    }
+    if streaming:
+        # The streamed summary is decoded greedily, so it is cached separately
+        params.update(num_beams=1, early_stopping=False)
+    return make_key("summary", text, summarizer.model_name, params)
+
+def question_cache_key(text: str, seed: Optional[int], difficulty: str, quality_tier: str = "full") -> tuple:
+    """Return the cache key and the effective seed for a question request."""
+    params = {
+        "num_questions": 3,
+        "seed": seed,
+        "backend": inference_backend(),
+        **question_generator.generation_kwargs,
+        **question_generator.quality_tiers[quality_tier]
+    }
+    if use_question_bank(seed):
+        # Banked questions are retrieved for the target difficulty
+        params["difficulty"] = difficulty
+    key = make_key("questions", text, question_generator.model_name, params)
+    if seed is None and CACHE_DETERMINISTIC:
+        seed = int(key[:8], 16)
+        params["seed"] = seed
+        key = make_key("questions", text, question_generator.model_name, params)
+    return key, seed
+
+async def process_job_batch(documents: List[dict], options: dict) -> List[dict]:
+    """Summarize and generate questions for a batch of job documents.
+    
+    Summaries of the whole batch share beam-search batches, and the question pipelines
+    run concurrently so their prompts are batched together. Results already in the cache
+    are reused. Errors that only concern one document are reported in its result.
+    """
+    results = [{"id": d["id"]} for d in documents]
+    
+    if options["summarize"]:
+        keys = [summary_cache_key(d["text"]) for d in documents]
+        missing = [i for i, key in enumerate(keys) if await cached(key) is None]
+        summaries = {}
+        if missing:
+            require("summarizer")
+        # At most one generate batch of documents per call, so a job holds a summarizer
+        # worker only as long as an interactive request would and they take turns
+        step = summarizer.chunk_batch_size
+        for start in range(0, len(missing), step):
+            part = missing[start:start + step]
+            texts = [documents[i]["text"] for i in part]
+            timeout = executor.pools["summarizer"].timeout * len(texts)
+            try:
+                # The executor's timeout bounds the wait here, call_timeout the model worker's
+                summaries.update(zip(part, await executor.run(
+                    "summarizer", invoke, "summarize_batch", texts, timeout=timeout, call_timeout=timeout
+                )))
+            except InferenceError:
+                raise
+            except Exception:
+                # Find the documents that fail by summarizing them one at a time
+                for i in part:
+                    try:
+                        summaries[i] = await executor.run("summarizer", invoke, "summarize", documents[i]["text"])
+                    except InferenceError:
+                        raise
+                    except Exception as e:
+                        results[i]["error"] = f"summarize: {e}"
+        for i, key in enumerate(keys):
+            if i in summaries:
+                await cache(key, summaries[i])
+                results[i]["summary"] = summaries[i]
+            elif "error" not in results[i]:
+                results[i]["summary"] = await cached(key)
+    
+    if options["generate_questions"]:
+        async def questions_for(document: dict) -> List[dict]:
+            key, seed = question_cache_key(document["text"], None, options["difficulty"])
+            ranked_questions = await cached(key)
+            if ranked_questions is None:
+                require("questions")
+                ranked_questions = await executor.run(
+                    "questions", invoke, "question_pipeline", normalize_text(document["text"]), seed, options["difficulty"]
+                )
+                await cache(key, ranked_questions)
+            return difficulty_adjuster.adjust(ranked_questions, options["difficulty"])
+        
+        outcomes = await asyncio.gather(*(questions_for(d) for d in documents), return_exceptions=True)
+        for result, outcome in zip(results, outcomes):
+            if isinstance(outcome, InferenceError):
+                raise outcome
+            if isinstance(outcome, Exception):
+                result["error"] = "; ".join(filter(None, [result.get("error"), f"generate_questions: {outcome}"]))
+            else:
+                result["questions"] = outcome
+    
+    return results
+
 @app.post("/summarize")
-async def summarize_text(input_data: TextInput):
+async def summarize_text(input_data: TextInput, request: Request):
     try:
-        summary = summarizer.summarize(input_data.text)
-        return {"summary": summary}
+        size = summary_size(input_data.text)
+        quality_tier = budget.choose("summarizer", input_data.latency_budget_ms, size)
+        if input_data.use_cache:
+            # A cached summary of the chosen tier or a better one is served as is
+            tiers = budget.tiers_from_best("summarizer", quality_tier)
+            position, summary = await cached_first(
+                [summary_cache_key(input_data.text, quality_tier=tier) for tier in tiers]
+            )
+            if summary is not None:
+                budget.record("summarizer", tiers[position])
+                return {"summary": summary, "cached": True, "quality_tier": tiers[position]}
+        
+        require("summarizer")
+        async def compute() -> str:
+            with budget.measure("summarizer", quality_tier, size):
+                summary = await executor.run("summarizer", invoke, "summarize", input_data.text, quality_tier=quality_tier)
+            await cache(summary_cache_key(input_data.text, quality_tier=quality_tier), summary)
+            return summary
+        
+        summary = await coalescer.run(
+            "summary",
+            input_data.text,
+            {"quality_tier": quality_tier},
+            compute,
+            is_disconnected=request.is_disconnected
+        )
+        budget.record("summarizer", quality_tier)
+        return {"summary": summary, "cached": False, "quality_tier": quality_tier}
+    except InferenceError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/generate-questions")
-async def generate_questions(input_data: TextInput):
+async def generate_questions(input_data: TextInput, request: Request):
     try:
-        # Generate initial questions
-        questions = question_generator.generate(input_data.text)
+        difficulty = difficulty_adjuster.personal_difficulty(input_data.difficulty, input_data.student_id)
+        quality_tier = budget.choose("questions", input_data.latency_budget_ms)
+        ranked_questions = None
+        if input_data.use_cache:
+            # A cached question set of the chosen tier or a better one is served as is
+            tiers = budget.tiers_from_best("questions", quality_tier)
+            position, ranked_questions = await cached_first(
+                [question_cache_key(input_data.text, input_data.seed, difficulty, tier)[0] for tier in tiers]
+            )
+            if ranked_questions is not None:
+                quality_tier = tiers[position]
+        cached = ranked_questions is not None
+        if not cached:
+            key, seed = question_cache_key(input_data.text, input_data.seed, difficulty, quality_tier)
+            require("questions")
+            async def compute() -> List[dict]:
+                # Generate from the normalized text so a seeded result matches its cache key exactly
+                with budget.measure("questions", quality_tier):
+                    ranked_questions = await executor.run(
+                        "questions",
+                        invoke,
+                        "question_pipeline",
+                        normalize_text(input_data.text),
+                        seed,
+                        difficulty,
+                        quality_tier=quality_tier,
+                        use_cache=input_data.use_cache
+                    )
+                await cache(key, ranked_questions)
+                return ranked_questions
+            
+            ranked_questions = await coalescer.run(
+                "questions",
+                input_data.text,
+                {"seed": seed, "difficulty": difficulty, "quality_tier": quality_tier, "use_cache": input_data.use_cache},
+                compute,
+                is_disconnected=request.is_disconnected
+            )
+        budget.record("questions", quality_tier)
         
-        # Add distractors
-        questions_with_distractors = []
-        for q in questions:
-            distractors = distractor_generator.generate(q["question"], q["correct_answer"])
-            q["distractors"] = distractors
-            questions_with_distractors.append(q)
-        
-        # Rank questions by quality
-        ranked_questions = quality_ranker.rank(questions_with_distractors)
-        
-        # Adjust difficulty
-        final_questions = difficulty_adjuster.adjust(ranked_questions, input_data.difficulty)
-        
-        return {"questions": final_questions}
+        # Difficulty is adjusted per request so cached questions still follow the latest feedback
+        final_questions = difficulty_adjuster.adjust(ranked_questions, difficulty)
+        return {"questions": final_questions, "cached": cached, "quality_tier": quality_tier, "target_difficulty": difficulty}
+    except InferenceError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def ndjson(event: dict) -> str:
+    return json.dumps(event) + "\n"
+
+@app.post("/summarize/stream")
+async def summarize_text_stream(input_data: TextInput):
+    """Stream the summary as NDJSON "token" events followed by a "done" event."""
+    # Checked before the response starts so a loading server can still answer 503
+    require("summarizer")
+    async def events() -> AsyncIterator[str]:
+        try:
+            # A cached summary (beam search or streamed) is sent in one piece
+            stream_key = summary_cache_key(input_data.text, streaming=True)
+            if input_data.use_cache:
+                for key in (summary_cache_key(input_data.text), stream_key):
+                    summary = await cached(key)
+                    if summary is not None:
+                        yield ndjson({"event": "token", "text": summary})
+                        yield ndjson({"event": "done", "summary": summary, "cached": True})
+                        return
+            
+            pieces = []
+            async for piece in executor.stream("summarizer", iterate, "summarize_stream", input_data.text):
+                pieces.append(piece)
+                yield ndjson({"event": "token", "text": piece})
+            
+            summary = "".join(pieces).strip()
+            await cache(stream_key, summary)
+            yield ndjson({"event": "done", "summary": summary, "cached": False})
+        except Exception as e:
+            # The status line has already been sent, so errors are reported in-band
+            yield ndjson({"event": "error", "detail": str(e)})
+    
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+@app.post("/generate-questions/stream")
+async def generate_questions_stream(input_data: TextInput):
+    """Stream each question as soon as its distractors are ready, then the ranked order.
+    
+    Emits NDJSON "question" events (with the question's generation index) followed by
+    one "ranking" event that lists the indices in quality order.
+    """
+    require("questions")
+    difficulty = difficulty_adjuster.personal_difficulty(input_data.difficulty, input_data.student_id)
+    async def events() -> AsyncIterator[str]:
+        try:
+            key, seed = question_cache_key(input_data.text, input_data.seed, difficulty)
+            ranked_questions = await cached(key) if input_data.use_cache else None
+            
+            if ranked_questions is None:
+                # Banked questions arrive first, then each generated one once its distractors are ready
+                pieces = executor.stream(
+                    "questions",
+                    iterate,
+                    "question_pipeline_stream",
+                    normalize_text(input_data.text),
+                    seed,
+                    difficulty,
+                    use_cache=input_data.use_cache
+                )
+                async for kind, payload in pieces:
+                    if kind == "question":
+                        adjusted = difficulty_adjuster.adjust([dict(payload)], difficulty)[0]
+                        yield ndjson({"event": "question", **adjusted})
+                    else:
+                        ranked_questions = payload
+                await cache(key, [{k: v for k, v in q.items() if k != "index"} for q in ranked_questions])
+                cached = False
+            else:
+                for index, q in enumerate(ranked_questions):
+                    q["index"] = index
+                    adjusted = difficulty_adjuster.adjust([dict(q)], difficulty)[0]
+                    yield ndjson({"event": "question", **adjusted})
+                cached = True
+            
+            yield ndjson({
+                "event": "ranking",
+                "order": [q["index"] for q in ranked_questions],
+                "quality_scores": [q["quality_score"] for q in ranked_questions],
+                "question_ids": [q.get("question_id") for q in ranked_questions],
+                "cached": cached
+            })
+        except Exception as e:
+            # The status line has already been sent, so errors are reported in-band
+            yield ndjson({"event": "error", "detail": str(e)})
+    
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
 @app.post("/feedback")
-async def process_feedback(question_id: str, correct: bool):
+async def process_feedback(question_id: str, correct: bool, student_id: Optional[str] = None):
     try:
-        difficulty_adjuster.update(question_id, correct)
+        # Group-committed by the store's writer thread; wait until it is durable
+        committed = asyncio.wrap_future(difficulty_adjuster.update(question_id, correct))
+        if student_id is not None:
+            difficulty_adjuster.record_student_performance(student_id, question_id, correct)
+        await asyncio.wait_for(asyncio.shield(committed), FEEDBACK_TIMEOUT)
         return {"status": "success"}
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="feedback was not committed in time")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/feedback/batch", status_code=202)
+async def process_feedback_batch(batch: FeedbackBatch):
+    """Accept many feedback events at once; they are committed by the next background flush."""
+    try:
+        feedback_aggregator.submit([(e.question_id, e.correct, e.student_id) for e in batch.events])
+    except FeedbackOverloaded as e:
+        return JSONResponse(status_code=503, content={"detail": str(e)}, headers={"Retry-After": "1"})
+    return {"status": "accepted", "events": len(batch.events)}
+
+@app.post("/jobs", status_code=202)
+async def create_job(job: JobRequest):
+    """Queue a job that summarizes and generates questions for every document."""
+    options = job.model_dump(exclude={"documents"})
+    try:
+        # Writes and syncs the documents, so it runs off the event loop
+        state = await run_in_threadpool(jobs.create, [d.model_dump(exclude_none=True) for d in job.documents], options)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return jobs.status(state["job_id"])
+
+@app.post("/jobs/upload", status_code=202)
+async def upload_job(
+    file: UploadFile = File(...),
+    summarize: bool = Form(True),
+    generate_questions: bool = Form(True),
+    difficulty: Optional[str] = Form("medium")
+):
+    """Queue a job for a JSONL file with one {"id": ..., "text": ...} document per line."""
+    def documents():
+        for number, line in enumerate(file.file, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                raise ValueError(f"line {number} is not valid JSON: {e}")
+    
+    options = JobOptions(summarize=summarize, generate_questions=generate_questions, difficulty=difficulty).model_dump()
+    try:
+        # Parses the upload and writes the documents, so it runs off the event loop
+        state = await run_in_threadpool(jobs.create, documents(), options)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return jobs.status(state["job_id"])
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    try:
+        return jobs.status(job_id)
+    except JobNotFound:
+        raise HTTPException(status_code=404, detail="job not found")
+
+@app.get("/jobs/{job_id}/results")
+async def get_job_results(job_id: str):
+    """The results completed so far, one JSON object per document."""
+    try:
+        jobs.status(job_id)
+    except JobNotFound:
+        raise HTTPException(status_code=404, detail="job not found")
+    return StreamingResponse(jobs.results(job_id), media_type="application/x-ndjson")
+
+@app.get("/health")
+async def health():
+    return {"status": "ok"}
+
+@app.get("/ready")
+async def ready():
+    """Readiness probe: 200 once every model is loaded and warmed up, 503 before."""
+    status = readiness()
+    return JSONResponse(status_code=200 if status["ready"] else 503, content=status)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    # Collecting the stats of model workers waits on their sockets
+    text = await run_in_threadpool(instrumentation.render_prometheus)
+    return PlainTextResponse(text, media_type="text/plain; version=0.0.4")
+
+@app.get("/models")
+async def get_models():
+    return {"backend": inference_backend(), **registry.memory_report()}
+
+@app.get("/stats")
+async def get_stats():
+    # Components running in model workers are reported per worker, under model_workers
+    return {
+        **component_stats(LOCAL_GROUPS),
+        "executor": executor.stats(),
+        "model_workers": await run_in_threadpool(model_workers.stats, True),
+        "result_cache": result_cache.stats(),
+        "difficulty_store": difficulty_adjuster.store.stats(),
+        "difficulty_sampler": difficulty_adjuster.sampler.stats(),
+        "student_history": difficulty_adjuster.history.stats(),
+        "feedback_aggregator": feedback_aggregator.stats(),
+        "jobs": jobs.stats(),
+        "budget": budget.stats(),
+        "coalescing": coalescer.stats()
+    }
+
 if __name__ == "__main__":
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True) 
\ No newline at end of file
+    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=os.getenv("RELOAD", "0") == "1") 
\ No newline at end of file
@@ -0,0 +1,490 @@
+import itertools
+import logging
+import multiprocessing
+import os
+import pickle
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError
+from typing import Dict, Iterator, List, Optional
+
+from app.executor import InferenceError, InferenceTimeout
+from app.startup import ComponentNotReady
+
+logger = logging.getLogger(__name__)
+
+# Worker processes are started fresh rather than forked: the API process runs threads
+_context = multiprocessing.get_context("spawn")
+
+_END = object()
+
+
+class WorkerCrashed(InferenceError):
+    """The model worker handling the request exited before answering."""
+
+
+class _Worker:
+    """The API side of one model worker process."""
+
+    def __init__(self, group: str, index: int):
+        self.group = group
+        self.index = index
+        self.process = None
+        self.conn = None
+        self.state = "starting"
+        self.error: Optional[str] = None
+        self.started_at = time.monotonic()
+        self.ready_seconds: Optional[float] = None
+        self.restarts = 0
+        self.failures = 0  # consecutive exits without becoming ready, for the restart backoff
+        self.completed = 0
+        self.pinging = False  # a liveness check after a timeout is running
+        # Request id -> Future (calls) or Queue (streams)
+        self.pending: Dict[int, object] = {}
+        self.lock = threading.Lock()
+        self.send_lock = threading.Lock()
+
+    def send(self, message):
+        with self.send_lock:
+            self.conn.send(message)
+
+
+class ModelWorkers:
+    """Run model groups in separate worker processes and route operations to them over Unix sockets.
+
+    Each worker process loads only the models of its group, so model memory grows with
+    the number of workers rather than with the number of API processes. Calls go to the
+    ready worker of the group with the fewest requests in flight. A worker that exits is
+    restarted with exponential backoff; requests it was handling fail with WorkerCrashed.
+    A request that outlives its timeout fails with InferenceTimeout on its own; its
+    worker is only terminated and restarted the same way if it also misses a ping.
+    The stats of the components running in a worker (batching, caches) are fetched
+    from it over its socket.
+    """
+
+    def __init__(self, warmup: bool = True, restart_delay_s: float = 1.0, max_restart_delay_s: float = 60.0,
+                 torch_threads: Optional[int] = None, ping_timeout_s: float = 5.0):
+        self.warmup = warmup
+        self.restart_delay_s = restart_delay_s
+        self.max_restart_delay_s = max_restart_delay_s
+        self.torch_threads = torch_threads
+        self.ping_timeout_s = ping_timeout_s
+        self._groups: Dict[str, List[_Worker]] = {}
+        self._concurrency: Dict[str, int] = {}
+        self._timeouts: Dict[str, Optional[float]] = {}
+        self._ids = itertools.count()
+        self._closing = False
+
+    def add_group(self, name: str, processes: int = 1, concurrency: int = 1, timeout: Optional[float] = None):
+        """Serve a model group with processes workers, each running up to concurrency requests at once.
+
+        timeout bounds the wait for a call's result, or for each item of a stream,
+        unless the caller passes its own.
+        """
+        self._groups[name] = [_Worker(name, i) for i in range(processes)]
+        self._concurrency[name] = concurrency
+        self._timeouts[name] = timeout
+
+    def has_group(self, name: str) -> bool:
+        return name in self._groups
+
+    def start(self):
+        if self.torch_threads is None:
+            # Split the cores between the workers instead of letting each use all of them
+            total = sum(len(workers) for workers in self._groups.values())
+            self.torch_threads = max(1, (os.cpu_count() or 1) // max(1, total))
+        for workers in self._groups.values():
+            for worker in workers:
+                self._spawn(worker)
+
+    def call(self, group: str, operation: str, *args, timeout: Optional[float] = None, **kwargs):
+        """Run a pipeline operation on a worker of the group and wait for its result.
+
+        timeout defaults to the group's.
+        """
+        timeout = timeout if timeout is not None else self._timeouts[group]
+        worker = self._pick(group)
+        request_id = next(self._ids)
+        future = Future()
+        self._send(worker, request_id, future, ("call", request_id, operation, args, kwargs))
+        try:
+            return future.result(timeout=timeout)
+        except TimeoutError:
+            self._abandon(worker, request_id)
+            raise InferenceTimeout(f"{group} worker {worker.index} did not answer within {timeout}s")
+
+    def iterate(self, group: str, operation: str, *args, timeout: Optional[float] = None, **kwargs) -> Iterator:
+        """Run a generator operation on a worker of the group, yielding its items as they arrive.
+
+        timeout, the group's by default, bounds the wait for each item. Closing the
+        iterator early stops the generator in the worker.
+        """
+        timeout = timeout if timeout is not None else self._timeouts[group]
+        worker = self._pick(group)
+        request_id = next(self._ids)
+        items = queue.Queue()
+        self._send(worker, request_id, items, ("stream", request_id, operation, args, kwargs))
+        finished = False
+        try:
+            while True:
+                try:
+                    item, error = items.get(timeout=timeout)
+                except queue.Empty:
+                    # Not finished: the worker is told to stop the generator below
+                    self._abandon(worker, request_id)
+                    raise InferenceTimeout(f"{group} worker {worker.index} sent nothing within {timeout}s")
+                if error is not None:
+                    finished = True
+                    raise error
+                if item is _END:
+                    finished = True
+                    return
+                yield item
+        finally:
+            if not finished:
+                with worker.lock:
+                    worker.pending.pop(request_id, None)
+                try:
+                    worker.send(("cancel", request_id))
+                except (OSError, ValueError):
+                    pass
+
+    def require(self, group: str):
+        """Raise ComponentNotReady unless some worker of the group is ready."""
+        self._pick(group)
+
+    def status(self) -> Dict:
+        components = {}
+        for name, workers in self._groups.items():
+            ready = [w for w in workers if w.state == "ready"]
+            errors = [w.error for w in workers if w.error]
+            components[name] = {
+                "state": "ready" if ready else ("failed" if errors and not any(w.state == "starting" for w in workers) else "loading"),
+                "ready_seconds": min((w.ready_seconds for w in ready), default=None),
+                "error": errors[0] if errors else None,
+                "workers_ready": len(ready),
+                "workers": len(workers),
+            }
+        return {"ready": all(c["workers_ready"] > 0 for c in components.values()), "components": components}
+
+    def stats(self, components: bool = False, timeout: float = 1.0) -> Dict:
+        """Per-worker counters and, with components, the stats each ready worker reports for its components.
+
+        Asking the workers blocks for up to timeout; a worker that does not answer in
+        time reports None.
+        """
+        stats = {
+            name: [
+                {
+                    "pid": w.process.pid if w.process is not None else None,
+                    "state": w.state,
+                    "in_flight": len(w.pending),
+                    "completed": w.completed,
+                    "restarts": w.restarts,
+                }
+                for w in workers
+            ]
+            for name, workers in self._groups.items()
+        }
+        if components:
+            # Ask every worker first, so they answer in parallel
+            requests = [
+                (entry, worker, self._request_stats(worker))
+                for name, workers in self._groups.items()
+                for entry, worker in zip(stats[name], workers)
+            ]
+            deadline = time.monotonic() + timeout
+            for entry, worker, (request_id, future) in requests:
+                entry["components"] = None
+                if future is None:
+                    continue
+                try:
+                    entry["components"] = future.result(timeout=max(0.0, deadline - time.monotonic()))
+                except TimeoutError:
+                    with worker.lock:
+                        worker.pending.pop(request_id, None)
+                except WorkerCrashed:
+                    pass
+        return stats
+
+    def shutdown(self, timeout: float = 5.0):
+        """Ask every worker to finish its requests and exit, terminating those that do not in time."""
+        self._closing = True
+        workers = [w for group in self._groups.values() for w in group]
+        for worker in workers:
+            try:
+                worker.send(("shutdown", None))
+            except (AttributeError, OSError, ValueError):
+                pass
+        deadline = time.monotonic() + timeout
+        for worker in workers:
+            if worker.process is not None:
+                worker.process.join(max(0.0, deadline - time.monotonic()))
+                if worker.process.is_alive():
+                    worker.process.terminate()
+
+    def _pick(self, group: str) -> _Worker:
+        ready = [w for w in self._groups[group] if w.state == "ready"]
+        if not ready:
+            raise ComponentNotReady(f"no {group} worker is ready")
+        return min(ready, key=lambda w: len(w.pending))
+
+    def _abandon(self, worker: _Worker, request_id: int):
+        """Give up on a request that timed out and check, in the background, that its worker still answers."""
+        with worker.lock:
+            worker.pending.pop(request_id, None)
+            if worker.pinging or worker.state != "ready":
+                return
+            worker.pinging = True
+        threading.Thread(
+            target=self._check_alive, args=(worker, worker.process), name=f"model-worker-ping-{worker.group}", daemon=True
+        ).start()
+
+    def _check_alive(self, worker: _Worker, process):
+        """Restart the worker if it does not answer a ping, leaving its other requests alone if it does."""
+        try:
+            ping_id = next(self._ids)
+            pong = Future()
+            try:
+                self._send(worker, ping_id, pong, ("ping", ping_id))
+                pong.result(timeout=self.ping_timeout_s)
+                return
+            except WorkerCrashed:
+                # It exited meanwhile; the reader thread restarts it
+                return
+            except TimeoutError:
+                with worker.lock:
+                    worker.pending.pop(ping_id, None)
+            if worker.process is not process or worker.state != "ready":
+                return
+            # No new requests go to it; the reader thread fails what it still has and restarts it
+            worker.state = "restarting"
+            worker.error = f"no answer to a ping within {self.ping_timeout_s}s"
+            logger.warning("%s worker %d stopped answering; restarting it", worker.group, worker.index)
+            # A stuck process may not act on SIGTERM
+            process.kill()
+        finally:
+            worker.pinging = False
+
+    def _request_stats(self, worker: _Worker):
+        """Ask a ready worker for its component stats; returns the request id and a future of the answer."""
+        if worker.state != "ready":
+            return None, None
+        request_id = next(self._ids)
+        future = Future()
+        try:
+            self._send(worker, request_id, future, ("stats", request_id))
+        except WorkerCrashed:
+            return None, None
+        return request_id, future
+
+    def _send(self, worker: _Worker, request_id: int, waiter, message):
+        with worker.lock:
+            worker.pending[request_id] = waiter
+        try:
+            worker.send(message)
+        except (OSError, ValueError) as e:
+            with worker.lock:
+                worker.pending.pop(request_id, None)
+            raise WorkerCrashed(f"{worker.group} worker {worker.index} is gone: {e}")
+
+    def _spawn(self, worker: _Worker):
+        conn, child_conn = _context.Pipe()
+        worker.process = _context.Process(
+            target=_serve,
+            args=(child_conn, worker.group, self._concurrency[worker.group], self.warmup, self.torch_threads),
+            name=f"model-worker-{worker.group}-{worker.index}",
+            daemon=True
+        )
+        worker.state = "starting"
+        worker.started_at = time.monotonic()
+        worker.conn = conn
+        worker.process.start()
+        # Only the worker holds its end, so the socket reports EOF when the worker exits
+        child_conn.close()
+        threading.Thread(
+            target=self._read, args=(worker, conn), name=f"model-worker-{worker.group}-{worker.index}", daemon=True
+        ).start()
+
+    def _read(self, worker: _Worker, conn):
+        """Deliver a worker's replies until it exits, then fail its requests and restart it."""
+        while True:
+            try:
+                message = conn.recv()
+            except (EOFError, OSError):
+                break
+            kind = message[0]
+            if kind == "ready":
+                worker.ready_seconds = round(time.monotonic() - worker.started_at, 3)
+                worker.error = None
+                worker.failures = 0
+                worker.state = "ready"
+            elif kind == "failed":
+                worker.error = message[1]
+                logger.error("%s worker %d failed to load: %s", worker.group, worker.index, message[1])
+            elif kind in ("pong", "stats"):
+                with worker.lock:
+                    future = worker.pending.pop(message[1], None)
+                if future is not None:
+                    future.set_result(message[2] if kind == "stats" else None)
+            elif kind in ("result", "error"):
+                with worker.lock:
+                    future = worker.pending.pop(message[1], None)
+                    worker.completed += 1
+                if future is None:
+                    continue
+                if kind == "result":
+                    future.set_result(message[2])
+                else:
+                    future.set_exception(message[2])
+            elif kind in ("item", "end", "stream_error"):
+                with worker.lock:
+                    items = worker.pending.get(message[1])
+                    if kind != "item":
+                        worker.pending.pop(message[1], None)
+                        worker.completed += 1
+                if items is None:
+                    continue
+                if kind == "item":
+                    items.put((message[2], None))
+                elif kind == "end":
+                    items.put((_END, None))
+                else:
+                    items.put((None, message[2]))
+
+        conn.close()
+        worker.process.join()
+        worker.state = "stopped" if self._closing else "failed"
+        with worker.lock:
+            pending, worker.pending = worker.pending, {}
+        crashed = WorkerCrashed(f"{worker.group} worker {worker.index} exited with code {worker.process.exitcode}")
+        for waiter in pending.values():
+            if isinstance(waiter, Future):
+                waiter.set_exception(crashed)
+            else:
+                waiter.put((None, crashed))
+        if self._closing:
+            return
+
+        worker.error = worker.error or f"exited with code {worker.process.exitcode}"
+        delay = min(self.max_restart_delay_s, self.restart_delay_s * 2 ** worker.failures)
+        logger.warning("%s worker %d exited with code %s; restarting in %ss",
+                       worker.group, worker.index, worker.process.exitcode, delay)
+        worker.failures += 1
+        time.sleep(delay)
+        if not self._closing:
+            worker.restarts += 1
+            self._spawn(worker)
+
+
+def _portable(error: Exception) -> Exception:
+    """The exception itself if the API process can unpickle it, otherwise a RuntimeError describing it."""
+    try:
+        pickle.loads(pickle.dumps(error))
+        return error
+    except Exception:
+        return RuntimeError(f"{type(error).__name__}: {error}")
+
+
+def _serve(conn, group: str, concurrency: int, warmup: bool, torch_threads: int):
+    """Entry point of a model worker process: load the group's models, then serve requests."""
+    import torch
+
+    torch.set_num_threads(torch_threads)
+
+    from app import pipeline
+    from app.startup import StartupManager
+    from models.registry import registry
+
+    send_lock = threading.Lock()
+
+    def send(message):
+        with send_lock:
+            try:
+                conn.send(message)
+            except (pickle.PicklingError, AttributeError, TypeError) as e:
+                # A result that cannot be pickled is reported as an error instead
+                kind = "stream_error" if message[0] in ("item", "stream_error") else "error"
+                conn.send((kind, message[1], RuntimeError(f"{type(e).__name__}: {e}")))
+
+    startup = StartupManager(registry, warmup=warmup)
+    pipeline.add_startup_group(startup, group)
+    startup.start()
+    startup.wait()
+    status = startup.status()["components"][group]
+    if status["state"] != "ready":
+        conn.send(("failed", status["error"]))
+        conn.close()
+        raise SystemExit(1)
+    conn.send(("ready",))
+
+    cancelled: Dict[int, threading.Event] = {}
+
+    def run_call(request_id, operation, args, kwargs):
+        try:
+            result = pipeline.run_operation(operation, *args, **kwargs)
+        except Exception as e:
+            send(("error", request_id, _portable(e)))
+            return
+        send(("result", request_id, result))
+
+    def run_stream(request_id, operation, args, kwargs, stop: threading.Event):
+        try:
+            iterator = pipeline.run_operation(operation, *args, **kwargs)
+            try:
+                for item in iterator:
+                    if stop.is_set():
+                        break
+                    send(("item", request_id, item))
+            finally:
+                iterator.close()
+        except Exception as e:
+            send(("stream_error", request_id, _portable(e)))
+        else:
+            send(("end", request_id))
+        finally:
+            cancelled.pop(request_id, None)
+
+    pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=f"worker-{group}")
+    # Submitted requests not done yet, so the queued ones can be dropped on shutdown
+    futures = set()
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            # The API process closed the socket or went away
+            break
+        kind, request_id = message[0], message[1]
+        if kind == "shutdown":
+            break
+        if kind == "call":
+            future = pool.submit(run_call, request_id, message[2], message[3], message[4])
+        elif kind == "stream":
+            stop = cancelled[request_id] = threading.Event()
+            future = pool.submit(run_stream, request_id, message[2], message[3], message[4], stop)
+        elif kind == "ping":
+            # Answered here, not on the pool, so a busy worker still counts as alive
+            send(("pong", request_id))
+        elif kind == "stats":
+            send(("stats", request_id, pipeline.component_stats([group])))
+        elif kind == "cancel":
+            stop = cancelled.get(request_id)
+            if stop is not None:
+                stop.set()
+        if kind in ("call", "stream"):
+            futures.add(future)
+            future.add_done_callback(futures.discard)
+
+    for stop in list(cancelled.values()):
+        stop.set()
+    for future in list(futures):
+        future.cancel()
+    pool.shutdown(wait=True)
+    conn.close()
+
+    # Flush the stores, then skip interpreter teardown: collecting the model graphs can take seconds
+    pipeline.difficulty_adjuster.close()
+    if pipeline.question_bank is not None:
+        pipeline.question_bank.close()
+    os._exit(0)
@@ -0,0 +1,187 @@
+import os
+from typing import Iterator, List, Optional, Tuple
+
+from models.summarizer import TextSummarizer
+from models.question_generator import QuestionGenerator
+from models.distractor_generator import DistractorGenerator
+from models.quality_ranker import QualityRanker
+from models.difficulty_adjuster import DifficultyAdjuster
+from models.difficulty_store import DifficultyStore
+from models.embedding_service import EmbeddingService
+from models.question_bank import QuestionBank
+from models.backends import set_inference_backend
+from models.preprocessing import preprocessor
+from app.startup import StartupManager
+
+# The components and operations of the inference pipeline. Imported by the API and by
+# model worker processes, so it must not depend on the web framework.
+
+# torch (fp32), int8 (dynamically quantized) or onnx (ONNX Runtime); must be set before any model loads
+set_inference_backend(os.getenv("INFERENCE_BACKEND", "torch"), onnx_dir=os.getenv("ONNX_MODEL_DIR"))
+
+# Initialize models; weights are loaded lazily through the shared registry on first use
+summarizer = TextSummarizer(
+    chunk_overlap=int(os.getenv("SUMMARY_CHUNK_OVERLAP", "1")),
+    chunk_batch_size=int(os.getenv("SUMMARY_CHUNK_BATCH_SIZE", "4"))
+)
+question_generator = QuestionGenerator(
+    max_batch_size=int(os.getenv("QUESTION_BATCH_SIZE", "8")),
+    max_wait_ms=float(os.getenv("QUESTION_BATCH_WAIT_MS", "10"))
+)
+embedding_service = EmbeddingService()
+distractor_generator = DistractorGenerator(embedding_service=embedding_service)
+quality_ranker = QualityRanker(embedding_service=embedding_service)
+# Student attempts older than STUDENT_HISTORY_RETENTION_DAYS are dropped; 0 keeps them all
+HISTORY_RETENTION_S = float(os.getenv("STUDENT_HISTORY_RETENTION_DAYS", "0")) * 86400
+difficulty_adjuster = DifficultyAdjuster(
+    store=DifficultyStore(
+        path=os.getenv("DIFFICULTY_DB_PATH", "models/difficulty.db"),
+        history_retention_s=HISTORY_RETENTION_S
+    ),
+    refresh_interval_s=float(os.getenv("DIFFICULTY_REFRESH_SECONDS", "30")),
+    history_retention_s=HISTORY_RETENTION_S,
+    history_dir=os.getenv("STUDENT_HISTORY_DIR") or None
+)
+
+# Previously generated questions are served from the bank when they match the text
+question_bank = None
+if os.getenv("QUESTION_BANK", "1") == "1":
+    question_bank = QuestionBank(
+        path=os.getenv("QUESTION_BANK_PATH", "models/question_bank.db"),
+        embedding_service=embedding_service,
+        difficulty_adjuster=difficulty_adjuster,
+        min_similarity=float(os.getenv("QUESTION_BANK_MIN_SIMILARITY", "0.5")),
+        min_quality=float(os.getenv("QUESTION_BANK_MIN_QUALITY", "0.5"))
+    )
+
+WARMUP_TEXT = "Photosynthesis converts light energy into chemical energy. It takes place in the chloroplasts of plant cells."
+
+def use_question_bank(seed: Optional[int], use_cache: bool = True) -> bool:
+    # Seeded requests ask for a reproducible generation and use_cache=False for a fresh one,
+    # so both skip the bank
+    return question_bank is not None and seed is None and use_cache
+
+def summarize(text: str, max_length: int = 150, quality_tier: str = "full") -> str:
+    return summarizer.summarize(text, max_length=max_length, quality_tier=quality_tier)
+
+def summarize_batch(texts: List[str], max_length: int = 150, quality_tier: str = "full") -> List[str]:
+    return summarizer.summarize_batch(texts, max_length=max_length, quality_tier=quality_tier)
+
+def summarize_stream(text: str) -> Iterator[str]:
+    return summarizer.summarize_stream(text)
+
+def run_question_pipeline(text: str, seed: Optional[int] = None, target_difficulty: Optional[str] = None,
+                          num_questions: int = 3, quality_tier: str = "full", use_cache: bool = True) -> List[dict]:
+    """Retrieve banked questions for a text, then generate, add distractors to and rank the rest."""
+    questions = []
+    if use_question_bank(seed, use_cache):
+        questions = question_bank.retrieve(text, num_questions, target_difficulty)
+
+    missing = num_questions - len(questions)
+    if missing > 0:
+        # Generate initial questions
+        generated = question_generator.generate(text, num_questions=missing, seed=seed, quality_tier=quality_tier)
+
+        # Add distractors; every string the request needs is embedded in one batched call
+        embeddings = distractor_generator.add_distractors(generated)
+
+        # Score questions by quality, reusing the embeddings
+        generated = quality_ranker.rank(generated, embeddings=embeddings)
+        if question_bank is not None:
+            question_bank.add(generated, embeddings=embeddings)
+        questions.extend(generated)
+
+    # Rank questions by quality
+    return sorted(questions, key=lambda q: q['quality_score'], reverse=True)
+
+def stream_question_pipeline(text: str, seed: Optional[int] = None, target_difficulty: Optional[str] = None,
+                             num_questions: int = 3, use_cache: bool = True) -> Iterator[Tuple[str, object]]:
+    """Yield ("question", q) as soon as each question has its distractors, then ("ranked", questions).
+
+    Banked questions come first, right away, then the generated ones. Each question
+    carries its "index" in that order; the ranked list is in quality order.
+    """
+    questions = []
+    if use_question_bank(seed, use_cache):
+        questions = question_bank.retrieve(text, num_questions, target_difficulty)
+        for index, q in enumerate(questions):
+            q["index"] = index
+            yield "question", q
+
+    missing = num_questions - len(questions)
+    if missing > 0:
+        generated = question_generator.generate(text, num_questions=missing, seed=seed)
+
+        # One lookup for the whole request; each question only encodes its new strings
+        embeddings = embedding_service.embed([])
+        for q in generated:
+            q["distractors"] = distractor_generator.generate(q["question"], q["correct_answer"], embeddings=embeddings)
+            q["index"] = len(questions)
+            questions.append(q)
+            yield "question", q
+
+        # Scores the generated questions in place
+        generated = quality_ranker.rank(generated, embeddings=embeddings)
+        if question_bank is not None:
+            question_bank.add(generated, embeddings=embeddings)
+
+    yield "ranked", sorted(questions, key=lambda q: q['quality_score'], reverse=True)
+
+# Operations the API may run, by name, with the model group that serves them. A group is
+# served either by this process or by model worker processes (see app.model_workers).
+OPERATIONS = {
+    "summarize": ("summarizer", summarize),
+    "summarize_batch": ("summarizer", summarize_batch),
+    "summarize_stream": ("summarizer", summarize_stream),
+    "question_pipeline": ("questions", run_question_pipeline),
+    "question_pipeline_stream": ("questions", stream_question_pipeline),
+}
+
+def run_operation(name: str, *args, **kwargs):
+    _, fn = OPERATIONS[name]
+    return fn(*args, **kwargs)
+
+def operation_group(name: str) -> str:
+    return OPERATIONS[name][0]
+
+def component_stats(groups: List[str]) -> dict:
+    """The stats of the components the given model groups run in this process."""
+    stats = {"preprocessing": preprocessor.stats()} if groups else {}
+    if "questions" in groups:
+        stats["question_batching"] = question_generator.scheduler.stats()
+        stats["embeddings"] = embedding_service.stats()
+        if question_bank is not None:
+            stats["question_bank"] = question_bank.stats()
+    return stats
+
+def warm_up_summarizer():
+    summarizer.summarize(WARMUP_TEXT, max_length=60)
+
+def warm_up_questions():
+    # Runs every model of the pipeline once, without storing anything in the question bank
+    questions = question_generator.generate(WARMUP_TEXT, num_questions=1)
+    embeddings = distractor_generator.add_distractors(questions)
+    quality_ranker.rank(questions, embeddings=embeddings)
+
+def add_startup_group(startup: StartupManager, group: str):
+    """Declare the models, preparation and warm-up of a model group on a startup manager."""
+    if group == "summarizer":
+        startup.add_group(
+            "summarizer",
+            [summarizer.model_name, f"{summarizer.model_name}:tokenizer"],
+            prepare=summarizer.ensure_nltk_data,
+            warmup=warm_up_summarizer
+        )
+    elif group == "questions":
+        startup.add_group(
+            "questions",
+            [
+                question_generator.model_name, f"{question_generator.model_name}:tokenizer",
+                distractor_generator.bert_model_name, f"{distractor_generator.bert_model_name}:tokenizer",
+                embedding_service.model_name,
+            ],
+            prepare=question_bank.refresh if question_bank is not None else None,
+            warmup=warm_up_questions
+        )
+    else:
+        raise ValueError(f"Unknown model group: {group}")
@@ -0,0 +1,241 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace so trivially reformatted passages share a cache entry."""
+    return " ".join(text.split())
+
+
+def make_key(namespace: str, text: str, model_name: str, params: Dict) -> str:
+    """Content hash of the normalized input, the model and its generation parameters."""
+    payload = json.dumps(
+        [namespace, model_name, normalize_text(text), params],
+        sort_keys=True,
+        ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """LRU + TTL cache of JSON-serializable results with an optional on-disk tier.
+
+    Values are stored serialized, so callers always get a fresh copy they are
+    free to mutate. The in-memory tier is bounded by the total size of the
+    serialized values; the disk tier (one file per key) survives restarts. It is
+    swept every sweep_interval_s, and whenever writes take it past max_disk_bytes,
+    removing expired entries and then the oldest ones until it is back under the
+    limit. The disk tier does blocking file I/O, so on an event loop call it from a
+    worker thread.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, ttl_seconds: float = 24 * 3600, disk_dir: Optional[str] = None,
+                 max_disk_bytes: int = 1024 * 1024 * 1024, sweep_interval_s: float = 600.0):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.sweep_interval = sweep_interval_s
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (expires_at, serialized)
+        self._size = 0
+        self._lock = threading.Lock()
+
+        # Bytes in the disk tier as of the last sweep plus what was written since; None until the first sweep
+        self._disk_bytes: Optional[int] = None
+        self._last_sweep = 0.0
+        self._sweep_lock = threading.Lock()
+
+        # Metrics
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_evictions = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return a copy of the cached value, or None on a miss."""
+        return self.get_first([key])[1]
+
+    def get_first(self, keys: List[str]) -> Tuple[int, Optional[Any]]:
+        """Return the position of the first key with a cached value and a copy of it, or (-1, None).
+
+        The keys are tried in order and count as a single lookup in the hit rate.
+        """
+        for position, key in enumerate(keys):
+            value, tier = self._lookup(key)
+            if value is not None:
+                with self._lock:
+                    if tier == "memory":
+                        self.hits += 1
+                    else:
+                        self.disk_hits += 1
+                return position, value
+
+        with self._lock:
+            self.misses += 1
+        return -1, None
+
+    def set(self, key: str, value: Any):
+        """Store a JSON-serializable value in memory and, if configured, on disk."""
+        expires_at = time.time() + self.ttl_seconds
+        serialized = json.dumps(value)
+        with self._lock:
+            self._insert(key, expires_at, serialized)
+        self._write_disk(key, expires_at, value)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "disk_bytes": self._disk_bytes,
+                "disk_evictions": self.disk_evictions,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
+
+    def _lookup(self, key: str) -> Tuple[Optional[Any], Optional[str]]:
+        """The cached value and the tier it came from, without counting the lookup."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, serialized = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    return json.loads(serialized), "memory"
+                self._remove(key)
+
+        # Fall back to the disk tier and promote hits into memory
+        record = self._read_disk(key)
+        if record is not None and record["expires_at"] > now:
+            serialized = json.dumps(record["value"])
+            with self._lock:
+                self._insert(key, record["expires_at"], serialized)
+            return record["value"], "disk"
+        return None, None
+
+    def _insert(self, key: str, expires_at: float, serialized: str):
+        size = len(serialized)
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (expires_at, serialized)
+        self._size += size
+
+        # Evict least recently used entries until we are back under the limit
+        while self._size > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key: str):
+        _, serialized = self._entries.pop(key)
+        self._size -= len(serialized)
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], f"{key}.json")
+
+    def _read_disk(self, key: str) -> Optional[Dict]:
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, "r") as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if record.get("expires_at", 0) <= time.time():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return record
+
+    def _write_disk(self, key: str, expires_at: float, value: Any):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write to a temporary file and rename so readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump({"expires_at": expires_at, "value": value}, f)
+                size = f.tell()
+            # The modification time records the expiry, so a sweep only needs to stat the files
+            os.utime(tmp_path, (expires_at, expires_at))
+            os.replace(tmp_path, path)
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return
+
+        with self._lock:
+            if self._disk_bytes is not None:
+                self._disk_bytes += size
+            due = self._disk_bytes is None or self._disk_bytes > self.max_disk_bytes \
+                or time.time() - self._last_sweep >= self.sweep_interval
+        if due:
+            self._sweep_disk()
+
+    def _sweep_disk(self):
+        """Remove expired entries, then the oldest ones until the disk tier is under its limit."""
+        if not self._sweep_lock.acquire(blocking=False):
+            return  # Another writer is already sweeping
+        try:
+            now = time.time()
+            files = []
+            for directory, _, names in os.walk(self.disk_dir):
+                for name in names:
+                    path = os.path.join(directory, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    # Temporary files left by a crashed writer count as expired after a TTL
+                    expires_at = stat.st_mtime + self.ttl_seconds if name.endswith(".tmp") else stat.st_mtime
+                    files.append((expires_at, stat.st_size, path))
+
+            # Oldest first; every entry has the same TTL, so expiry order is write order
+            files.sort()
+            total = sum(size for _, size, _ in files)
+            # Trim a little below the limit so the next few writes do not each trigger a sweep
+            target = self.max_disk_bytes * 0.9 if total > self.max_disk_bytes else total
+            removed = 0
+            for expires_at, size, path in files:
+                if expires_at > now and total <= target:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                if expires_at > now:
+                    removed += 1
+
+            with self._lock:
+                self._disk_bytes = total
+                self._last_sweep = now
+                self.disk_evictions += removed
+        finally:
+            self._sweep_lock.release()
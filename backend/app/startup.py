@@ -0,0 +1,116 @@
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from app.executor import InferenceError
+from models.registry import ModelRegistry
+
+logger = logging.getLogger(__name__)
+
+
+class ComponentNotReady(InferenceError):
+    """The models an endpoint needs are still loading."""
+
+
+class _Group:
+    def __init__(self, name: str, models: List[str], prepare: Optional[Callable[[], None]],
+                 warmup: Optional[Callable[[], None]]):
+        self.name = name
+        self.models = models
+        self.prepare = prepare
+        self.warmup = warmup
+        self.state = "pending"
+        self.error: Optional[str] = None
+        self.started_at: Optional[float] = None
+        self.ready_seconds: Optional[float] = None
+
+
+class StartupManager:
+    """Load the models of each component group in the background, warm them up and report readiness.
+
+    Models are loaded in parallel (a model shared by several groups is loaded once).
+    Endpoints call require() for the group they need, so anything that does not
+    depend on a still-loading model, such as feedback, is served right away.
+    """
+
+    def __init__(self, registry: ModelRegistry, max_workers: int = 4, warmup: bool = True):
+        self.registry = registry
+        self.max_workers = max_workers
+        self.warmup = warmup
+        self.started = False
+        self._groups: Dict[str, _Group] = {}
+        self._loads: Dict[str, Future] = {}
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+
+    def add_group(self, name: str, models: List[str], prepare: Optional[Callable[[], None]] = None,
+                  warmup: Optional[Callable[[], None]] = None):
+        """Declare a component group: registry names to load, then optional prepare and warm-up steps."""
+        self._groups[name] = _Group(name, models, prepare, warmup)
+
+    def start(self):
+        """Start loading every group in the background; returns immediately."""
+        if self.started:
+            return
+        self.started = True
+        pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="model-loader")
+        for group in self._groups.values():
+            group.started_at = time.monotonic()
+            group.state = "loading"
+            for name in group.models:
+                with self._lock:
+                    if name not in self._loads:
+                        self._loads[name] = pool.submit(self.registry.get, name)
+            thread = threading.Thread(target=self._finish_group, args=(group,), name=f"startup-{group.name}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        pool.shutdown(wait=False)
+
+    def wait(self):
+        """Block until every group is ready or has failed."""
+        for thread in self._threads:
+            thread.join()
+
+    def is_ready(self, name: str) -> bool:
+        # Without background startup, models load on first use as before
+        return not self.started or self._groups[name].state == "ready"
+
+    def require(self, name: str):
+        """Raise ComponentNotReady if the group's models are not loaded and warmed up yet."""
+        if self.is_ready(name):
+            return
+        group = self._groups[name]
+        if group.state == "failed":
+            raise ComponentNotReady(f"{name} failed to load: {group.error}")
+        raise ComponentNotReady(f"{name} is still loading")
+
+    def status(self) -> Dict:
+        components = {
+            name: {
+                "state": "ready" if self.is_ready(name) else group.state,
+                "ready_seconds": group.ready_seconds,
+                "error": group.error,
+            }
+            for name, group in self._groups.items()
+        }
+        return {"ready": all(self.is_ready(name) for name in self._groups), "components": components}
+
+    def _finish_group(self, group: _Group):
+        try:
+            if group.prepare is not None:
+                group.prepare()
+            for name in group.models:
+                self._loads[name].result()
+            if self.warmup and group.warmup is not None:
+                # One small inference so the first real request does not pay for lazy initialisation
+                group.state = "warming"
+                group.warmup()
+        except Exception as e:
+            group.state = "failed"
+            group.error = str(e)
+            logger.exception("Loading %s failed", group.name)
+            return
+        group.ready_seconds = round(time.monotonic() - group.started_at, 3)
+        group.state = "ready"
@@ -0,0 +1,294 @@
+"""End-to-end benchmark of the API, driven in-process through the ASGI app.
+
+Runs /summarize, /generate-questions and /feedback at each concurrency level,
+recording request latency, throughput, per-stage latency and peak RSS, and
+writes the results to a JSON file that later runs can be compared against::
+
+    cd backend
+    python -m benchmarks.run --models stand-in --concurrency 1 4 8 --output bench.json
+    python -m benchmarks.run --compare bench.json new.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+TEXTS = [
+    "Photosynthesis converts light energy into chemical energy. It takes place in the chloroplasts of plant "
+    "cells. The light-dependent reactions split water and release oxygen. The Calvin cycle fixes carbon dioxide "
+    "into sugars using the energy stored in ATP and NADPH.",
+    "The human brain contains approximately 86 billion neurons. Neurons communicate through synapses using "
+    "chemical messengers called neurotransmitters. Different regions specialise in vision, movement, language "
+    "and memory. The brain uses about twenty percent of the body's energy.",
+    "Water boils at 100 degrees Celsius at sea level. At higher altitudes the air pressure is lower, so water "
+    "boils at a lower temperature. Pressure cookers raise the boiling point by trapping steam. This lets food "
+    "cook faster than in an open pot.",
+]
+
+
+class StageTimer:
+    """Wall-clock samples per pipeline stage, collected by wrapping component methods."""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def wrap(self, obj, method: str, stage: str):
+        original = getattr(obj, method)
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                self.record(stage, time.perf_counter() - start)
+
+        setattr(obj, method, timed)
+
+    def record(self, stage: str, seconds: float):
+        with self._lock:
+            self.samples.setdefault(stage, []).append(seconds)
+
+    def drain(self) -> Dict[str, Dict]:
+        with self._lock:
+            samples, self.samples = self.samples, {}
+        return {stage: summarize_latencies(values) for stage, values in samples.items()}
+
+
+def summarize_latencies(seconds: List[float]) -> Dict:
+    values = np.array(seconds) * 1000.0
+    return {
+        "count": len(values),
+        "mean_ms": float(values.mean()),
+        "p50_ms": float(np.percentile(values, 50)),
+        "p95_ms": float(np.percentile(values, 95)),
+        "max_ms": float(values.max()),
+    }
+
+
+def peak_rss_bytes() -> int:
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+async def asgi_request(app, method: str, path: str, body: Optional[Dict] = None, query: str = "") -> Tuple[int, bytes]:
+    """Send one HTTP request straight to an ASGI app and return (status, body)."""
+    payload = json.dumps(body).encode() if body is not None else b""
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query.encode(),
+        "root_path": "",
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(payload)).encode())],
+        "client": ("127.0.0.1", 0),
+        "server": ("benchmark", 80),
+    }
+    request_sent = False
+    never = asyncio.Event()
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": payload, "more_body": False}
+        # The client stays connected until the response is complete
+        await never.wait()
+
+    status = 0
+    chunks = []
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return status, b"".join(chunks)
+
+
+async def run_level(make_request: Callable, requests: int, concurrency: int) -> Dict:
+    """Issue requests with at most concurrency in flight; report latency, throughput and errors."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, statuses = [], {}
+
+    async def one(i):
+        async with semaphore:
+            start = time.perf_counter()
+            status, _ = await make_request(i)
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    elapsed = time.perf_counter() - start
+    return {
+        "requests": requests,
+        "throughput_rps": requests / elapsed,
+        "latency": summarize_latencies(latencies),
+        "statuses": {str(k): v for k, v in sorted(statuses.items())},
+    }
+
+
+async def run_benchmark(main, timer: StageTimer, levels: List[int], requests: int) -> Dict:
+    app = main.app
+    await app.router.startup()
+    try:
+        # Models load in the background after startup; wait until every component is ready
+        while not main.readiness()["ready"]:
+            await asyncio.sleep(0.1)
+
+        # Feedback targets questions the difficulty store tracks
+        question_ids = [f"benchmark-q{i}" for i in range(100)]
+        for qid in question_ids:
+            main.difficulty_adjuster.add_question(qid, "medium")
+        main.difficulty_adjuster.store.flush()
+
+        # The cache is bypassed so every request does the full work
+        scenarios = {
+            "summarize": lambda i: asgi_request(
+                app, "POST", "/summarize", {"text": TEXTS[i % len(TEXTS)], "use_cache": False}
+            ),
+            "generate_questions": lambda i: asgi_request(
+                app, "POST", "/generate-questions", {"text": TEXTS[i % len(TEXTS)], "use_cache": False}
+            ),
+            "feedback": lambda i: asgi_request(
+                app, "POST", "/feedback", query=f"question_id={question_ids[i % 100]}&correct={str(i % 3 != 0).lower()}"
+            ),
+        }
+
+        # Warm up: one request per scenario so first-call costs are not timed
+        for make_request in scenarios.values():
+            await make_request(0)
+        timer.drain()
+
+        results = {}
+        for name, make_request in scenarios.items():
+            results[name] = {}
+            for concurrency in levels:
+                level = await run_level(make_request, requests, concurrency)
+                level["stages"] = timer.drain()
+                results[name][str(concurrency)] = level
+                print(f"{name:>20} c={concurrency:<3} {level['throughput_rps']:8.2f} req/s  "
+                      f"p50 {level['latency']['p50_ms']:8.1f} ms  p95 {level['latency']['p95_ms']:8.1f} ms")
+        return results
+    finally:
+        await app.router.shutdown()
+
+
+def load_app(models: str, question_bank: bool):
+    """Import the API with throwaway databases and, optionally, the stand-in models."""
+    workdir = tempfile.mkdtemp(prefix="benchmark-")
+    os.environ.setdefault("DIFFICULTY_DB_PATH", os.path.join(workdir, "difficulty.db"))
+    os.environ.setdefault("QUESTION_BANK_PATH", os.path.join(workdir, "question_bank.db"))
+    os.environ.setdefault("JOBS_DIR", os.path.join(workdir, "jobs"))
+    os.environ["QUESTION_BANK"] = "1" if question_bank else "0"
+    os.environ.pop("RESULT_CACHE_DIR", None)
+
+    if models == "stand-in":
+        from benchmarks import stand_ins
+        from models.registry import registry
+
+        stand_ins.install(registry)
+
+    from app import main, pipeline
+
+    timer = StageTimer()
+    timer.wrap(pipeline.summarizer, "summarize", "summarization")
+    timer.wrap(pipeline.question_generator, "generate", "generation")
+    timer.wrap(pipeline.distractor_generator, "add_distractors", "distractors")
+    timer.wrap(pipeline.quality_ranker, "rank", "ranking")
+    timer.wrap(pipeline.difficulty_adjuster, "adjust", "difficulty")
+    if pipeline.question_bank is not None:
+        timer.wrap(pipeline.question_bank, "retrieve", "retrieval")
+    return main, timer
+
+
+def compare(baseline_path: str, candidate_path: str, threshold: float) -> int:
+    """Print per-scenario changes; return 1 if throughput fell or p95 rose by more than threshold."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    with open(candidate_path) as f:
+        candidate = json.load(f)
+
+    regressions = 0
+    for scenario, levels in candidate["results"].items():
+        for concurrency, result in levels.items():
+            before = baseline["results"].get(scenario, {}).get(concurrency)
+            if before is None:
+                continue
+            throughput = result["throughput_rps"] / before["throughput_rps"] - 1
+            p95 = result["latency"]["p95_ms"] / before["latency"]["p95_ms"] - 1
+            flag = throughput < -threshold or p95 > threshold
+            regressions += flag
+            print(f"{scenario:>20} c={concurrency:<3} throughput {throughput:+7.1%}  p95 {p95:+7.1%}"
+                  f"{'  REGRESSION' if flag else ''}")
+            for stage, stats in result["stages"].items():
+                stage_before = before["stages"].get(stage)
+                if stage_before:
+                    print(f"{'':>26}{stage:<14} p50 {stats['p50_ms'] / stage_before['p50_ms'] - 1:+7.1%}")
+
+    rss = candidate["peak_rss_bytes"] / baseline["peak_rss_bytes"] - 1
+    print(f"peak RSS {rss:+.1%}")
+    return 1 if regressions else 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.run", description=__doc__.splitlines()[0])
+    parser.add_argument("--models", choices=["stand-in", "real"], default="stand-in",
+                        help="tiny random models of the same architectures, or the real checkpoints")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--requests", type=int, default=16, help="requests per scenario and concurrency level")
+    parser.add_argument("--question-bank", action="store_true", help="serve questions from the bank when possible")
+    parser.add_argument("--output", default="benchmark.json")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CANDIDATE"), help="compare two result files")
+    parser.add_argument("--threshold", type=float, default=0.1, help="relative change counted as a regression")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        return compare(*args.compare, threshold=args.threshold)
+
+    main_module, timer = load_app(args.models, args.question_bank)
+    results = asyncio.run(run_benchmark(main_module, timer, args.concurrency, args.requests))
+
+    import torch
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "models": args.models,
+            "backend": main_module.inference_backend(),
+            "question_bank": args.question_bank,
+            "requests_per_level": args.requests,
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "threads": torch.get_num_threads(),
+            "machine": platform.machine(),
+        },
+        "results": results,
+        "peak_rss_bytes": peak_rss_bytes(),
+        "question_batching": main_module.question_generator.scheduler.stats(),
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.output} (peak RSS {report['peak_rss_bytes'] / 2**20:.0f} MiB)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,134 @@
+"""Tiny, randomly initialized stand-ins for the pipeline models.
+
+They share the real architectures (GPT-2, BART, BERT, a MiniLM-style sentence
+encoder) with small configs and byte-level / character vocabularies built on the
+fly, so the whole API runs in seconds without downloading any weights. Outputs are
+gibberish; only the shape of the work is realistic.
+"""
+import json
+import os
+import re
+import tempfile
+import threading
+from typing import Dict, Tuple
+
+import nltk
+from transformers import (
+    BartConfig,
+    BartForConditionalGeneration,
+    BartTokenizer,
+    BertConfig,
+    BertForMaskedLM,
+    BertModel,
+    BertTokenizer,
+    GPT2Config,
+    GPT2LMHeadModel,
+    GPT2Tokenizer,
+)
+from transformers.models.gpt2.tokenization_gpt2 import bytes_to_unicode
+from sentence_transformers import SentenceTransformer, models as st_models
+
+from models import distractor_generator, embedding_service, question_generator, summarizer
+from models.registry import ModelRegistry
+
+WORDPIECES = list("abcdefghijklmnopqrstuvwxyz0123456789?.,!'-")
+WORDS = ["the", "of", "and", "energy", "light", "cell", "water", "brain", "plant", "what", "how", "which"]
+
+
+def _byte_level_vocab(directory: str, special_tokens: list) -> Tuple[str, str, int]:
+    """A GPT-2 style vocabulary of the 256 byte symbols with no merges."""
+    vocab = {token: i for i, token in enumerate(special_tokens)}
+    for symbol in bytes_to_unicode().values():
+        vocab.setdefault(symbol, len(vocab))
+    vocab_path = os.path.join(directory, "vocab.json")
+    merges_path = os.path.join(directory, "merges.txt")
+    with open(vocab_path, "w") as f:
+        json.dump(vocab, f)
+    with open(merges_path, "w") as f:
+        f.write("#version: 0.2\n")
+    return vocab_path, merges_path, len(vocab)
+
+
+def _wordpiece_vocab(directory: str) -> Tuple[str, int]:
+    tokens = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"] + WORDPIECES + ["##" + c for c in WORDPIECES] + WORDS
+    path = os.path.join(directory, "vocab.txt")
+    with open(path, "w") as f:
+        f.write("\n".join(tokens))
+    return path, len(tokens)
+
+
+def gpt2(directory: str):
+    vocab_path, merges_path, size = _byte_level_vocab(directory, ["<|endoftext|>"])
+    tokenizer = GPT2Tokenizer(vocab_path, merges_path)
+    tokenizer.pad_token = tokenizer.eos_token
+    tokenizer.padding_side = "left"
+    config = GPT2Config(vocab_size=size, n_positions=1024, n_embd=64, n_layer=2, n_head=2, bos_token_id=0, eos_token_id=0)
+    return GPT2LMHeadModel(config).eval(), tokenizer
+
+
+def bart(directory: str):
+    vocab_path, merges_path, size = _byte_level_vocab(directory, ["<s>", "<pad>", "</s>", "<unk>", "<mask>"])
+    tokenizer = BartTokenizer(vocab_path, merges_path)
+    config = BartConfig(
+        vocab_size=size, d_model=64, encoder_layers=2, decoder_layers=2,
+        encoder_attention_heads=2, decoder_attention_heads=2,
+        encoder_ffn_dim=128, decoder_ffn_dim=128, max_position_embeddings=1024
+    )
+    return BartForConditionalGeneration(config).eval(), tokenizer
+
+
+def bert(directory: str):
+    vocab_path, size = _wordpiece_vocab(directory)
+    config = BertConfig(vocab_size=size, hidden_size=64, num_hidden_layers=2, num_attention_heads=2, intermediate_size=128)
+    return BertForMaskedLM(config).eval(), BertTokenizer(vocab_path)
+
+
+def sentence_encoder(directory: str) -> SentenceTransformer:
+    """A one-layer BERT with mean pooling and MiniLM's 384-dimensional output."""
+    vocab_path, size = _wordpiece_vocab(directory)
+    model_dir = os.path.join(directory, "sentence-encoder")
+    config = BertConfig(vocab_size=size, hidden_size=384, num_hidden_layers=1, num_attention_heads=2, intermediate_size=128)
+    BertModel(config).save_pretrained(model_dir)
+    BertTokenizer(vocab_path).save_pretrained(model_dir)
+    transformer = st_models.Transformer(model_dir)
+    pooling = st_models.Pooling(transformer.get_word_embedding_dimension())
+    return SentenceTransformer(modules=[transformer, pooling], device="cpu")
+
+
+def _split_sentences(text: str) -> list:
+    return [s for s in re.split(r"(?<=[.!?])\s+", text.strip()) if s]
+
+
+def install(registry: ModelRegistry) -> Dict[str, str]:
+    """Register stand-in loaders under the real model names; models are still built lazily."""
+    directory = tempfile.mkdtemp(prefix="stand-ins-")
+    built = {}
+    lock = threading.Lock()
+
+    def lazy(key, build):
+        # A model and its tokenizer are separate registry entries built from the same files
+        def load():
+            with lock:
+                if key not in built:
+                    os.makedirs(os.path.join(directory, key), exist_ok=True)
+                    built[key] = build(os.path.join(directory, key))
+                return built[key]
+        return load
+
+    pairs = {
+        question_generator.MODEL_NAME: lazy("gpt2", gpt2),
+        summarizer.MODEL_NAME: lazy("bart", bart),
+        distractor_generator.BERT_MODEL_NAME: lazy("bert", bert),
+    }
+    for name, load in pairs.items():
+        registry.register(name, lambda load=load: load()[0])
+        registry.register(f"{name}:tokenizer", lambda load=load: load()[1])
+    registry.register(embedding_service.MODEL_NAME, lazy("minilm", sentence_encoder))
+
+    # The punkt sentence model is a download too; split on punctuation when it is missing
+    try:
+        nltk.data.find("tokenizers/punkt")
+    except LookupError:
+        nltk.sent_tokenize = _split_sentences
+
+    return {name: "stand-in" for name in list(pairs) + [embedding_service.MODEL_NAME]}
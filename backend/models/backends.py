@@ -0,0 +1,263 @@
+"""Selectable inference backends for the transformer models.
+
+``torch`` runs the fp32 checkpoints as before. ``int8`` applies PyTorch dynamic
+quantization to every linear layer (CPU only). ``onnx`` runs an ONNX Runtime graph
+exported with Hugging Face Optimum, with the KV cache, from ``ONNX_MODEL_DIR``.
+
+Export the ONNX graphs once and compare the backends with::
+
+    python -m models.backends export [--quantize]
+    python -m models.backends benchmark --backends torch int8 onnx
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+import torch
+import torch.nn as nn
+
+from models.registry import _current_rss, default_device
+
+BACKENDS = ("torch", "int8", "onnx")
+
+# Optimum ONNX Runtime class for each transformers auto class
+ORT_CLASSES = {
+    "AutoModelForSeq2SeqLM": "ORTModelForSeq2SeqLM",
+    "GPT2LMHeadModel": "ORTModelForCausalLM",
+    "BertForMaskedLM": "ORTModelForMaskedLM",
+}
+
+_backend = "torch"
+_onnx_dir = "models/onnx"
+
+
+def set_inference_backend(backend: str, onnx_dir: Optional[str] = None):
+    """Choose the backend for models loaded from now on; call before the first model is loaded."""
+    global _backend, _onnx_dir
+    if backend not in BACKENDS:
+        raise ValueError(f"unknown inference backend {backend!r}, expected one of {BACKENDS}")
+    _backend = backend
+    if onnx_dir:
+        _onnx_dir = onnx_dir
+
+
+def inference_backend() -> str:
+    return _backend
+
+
+def inference_device() -> torch.device:
+    """Device the selected backend runs on; quantized and ONNX models run on the CPU."""
+    return default_device() if _backend == "torch" else torch.device("cpu")
+
+
+def onnx_path(name: str, onnx_dir: Optional[str] = None) -> str:
+    return os.path.join(onnx_dir or _onnx_dir, name.replace("/", "--"))
+
+
+def load_model(model_class: Any, name: str, backend: Optional[str] = None) -> Any:
+    """Load a pretrained model for the selected backend, ready for inference."""
+    backend = backend or _backend
+    if backend == "onnx":
+        return _load_onnx(model_class, name)
+
+    model = model_class.from_pretrained(name).eval()
+    if backend == "int8":
+        return quantize_int8(model)
+    return model.to(default_device())
+
+
+def quantize_int8(model: nn.Module) -> nn.Module:
+    """Replace the linear layers of a CPU model with dynamically quantized int8 ones."""
+    # GPT-2 implements its projections as Conv1D, which quantize_dynamic does not recognise
+    _conv1d_to_linear(model)
+    return torch.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+
+def _conv1d_to_linear(module: nn.Module):
+    from transformers.pytorch_utils import Conv1D
+
+    for child_name, child in module.named_children():
+        if isinstance(child, Conv1D):
+            in_features, out_features = child.weight.shape
+            linear = nn.Linear(in_features, out_features)
+            linear.weight.data = child.weight.data.t().contiguous()
+            linear.bias.data = child.bias.data
+            setattr(module, child_name, linear)
+        else:
+            _conv1d_to_linear(child)
+
+
+def _ort_class(model_class: Any):
+    try:
+        import optimum.onnxruntime as ort
+    except ImportError as e:
+        raise RuntimeError("the onnx backend needs `pip install optimum[onnxruntime]`") from e
+    return getattr(ort, ORT_CLASSES[model_class.__name__])
+
+
+def _load_onnx(model_class: Any, name: str) -> Any:
+    ort_class = _ort_class(model_class)
+    path = onnx_path(name)
+    if os.path.isdir(path):
+        return ort_class.from_pretrained(path, **_ort_kwargs(ort_class))
+    # Not exported yet: convert now (slow); `python -m models.backends export` avoids this at startup
+    print(f"No exported ONNX graph for {name} in {path}; exporting now.")
+    return export_onnx(model_class, name)
+
+
+def _ort_kwargs(ort_class: Any) -> Dict:
+    # Generative models reuse past keys/values between decoding steps
+    return {} if ort_class.__name__ == "ORTModelForMaskedLM" else {"use_cache": True}
+
+
+def export_onnx(model_class: Any, name: str, onnx_dir: Optional[str] = None, quantize: bool = False) -> Any:
+    """Export a model (with its KV cache where it generates) to ONNX and save it with its tokenizer."""
+    from transformers import AutoTokenizer
+
+    ort_class = _ort_class(model_class)
+    kwargs = _ort_kwargs(ort_class)
+    model = ort_class.from_pretrained(name, export=True, **kwargs)
+    path = onnx_path(name, onnx_dir)
+    model.save_pretrained(path)
+    AutoTokenizer.from_pretrained(name).save_pretrained(path)
+
+    if quantize:
+        # Dynamic int8 weights for every exported graph; activations are quantized at run time
+        from optimum.onnxruntime import ORTQuantizer
+        from optimum.onnxruntime.configuration import AutoQuantizationConfig
+
+        config = AutoQuantizationConfig.avx2(is_static=False, per_channel=False)
+        for file_name in sorted(f for f in os.listdir(path) if f.endswith(".onnx")):
+            quantizer = ORTQuantizer.from_pretrained(path, file_name=file_name)
+            quantizer.quantize(save_dir=path, quantization_config=config)
+            os.replace(os.path.join(path, file_name.replace(".onnx", "_quantized.onnx")), os.path.join(path, file_name))
+        model = ort_class.from_pretrained(path, **kwargs)
+    return model
+
+
+def _pipeline_models() -> Dict[str, Any]:
+    """Registry name -> transformers class of every model that has a selectable backend."""
+    from transformers import AutoModelForSeq2SeqLM, BertForMaskedLM, GPT2LMHeadModel
+    from models import distractor_generator, question_generator, summarizer
+
+    return {
+        summarizer.MODEL_NAME: AutoModelForSeq2SeqLM,
+        question_generator.MODEL_NAME: GPT2LMHeadModel,
+        distractor_generator.BERT_MODEL_NAME: BertForMaskedLM,
+    }
+
+
+SAMPLE_TEXTS = [
+    "Photosynthesis is the process by which green plants and some other organisms use sunlight to synthesize "
+    "foods from carbon dioxide and water. Photosynthesis in plants generally involves the green pigment "
+    "chlorophyll and generates oxygen as a byproduct. The light-dependent reactions take place in the thylakoid "
+    "membranes, where light energy is converted into chemical energy in the form of ATP and NADPH. The Calvin "
+    "cycle then uses this chemical energy to fix carbon dioxide into sugars in the stroma of the chloroplast.",
+    "The human brain contains approximately 86 billion neurons, each connected to thousands of others through "
+    "synapses. Signals travel along axons as electrical impulses and cross synapses as chemical messengers "
+    "called neurotransmitters. Different regions of the brain specialise in functions such as vision, movement, "
+    "language and memory, yet they constantly exchange information. The brain uses about twenty percent of the "
+    "body's energy even though it accounts for only two percent of its weight.",
+]
+
+
+def benchmark(backends: List[str], texts: List[str], repeats: int = 3, tolerance: float = 0.02) -> Dict:
+    """Time the pipeline models per backend and check summary ROUGE against the fp32 baseline."""
+    from models.distractor_generator import DistractorGenerator
+    from models.question_generator import QuestionGenerator
+    from models.registry import registry
+    from models.summarizer import TextSummarizer
+
+    names = list(_pipeline_models())
+    report = {"backends": {}, "regressions": []}
+    baseline = None
+    for backend in backends:
+        set_inference_backend(backend)
+        for name in names:
+            registry.evict(name)
+        gc.collect()
+
+        rss_before = _current_rss()
+        summarizer = TextSummarizer()
+        question_generator = QuestionGenerator()
+        distractor_generator = DistractorGenerator()
+        registry.preload(names)
+        memory = registry.memory_report()["models"]
+
+        timings = {"summarize": [], "generate_questions": [], "distractors": []}
+        rouge = []
+        for _ in range(repeats):
+            for text in texts:
+                start = time.perf_counter()
+                summary = summarizer.summarize(text)
+                timings["summarize"].append(time.perf_counter() - start)
+                rouge.append(summarizer.evaluate_summary(text, summary))
+
+                start = time.perf_counter()
+                questions = question_generator.generate(text, seed=0)
+                timings["generate_questions"].append(time.perf_counter() - start)
+
+                start = time.perf_counter()
+                distractor_generator._generate_bert_distractors(
+                    [(q["question"], q["correct_answer"]) for q in questions], 3
+                )
+                timings["distractors"].append(time.perf_counter() - start)
+
+        result = {
+            "latency_ms": {stage: 1000.0 * sum(t) / len(t) for stage, t in timings.items()},
+            "rouge": {key: sum(r[key] for r in rouge) / len(rouge) for key in rouge[0]},
+            "load_rss_bytes": {name: memory[name]["rss_delta_bytes"] for name in names},
+            "rss_growth_bytes": _current_rss() - rss_before,
+        }
+        if baseline is None:
+            baseline = result
+        else:
+            result["speedup"] = {
+                stage: baseline["latency_ms"][stage] / ms if ms else 0.0
+                for stage, ms in result["latency_ms"].items()
+            }
+            for key, score in result["rouge"].items():
+                if baseline["rouge"][key] - score > tolerance:
+                    report["regressions"].append(f"{backend}: {key} {score:.4f} vs {baseline['rouge'][key]:.4f}")
+        report["backends"][backend] = result
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m models.backends", description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export = commands.add_parser("export", help="export the pipeline models to ONNX")
+    export.add_argument("--output", default=os.getenv("ONNX_MODEL_DIR", _onnx_dir))
+    export.add_argument("--quantize", action="store_true", help="also quantize the graphs to int8 weights")
+
+    bench = commands.add_parser("benchmark", help="compare latency, memory and ROUGE across backends")
+    bench.add_argument("--backends", nargs="+", default=["torch", "int8"], choices=BACKENDS,
+                       help="the first backend is the accuracy baseline")
+    bench.add_argument("--input", help="file with one text per line (defaults to built-in samples)")
+    bench.add_argument("--repeats", type=int, default=3)
+    bench.add_argument("--tolerance", type=float, default=0.02, help="largest allowed ROUGE drop")
+
+    args = parser.parse_args(argv)
+    if args.command == "export":
+        for name, model_class in _pipeline_models().items():
+            start = time.perf_counter()
+            export_onnx(model_class, name, args.output, quantize=args.quantize)
+            print(f"Exported {name} to {onnx_path(name, args.output)} in {time.perf_counter() - start:.1f}s")
+        return 0
+
+    texts = SAMPLE_TEXTS
+    if args.input:
+        with open(args.input) as f:
+            texts = [line.strip() for line in f if line.strip()]
+    report = benchmark(args.backends, texts, repeats=args.repeats, tolerance=args.tolerance)
+    print(json.dumps(report, indent=2))
+    return 1 if report["regressions"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
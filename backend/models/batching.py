@@ -0,0 +1,149 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from collections import deque
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+
+class _PendingItem:
+    __slots__ = ("payload", "group", "future", "enqueued_at")
+
+    def __init__(self, payload: Any, group: Hashable = None):
+        self.payload = payload
+        self.group = group
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class BatchScheduler:
+    """Collect items submitted from many threads into batches for one model call.
+
+    Items are only batched with items of the same group, so callers can keep
+    incompatible work (e.g. different generation settings) apart.
+    """
+
+    def __init__(
+        self,
+        process_batch: Callable[[List[Any]], List[Any]],
+        max_batch_size: int = 8,
+        max_wait_ms: float = 10.0,
+        name: str = "batcher",
+    ):
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.name = name
+
+        self._queue = queue.Queue()
+        self._backlog = deque()  # items pulled from the queue while filling another group's batch
+        self._lock = threading.Lock()
+        self._worker = None
+
+        # Metrics
+        self._batches = 0
+        self._items = 0
+        self._max_batch_seen = 0
+        self._batch_size_counts: Dict[int, int] = {}
+        self._total_wait = 0.0
+        self._max_wait_seen = 0.0
+
+    def submit(self, payload: Any, group: Hashable = None) -> Future:
+        """Queue a single item and return a future for its result."""
+        self._ensure_worker()
+        item = _PendingItem(payload, group)
+        self._queue.put(item)
+        return item.future
+
+    def submit_many(self, payloads: List[Any], group: Hashable = None) -> List[Future]:
+        """Queue several items at once so they can land in the same batch."""
+        return [self.submit(payload, group) for payload in payloads]
+
+    def run(self, payloads: List[Any], group: Hashable = None, timeout: Optional[float] = None) -> List[Any]:
+        """Submit items and block until all of their results are available."""
+        futures = self.submit_many(payloads, group)
+        return [future.result(timeout=timeout) for future in futures]
+
+    def stats(self) -> Dict:
+        """Return batch-size and queue-wait metrics."""
+        with self._lock:
+            return {
+                "batches": self._batches,
+                "items": self._items,
+                "queue_depth": self._queue.qsize() + len(self._backlog),
+                "avg_batch_size": self._items / self._batches if self._batches else 0.0,
+                "max_batch_size": self._max_batch_seen,
+                "batch_size_counts": dict(sorted(self._batch_size_counts.items())),
+                "avg_queue_wait_ms": 1000.0 * self._total_wait / self._items if self._items else 0.0,
+                "max_queue_wait_ms": 1000.0 * self._max_wait_seen,
+            }
+
+    def _ensure_worker(self):
+        """Start the background batching thread on first use."""
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._loop, name=self.name, daemon=True)
+                self._worker.start()
+
+    def _collect_batch(self) -> List[_PendingItem]:
+        """Take the oldest item, then gather more of its group until the batch is full or the wait expires."""
+        first = self._backlog.popleft() if self._backlog else self._queue.get()
+        batch = [first]
+
+        # Items of the same group that were set aside earlier go first
+        for item in list(self._backlog):
+            if len(batch) >= self.max_batch_size:
+                break
+            if item.group == first.group:
+                self._backlog.remove(item)
+                batch.append(item)
+
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining <= 0:
+                    item = self._queue.get_nowait()
+                else:
+                    item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item.group == first.group:
+                batch.append(item)
+            else:
+                self._backlog.append(item)
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect_batch()
+
+            # Drop items whose callers already gave up
+            batch = [item for item in batch if item.future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            self._record(batch)
+            try:
+                results = self.process_batch([item.payload for item in batch])
+            except Exception as e:
+                for item in batch:
+                    item.future.set_exception(e)
+                continue
+
+            for item, result in zip(batch, results):
+                item.future.set_result(result)
+
+    def _record(self, batch: List[_PendingItem]):
+        now = time.perf_counter()
+        waits = [now - item.enqueued_at for item in batch]
+        size = len(batch)
+        with self._lock:
+            self._batches += 1
+            self._items += size
+            self._max_batch_seen = max(self._max_batch_seen, size)
+            self._batch_size_counts[size] = self._batch_size_counts.get(size, 0) + 1
+            self._total_wait += sum(waits)
+            self._max_wait_seen = max(self._max_wait_seen, max(waits))
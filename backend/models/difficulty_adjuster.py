@@ -1,26 +1,134 @@
+import logging
+import threading
+import time
 import numpy as np
-from typing import List, Dict
-import json
-import os
+from concurrent.futures import Future
 from datetime import datetime
+from typing import List, Dict, Optional
+
+from models.difficulty_store import DifficultyStore
+from models.instrumentation import instrumentation
+from models.student_history import StudentHistory
+from models.thompson import ThompsonSampler
+
+logger = logging.getLogger(__name__)
+
+def _timestamp_ms(timestamp: str) -> int:
+    try:
+        return int(datetime.fromisoformat(timestamp).timestamp() * 1000)
+    except ValueError:
+        # Unparseable (e.g. imported) timestamps count as the oldest attempts
+        return 0
 
 class DifficultyAdjuster:
-    def __init__(self):
+    def __init__(self, store: Optional[DifficultyStore] = None, refresh_interval_s: float = 30.0, seed: Optional[int] = None,
+                 history_retention_s: float = 0.0, history_dir: Optional[str] = None):
         self.difficulty_levels = ["easy", "medium", "hard"]
         self.learning_rate = 0.1
         self.exploration_rate = 0.2
+        # Success probability a student should have on a question of each difficulty
+        self.target_success = {"easy": 0.8, "medium": 0.5, "hard": 0.2}
+        self.rng = np.random.default_rng(seed)
+        
+        # Difficulty estimates and student performance history live in a shared SQLite store
+        self.store = store or DifficultyStore()
+        self.store.next_difficulty = self._next_difficulty
+        # This process's attempts are synced once per committed batch, before the next refresh
+        self.store.on_attempts_committed = self.sync_history
+        
+        # Beta posteriors per question, mirrored in memory for vectorized sampling.
+        # Feedback written by other worker processes is picked up on refresh.
+        self.sampler = ThompsonSampler(seed=seed)
         
-        # Initialize or load difficulty estimates
-        self.difficulty_estimates = self._load_difficulty_estimates()
+        # Per-student running accuracy, synced incrementally from the store's attempts.
+        # A snapshot in history_dir (written on close) saves replaying them on start.
+        self.history = StudentHistory(retention_s=history_retention_s)
+        self.history_dir = history_dir
+        # Attempts a student needs before their accuracy shifts the target difficulty
+        self.min_personal_attempts = 5
+        if history_dir is not None and self.history.load(history_dir) \
+                and self.history.last_id > self.store.last_attempt_id():
+            # The snapshot belongs to another database; replay from the start
+            self.history = StudentHistory(retention_s=history_retention_s)
         
-        # Initialize or load student performance history
-        self.student_history = self._load_student_history()
+        self.refresh_interval = refresh_interval_s
+        self._refresh_thread: Optional[threading.Thread] = None
+        self._refresh_lock = threading.Lock()
+        self.refresh()
+    
+    def refresh(self):
+        """Reload the posterior counts from the shared store."""
+        self._last_refresh = time.monotonic()
+        with instrumentation.span("difficulty.refresh"):
+            self.sampler.load(self.store.all_estimates())
+            self.sync_history()
+            self.history.expire()
+    
+    def sync_history(self):
+        """Apply the attempts recorded since the last sync, by any process."""
+        while True:
+            attempts = self.store.attempts_since(self.history.last_id)
+            if not attempts:
+                return
+            self.history.append(
+                (row_id, student_id, qid, correct, _timestamp_ms(ts))
+                for row_id, student_id, qid, correct, ts in attempts
+            )
+    
+    def add_question(self, question_id: str, difficulty: str = "medium") -> Future:
+        """Start tracking a question so feedback for it is recorded."""
+        self.sampler.add(question_id)
+        return self.store.add_question(question_id, difficulty)
+    
+    def select_questions(self, target_difficulty: str, k: int, candidates: Optional[List[str]] = None) -> List[str]:
+        """Thompson-sample k question ids whose success rate best matches the target difficulty."""
+        self._maybe_refresh()
+        with instrumentation.span("difficulty.select"):
+            return self.sampler.select(self.target_success[target_difficulty], k, candidates)
+    
+    def personal_difficulty(self, target_difficulty: str, student_id: Optional[str] = None) -> str:
+        """Step the target difficulty by the student's recent accuracy.
+        
+        Reads the student's running counts, so it costs the same however long their history is.
+        """
+        if student_id is None:
+            return target_difficulty
+        self._maybe_refresh()
+        accuracy = self.history.accuracy(student_id)
+        if accuracy is None or accuracy["attempts"] < self.min_personal_attempts:
+            return target_difficulty
+        
+        # Same thresholds as for questions: a student who mostly succeeds finds the level too easy
+        if accuracy["recent_accuracy"] > 0.7:
+            return self._increase_difficulty(target_difficulty)
+        elif accuracy["recent_accuracy"] < 0.3:
+            return self._decrease_difficulty(target_difficulty)
+        return target_difficulty
     
     def adjust(self, questions: List[Dict], target_difficulty: str) -> List[Dict]:
         """Adjust question difficulty based on target difficulty and student history."""
+        with instrumentation.span("difficulty.adjust"):
+            return self._adjust(questions, target_difficulty)
+    
+    def _adjust(self, questions: List[Dict], target_difficulty: str) -> List[Dict]:
+        self._maybe_refresh()
+        
+        # Tracked questions are labelled from one vectorized posterior draw
+        rows = self.sampler.rows(q.get('question_id') for q in questions)
+        tracked = rows >= 0
+        if tracked.any():
+            draws = self.sampler.sample(rows[tracked])
+            labels = np.where(draws > 0.7, "easy", np.where(draws < 0.3, "hard", "medium"))
+            for q, label in zip((q for q, t in zip(questions, tracked) if t), labels):
+                q['difficulty'] = str(label)
+        
         adjusted_questions = []
         
-        for q in questions:
+        for q, is_tracked in zip(questions, tracked):
+            if is_tracked:
+                adjusted_questions.append(q)
+                continue
+            
             # Get current difficulty estimate
             current_difficulty = q.get('difficulty', 'medium')
             
@@ -36,38 +144,73 @@ class DifficultyAdjuster:
         
         return adjusted_questions
     
-    def update(self, question_id: str, correct: bool):
-        """Update difficulty estimates based on student performance."""
-        if question_id not in self.difficulty_estimates:
-            return
+    def update(self, question_id: str, correct: bool) -> Future:
+        """Update difficulty estimates based on student performance.
+        
+        The write is group-committed in the background; the returned future
+        resolves once it is durable.
+        """
+        self.sampler.update(question_id, correct)
+        return self.store.update(question_id, correct)
+    
+    def update_counts(self, counts: Dict[str, tuple], attempts: List[tuple] = ()) -> Future:
+        """Apply aggregated (successes, failures) per question in one write.
         
-        # Get current estimate
-        current_estimate = self.difficulty_estimates[question_id]
+        The difficulty is stepped once per question from the combined counts. Student
+        (student_id, question_id, correct, timestamp) attempts given here are committed
+        with the counts. The in-memory posteriors take the counts only once the write
+        has committed, so a failed write cannot be counted twice when it is retried.
+        """
+        future = self.store.apply_counts(counts, attempts)
         
-        # Update estimate using Thompson sampling
-        if correct:
-            current_estimate['successes'] += 1
-        else:
-            current_estimate['failures'] += 1
+        def apply(committed: Future):
+            if not committed.cancelled() and committed.exception() is None:
+                self.sampler.update_counts(counts)
         
+        future.add_done_callback(apply)
+        return future
+    
+    def _next_difficulty(self, successes: int, failures: int, difficulty: str) -> str:
+        """Step the difficulty of a question by its observed success rate."""
         # Calculate new difficulty
-        total_attempts = current_estimate['successes'] + current_estimate['failures']
-        success_rate = current_estimate['successes'] / total_attempts
+        total_attempts = successes + failures
+        success_rate = successes / total_attempts
         
         # Update difficulty based on success rate
         if success_rate > 0.7:  # Too easy
-            current_estimate['difficulty'] = self._increase_difficulty(current_estimate['difficulty'])
+            return self._increase_difficulty(difficulty)
         elif success_rate < 0.3:  # Too hard
-            current_estimate['difficulty'] = self._decrease_difficulty(current_estimate['difficulty'])
+            return self._decrease_difficulty(difficulty)
+        return difficulty
+    
+    def _maybe_refresh(self):
+        """Start a refresh in the background once the interval has passed.
         
-        # Save updated estimates
-        self._save_difficulty_estimates()
+        A refresh reads every estimate and the new attempts from the store, so it runs on
+        a thread of its own; callers, typically on the event loop, keep using the current
+        counts until it has applied the new ones.
+        """
+        if self.refresh_interval <= 0 or time.monotonic() - self._last_refresh <= self.refresh_interval:
+            return
+        with self._refresh_lock:
+            if self._refresh_thread is not None and self._refresh_thread.is_alive():
+                return
+            self._last_refresh = time.monotonic()
+            self._refresh_thread = threading.Thread(target=self._background_refresh, name="difficulty-refresh", daemon=True)
+            self._refresh_thread.start()
+    
+    def _background_refresh(self):
+        try:
+            self.refresh()
+        except Exception:
+            # Retried after the next interval
+            logger.exception("Refreshing difficulty estimates failed")
     
     def _calculate_adjusted_difficulty(self, current: str, target: str) -> str:
-        """Calculate adjusted difficulty using Thompson sampling."""
-        if np.random.random() < self.exploration_rate:
+        """Move a question without feedback history one step towards the target, with some exploration."""
+        if self.rng.random() < self.exploration_rate:
             # Exploration: randomly choose a difficulty
-            return np.random.choice(self.difficulty_levels)
+            return str(self.rng.choice(self.difficulty_levels))
         
         # Exploitation: use current estimates
         current_index = self.difficulty_levels.index(current)
@@ -95,43 +238,25 @@ class DifficultyAdjuster:
             return self.difficulty_levels[current_index - 1]
         return current
     
-    def _load_difficulty_estimates(self) -> Dict:
-        """Load difficulty estimates from file."""
-        try:
-            with open('models/difficulty_estimates.json', 'r') as f:
-                return json.load(f)
-        except:
-            return {}
-    
-    def _save_difficulty_estimates(self):
-        """Save difficulty estimates to file."""
-        os.makedirs('models', exist_ok=True)
-        with open('models/difficulty_estimates.json', 'w') as f:
-            json.dump(self.difficulty_estimates, f)
-    
-    def _load_student_history(self) -> Dict:
-        """Load student performance history from file."""
-        try:
-            with open('models/student_history.json', 'r') as f:
-                return json.load(f)
-        except:
-            return {}
-    
-    def _save_student_history(self):
-        """Save student performance history to file."""
-        os.makedirs('models', exist_ok=True)
-        with open('models/student_history.json', 'w') as f:
-            json.dump(self.student_history, f)
-    
-    def record_student_performance(self, student_id: str, question_id: str, correct: bool):
+    def record_student_performance(self, student_id: str, question_id: str, correct: bool) -> Future:
         """Record student performance for future difficulty adjustments."""
-        if student_id not in self.student_history:
-            self.student_history[student_id] = []
-        
-        self.student_history[student_id].append({
-            'question_id': question_id,
-            'correct': correct,
-            'timestamp': datetime.now().isoformat()
-        })
-        
-        self._save_student_history() 
\ No newline at end of file
+        return self.store.record_attempt(student_id, question_id, correct)
+    
+    def record_student_performances(self, attempts: List[tuple]) -> Future:
+        """Record many (student_id, question_id, correct, timestamp) attempts in one write."""
+        return self.store.record_attempts(attempts)
+    
+    def student_history(self, student_id: str) -> List[Dict]:
+        """Return a student's recorded attempts, oldest first."""
+        return self.store.student_history(student_id)
+    
+    def close(self):
+        """Flush pending writes to the store and snapshot the student history."""
+        with self._refresh_lock:
+            refresh_thread = self._refresh_thread
+        if refresh_thread is not None:
+            refresh_thread.join()
+        self.store.close()
+        if self.history_dir is not None:
+            self.sync_history()
+            self.history.save(self.history_dir)
@@ -0,0 +1,364 @@
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from models.instrumentation import instrumentation
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS difficulty_estimates (
+    question_id TEXT PRIMARY KEY,
+    successes INTEGER NOT NULL DEFAULT 0,
+    failures INTEGER NOT NULL DEFAULT 0,
+    difficulty TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS student_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    student_id TEXT NOT NULL,
+    question_id TEXT NOT NULL,
+    correct INTEGER NOT NULL,
+    timestamp TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS student_history_student ON student_history (student_id);
+"""
+
+
+class DifficultyStore:
+    """SQLite store for difficulty estimates and student history, safe to share between worker processes.
+
+    Writes are queued and applied by one background thread per process in batched
+    transactions (group commit): each transaction takes everything that queued up
+    while the previous one committed, so an idle store commits a write right away.
+    Each batch runs under BEGIN IMMEDIATE, so the read-modify-write of a question's
+    counts never interleaves with another process and no update is lost. WAL mode
+    lets readers proceed during writes. With a history retention window, attempts
+    older than the window are deleted whenever the write-ahead log is checkpointed.
+    """
+
+    def __init__(
+        self,
+        path: str = "models/difficulty.db",
+        next_difficulty: Optional[Callable[[int, int, str], str]] = None,
+        on_attempts_committed: Optional[Callable[[], None]] = None,
+        commit_interval_ms: float = 0.0,
+        max_batch_size: int = 5000,
+        checkpoint_interval_s: float = 300.0,
+        history_retention_s: float = 0.0,
+        legacy_estimates_path: str = "models/difficulty_estimates.json",
+        legacy_history_path: str = "models/student_history.json"
+    ):
+        self.path = path
+        self.next_difficulty = next_difficulty or (lambda successes, failures, difficulty: difficulty)
+        # Called on the writer thread once per committed batch that recorded attempts
+        self.on_attempts_committed = on_attempts_committed
+        self.commit_interval = commit_interval_ms / 1000.0
+        self.max_batch_size = max_batch_size
+        self.checkpoint_interval = checkpoint_interval_s
+        self.history_retention = history_retention_s
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._local = threading.local()
+        conn = self._connect()
+        conn.executescript(SCHEMA)
+        conn.close()
+        self._migrate_legacy_json(legacy_estimates_path, legacy_history_path)
+
+        # Metrics
+        self.commits = 0
+        self.events_written = 0
+
+        self._queue = queue.Queue()
+        self._last_checkpoint = time.monotonic()
+        self._writer = threading.Thread(target=self._write_loop, name="difficulty-store", daemon=True)
+        self._writer.start()
+
+    # Writes
+
+    def update(self, question_id: str, correct: bool) -> Future:
+        """Queue a feedback event; the returned future resolves once it is committed."""
+        return self._enqueue(("feedback", question_id, bool(correct)))
+
+    def apply_counts(self, counts: Dict[str, Tuple[int, int]], attempts: List[Tuple[str, str, bool, str]] = ()) -> Future:
+        """Queue aggregated (successes, failures) increments per question.
+
+        Any (student_id, question_id, correct, timestamp) attempts given are committed
+        in the same transaction, so the counts and the attempts are written together or not at all.
+        """
+        return self._enqueue(("counts", counts, list(attempts)))
+
+    def add_question(self, question_id: str, difficulty: str) -> Future:
+        """Start tracking a question; existing estimates are left untouched."""
+        return self._enqueue(("add", question_id, difficulty))
+
+    def record_attempt(self, student_id: str, question_id: str, correct: bool, timestamp: Optional[str] = None) -> Future:
+        timestamp = timestamp or datetime.now().isoformat()
+        return self._enqueue(("attempt", student_id, question_id, bool(correct), timestamp))
+
+    def record_attempts(self, attempts: List[Tuple[str, str, bool, str]]) -> Future:
+        """Queue many (student_id, question_id, correct, timestamp) attempts as one write."""
+        return self._enqueue(("attempts", attempts))
+
+    def flush(self, timeout: Optional[float] = None):
+        """Block until everything queued so far has been committed."""
+        self._enqueue(("flush",)).result(timeout=timeout)
+
+    def close(self, timeout: Optional[float] = 10.0):
+        """Commit pending writes and checkpoint the WAL; called on shutdown."""
+        self.flush(timeout=timeout)
+        self.checkpoint()
+
+    # Reads
+
+    def get(self, question_id: str) -> Optional[Dict]:
+        row = self._connection().execute(
+            "SELECT successes, failures, difficulty FROM difficulty_estimates WHERE question_id = ?",
+            (question_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {"successes": row[0], "failures": row[1], "difficulty": row[2]}
+
+    def all_estimates(self) -> Dict[str, Dict]:
+        rows = self._connection().execute(
+            "SELECT question_id, successes, failures, difficulty FROM difficulty_estimates"
+        )
+        return {qid: {"successes": s, "failures": f, "difficulty": d} for qid, s, f, d in rows}
+
+    def student_history(self, student_id: str) -> List[Dict]:
+        rows = self._connection().execute(
+            "SELECT question_id, correct, timestamp FROM student_history WHERE student_id = ? ORDER BY id",
+            (student_id,)
+        )
+        return [{"question_id": qid, "correct": bool(c), "timestamp": ts} for qid, c, ts in rows]
+
+    def attempts_since(self, last_id: int, limit: int = 100000) -> List[Tuple[int, str, str, bool, str]]:
+        """Up to limit (id, student_id, question_id, correct, timestamp) attempts after last_id, in id order."""
+        rows = self._connection().execute(
+            "SELECT id, student_id, question_id, correct, timestamp FROM student_history WHERE id > ? ORDER BY id LIMIT ?",
+            (last_id, limit)
+        )
+        return [(row_id, student_id, qid, bool(c), ts) for row_id, student_id, qid, c, ts in rows]
+
+    def last_attempt_id(self) -> int:
+        """The highest attempt id ever assigned; ids are never reused, even after deletes."""
+        row = self._connection().execute("SELECT seq FROM sqlite_sequence WHERE name = 'student_history'").fetchone()
+        return row[0] if row is not None else 0
+
+    # Maintenance
+
+    def checkpoint(self):
+        """Fold the write-ahead log back into the database file and truncate it."""
+        self.expire_history()
+        self._connection().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        self._last_checkpoint = time.monotonic()
+
+    def expire_history(self):
+        """Delete attempts older than the history retention window, if there is one."""
+        if self.history_retention <= 0:
+            return
+        # ISO timestamps of one format order as strings
+        cutoff = datetime.fromtimestamp(time.time() - self.history_retention).isoformat()
+        self._connection().execute("DELETE FROM student_history WHERE timestamp < ?", (cutoff,))
+
+    def snapshot(self, destination: str):
+        """Write a consistent copy of the database, e.g. for backups."""
+        target = sqlite3.connect(destination)
+        try:
+            self._connection().backup(target)
+        finally:
+            target.close()
+
+    def stats(self) -> Dict:
+        return {
+            "queue_depth": self._queue.qsize(),
+            "commits": self.commits,
+            "events_written": self.events_written,
+        }
+
+    # Internals
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        return conn
+
+    def _connection(self) -> sqlite3.Connection:
+        """One connection per thread, since sqlite3 connections are not shareable."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def _enqueue(self, op: tuple) -> Future:
+        future = Future()
+        self._queue.put((op, future))
+        return future
+
+    def _write_loop(self):
+        while True:
+            batch = [self._queue.get()]
+            # Optionally wait for more writes before committing; by default only the
+            # writes that are already queued join the batch
+            deadline = time.monotonic() + self.commit_interval
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    if remaining > 0:
+                        batch.append(self._queue.get(timeout=remaining))
+                    else:
+                        batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            # Callers may have stopped waiting (cancelled futures), but their writes still apply
+            try:
+                with instrumentation.span("difficulty_store.commit"):
+                    recorded_attempts = self._commit([op for op, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    if future.set_running_or_notify_cancel():
+                        future.set_exception(e)
+                continue
+
+            # Before the futures resolve, so a caller sees its attempts once its write is done
+            if recorded_attempts and self.on_attempts_committed is not None:
+                try:
+                    self.on_attempts_committed()
+                except Exception:
+                    logger.exception("Handling committed attempts failed")
+
+            for _, future in batch:
+                if future.set_running_or_notify_cancel():
+                    future.set_result(None)
+
+            if time.monotonic() - self._last_checkpoint > self.checkpoint_interval:
+                try:
+                    self.checkpoint()
+                except sqlite3.Error:
+                    pass
+
+    def _commit(self, ops: List[tuple]) -> int:
+        """Apply a batch of queued writes in a single transaction; returns the number of attempts recorded."""
+        conn = self._connection()
+        question_ids = set()
+        for op in ops:
+            if op[0] in ("feedback", "add"):
+                question_ids.add(op[1])
+            elif op[0] == "counts":
+                question_ids.update(op[1])
+        question_ids.discard(None)
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Read the current rows once, apply the events in order in memory, write back once
+            estimates = {}
+            for qid in question_ids:
+                row = conn.execute(
+                    "SELECT successes, failures, difficulty FROM difficulty_estimates WHERE question_id = ?",
+                    (qid,)
+                ).fetchone()
+                if row is not None:
+                    estimates[qid] = list(row)
+            attempts = []
+
+            for op in ops:
+                kind = op[0]
+                if kind == "add":
+                    _, qid, difficulty = op
+                    if qid not in estimates:
+                        estimates[qid] = [0, 0, difficulty]
+                elif kind == "feedback":
+                    _, qid, correct = op
+                    self._apply(estimates.get(qid), int(correct), int(not correct))
+                elif kind == "counts":
+                    for qid, (successes, failures) in op[1].items():
+                        self._apply(estimates.get(qid), successes, failures)
+                    attempts.extend((student_id, qid, int(correct), ts) for student_id, qid, correct, ts in op[2])
+                elif kind == "attempt":
+                    _, student_id, qid, correct, timestamp = op
+                    attempts.append((student_id, qid, int(correct), timestamp))
+                elif kind == "attempts":
+                    attempts.extend((student_id, qid, int(correct), ts) for student_id, qid, correct, ts in op[1])
+
+            conn.executemany(
+                "INSERT INTO difficulty_estimates (question_id, successes, failures, difficulty) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(question_id) DO UPDATE SET successes = excluded.successes, "
+                "failures = excluded.failures, difficulty = excluded.difficulty",
+                [(qid, s, f, d) for qid, (s, f, d) in estimates.items()]
+            )
+            if attempts:
+                conn.executemany(
+                    "INSERT INTO student_history (student_id, question_id, correct, timestamp) VALUES (?, ?, ?, ?)",
+                    attempts
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        self.commits += 1
+        self.events_written += len(ops)
+        return len(attempts)
+
+    def _apply(self, estimate: Optional[list], successes: int, failures: int):
+        """Add outcomes to an estimate in place; unknown questions are ignored."""
+        if estimate is None or successes + failures == 0:
+            return
+        estimate[0] += successes
+        estimate[1] += failures
+        estimate[2] = self.next_difficulty(estimate[0], estimate[1], estimate[2])
+
+    def _migrate_legacy_json(self, estimates_path: str, history_path: str):
+        """Import the JSON files written by earlier versions into an empty database."""
+        conn = self._connection()
+        # Several workers may start at once; the write lock makes check-and-import atomic
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._import_legacy_json(conn, estimates_path, history_path)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _import_legacy_json(self, conn: sqlite3.Connection, estimates_path: str, history_path: str):
+        if conn.execute("SELECT COUNT(*) FROM difficulty_estimates").fetchone()[0] == 0:
+            try:
+                with open(estimates_path, "r") as f:
+                    estimates = json.load(f)
+            except (OSError, ValueError):
+                estimates = {}
+            conn.executemany(
+                "INSERT OR IGNORE INTO difficulty_estimates (question_id, successes, failures, difficulty) VALUES (?, ?, ?, ?)",
+                [
+                    (qid, e.get("successes", 0), e.get("failures", 0), e.get("difficulty", "medium"))
+                    for qid, e in estimates.items()
+                ]
+            )
+
+        if conn.execute("SELECT COUNT(*) FROM student_history").fetchone()[0] == 0:
+            try:
+                with open(history_path, "r") as f:
+                    history = json.load(f)
+            except (OSError, ValueError):
+                history = {}
+            conn.executemany(
+                "INSERT INTO student_history (student_id, question_id, correct, timestamp) VALUES (?, ?, ?, ?)",
+                [
+                    (student_id, a["question_id"], int(a["correct"]), a["timestamp"])
+                    for student_id, attempts in history.items()
+                    for a in attempts
+                ]
+            )
@@ -1,21 +1,30 @@
 from transformers import BertForMaskedLM, BertTokenizer
 import torch
-from typing import List
+from typing import Dict, List, Optional, Tuple
 import numpy as np
-from sentence_transformers import SentenceTransformer
 from sklearn.metrics.pairwise import cosine_similarity
 
+from models.embedding_service import EmbeddingLookup, EmbeddingService
+from models.backends import inference_device, load_model
+from models.instrumentation import instrumentation
+from models.registry import registry
+
+BERT_MODEL_NAME = "bert-base-uncased"
+
+registry.register(BERT_MODEL_NAME, lambda: load_model(BertForMaskedLM, BERT_MODEL_NAME))
+registry.register(f"{BERT_MODEL_NAME}:tokenizer", lambda: BertTokenizer.from_pretrained(BERT_MODEL_NAME))
+
 class DistractorGenerator:
-    def __init__(self):
-        # Initialize BERT for masked language modeling
-        self.bert_model_name = "bert-base-uncased"
-        self.bert_tokenizer = BertTokenizer.from_pretrained(self.bert_model_name)
-        self.bert_model = BertForMaskedLM.from_pretrained(self.bert_model_name)
-        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        self.bert_model.to(self.device)
+    def __init__(self, embedding_service: Optional[EmbeddingService] = None):
+        # BERT for masked language modeling, loaded lazily through the registry
+        self.bert_model_name = BERT_MODEL_NAME
+        self.device = inference_device()
+        self.max_length = 128  # generated questions are short
+        self.max_span_tokens = 4  # longer answers are masked with this many wordpieces
+        self.top_k = 20  # predictions per mask, before junk and duplicates are filtered
         
-        # Initialize sentence transformer for semantic similarity
-        self.sentence_transformer = SentenceTransformer('all-MiniLM-L6-v2')
+        # Sentence embeddings for semantic similarity, shared with the quality ranker
+        self.embedding_service = embedding_service or EmbeddingService()
         
         # Common distractors for different types of answers
         self.common_distractors = {
@@ -26,25 +35,68 @@ class DistractorGenerator:
             "default": ["none of the above", "all of the above", "cannot be determined"]
         }
     
-    def generate(self, question: str, correct_answer: str, num_distractors: int = 3) -> List[str]:
+    @property
+    def bert_model(self):
+        return registry.get(self.bert_model_name)
+    
+    @property
+    def bert_tokenizer(self):
+        return registry.get(f"{self.bert_model_name}:tokenizer")
+    
+    def generate(self, question: str, correct_answer: str, num_distractors: int = 3,
+                 embeddings: Optional[EmbeddingLookup] = None) -> List[str]:
         """Generate plausible distractors for a given question and correct answer."""
-        # Get answer type
-        answer_type = self._get_answer_type(correct_answer)
+        candidates = self._candidate_distractors([(question, correct_answer)], num_distractors)[0]
+        
+        # Encode question, answer and candidates together, reusing the caller's lookup if given
+        texts = [question, correct_answer] + candidates
+        if embeddings is None:
+            embeddings = self.embedding_service.embed(texts)
+        else:
+            embeddings.ensure(texts)
+        
+        # Rank and select top distractors
+        ranked_distractors = self._rank_distractors(question, correct_answer, candidates, embeddings)
+        return ranked_distractors[:num_distractors]
+    
+    def add_distractors(self, questions: List[Dict], num_distractors: int = 3) -> EmbeddingLookup:
+        """Fill in q["distractors"] for every question using one BERT pass and one batched embedding call.
+        
+        Returns the embedding lookup so later pipeline stages can reuse the vectors.
+        """
+        candidates = self._candidate_distractors(
+            [(q["question"], q["correct_answer"]) for q in questions],
+            num_distractors
+        )
         
-        # Generate distractors using BERT
-        bert_distractors = self._generate_bert_distractors(question, correct_answer, num_distractors)
+        # Collect every string the request needs and encode them once
+        texts = []
+        for q, q_candidates in zip(questions, candidates):
+            texts.append(q["question"])
+            texts.append(q["correct_answer"])
+            texts.extend(q_candidates)
+        embeddings = self.embedding_service.embed(texts)
         
-        # Add common distractors based on answer type
-        common_distractors = self.common_distractors.get(answer_type, self.common_distractors["default"])
+        with instrumentation.span("distractors.rank"):
+            for q, q_candidates in zip(questions, candidates):
+                ranked = self._rank_distractors(q["question"], q["correct_answer"], q_candidates, embeddings)
+                q["distractors"] = ranked[:num_distractors]
         
-        # Combine and rank distractors
-        all_distractors = bert_distractors + common_distractors
-        ranked_distractors = self._rank_distractors(question, correct_answer, all_distractors)
+        return embeddings
+    
+    def _candidate_distractors(self, pairs: List[Tuple[str, str]], num_distractors: int) -> List[List[str]]:
+        """Combine BERT predictions with common distractors for each (question, answer) pair."""
+        # Generate distractors for all questions using one BERT pass
+        bert_distractors = self._generate_bert_distractors(pairs, num_distractors)
         
-        # Select top distractors
-        selected_distractors = ranked_distractors[:num_distractors]
+        candidates = []
+        for (_, correct_answer), predicted in zip(pairs, bert_distractors):
+            # Add common distractors based on answer type
+            answer_type = self._get_answer_type(correct_answer)
+            common_distractors = self.common_distractors.get(answer_type, self.common_distractors["default"])
+            candidates.append(predicted + [d for d in common_distractors if d not in predicted])
         
-        return selected_distractors
+        return candidates
     
     def _get_answer_type(self, answer: str) -> str:
         """Determine the type of answer (number, date, location, etc.)."""
@@ -59,42 +111,86 @@ class DistractorGenerator:
             return "person"
         return "default"
     
-    def _generate_bert_distractors(self, question: str, correct_answer: str, num_distractors: int) -> List[str]:
-        """Generate distractors using BERT masked language modeling."""
+    def _mask_answer(self, question: str, correct_answer: str) -> str:
+        """Replace the answer with one [MASK] per wordpiece, up to max_span_tokens."""
+        tokenizer = self.bert_tokenizer
+        span = max(1, min(len(tokenizer.tokenize(correct_answer)), self.max_span_tokens))
+        masks = " ".join([tokenizer.mask_token] * span)
+        if correct_answer and correct_answer in question:
+            return question.replace(correct_answer, masks, 1)
+        # The answer does not appear verbatim; ask BERT to complete the question instead
+        return f"{question} {masks}"
+    
+    def _generate_bert_distractors(self, pairs: List[Tuple[str, str]], num_distractors: int) -> List[List[str]]:
+        """Predict the masked answer span of every question in one padded BERT forward pass."""
+        if not pairs:
+            return []
+        tokenizer = self.bert_tokenizer
+        
         # Prepare input
-        masked_question = question.replace(correct_answer, "[MASK]")
-        inputs = self.bert_tokenizer(
-            masked_question,
+        masked_questions = [self._mask_answer(question, answer) for question, answer in pairs]
+        inputs = tokenizer(
+            masked_questions,
             return_tensors="pt",
             padding=True,
-            truncation=True
+            truncation=True,
+            max_length=self.max_length
         ).to(self.device)
         
-        # Get predictions
-        with torch.no_grad():
-            outputs = self.bert_model(**inputs)
-            predictions = outputs.logits
+        # Get predictions; only the masked positions are needed
+        instrumentation.count("pipeline_tokens_total", int(inputs["attention_mask"].sum()), model="bert", kind="prompt")
+        with instrumentation.span("distractors.masked_lm"), torch.inference_mode():
+            logits = self.bert_model(**inputs).logits
+            is_mask = inputs["input_ids"] == tokenizer.mask_token_id
+            rows, positions = torch.where(is_mask)
+            top_k = min(self.top_k, logits.shape[-1])
+            top_tokens = torch.topk(logits[rows, positions], top_k, dim=-1).indices.cpu()
+        
+        # Group the top tokens of each mask position by question
+        spans: List[List[torch.Tensor]] = [[] for _ in pairs]
+        for row, tokens in zip(rows.tolist(), top_tokens):
+            spans[row].append(tokens)
         
-        # Get top predictions for the masked token
-        mask_token_index = torch.where(inputs["input_ids"] == self.bert_tokenizer.mask_token_id)[1]
-        mask_token_logits = predictions[0, mask_token_index, :]
-        top_tokens = torch.topk(mask_token_logits, num_distractors + 1, dim=1).indices[0]
+        return [
+            self._decode_span(span, answer, num_distractors)
+            for span, (_, answer) in zip(spans, pairs)
+        ]
+    
+    def _decode_span(self, span: List[torch.Tensor], correct_answer: str, num_distractors: int) -> List[str]:
+        """Turn per-position top-k predictions into whole-word candidates, dropping subword junk."""
+        if not span:
+            return []  # the masks were truncated away
+        tokenizer = self.bert_tokenizer
+        answer = correct_answer.lower().strip()
         
-        # Convert tokens to words
         distractors = []
-        for token_id in top_tokens:
-            word = self.bert_tokenizer.decode([token_id])
-            if word != correct_answer and word not in distractors:
-                distractors.append(word)
+        for rank in range(len(span[0])):
+            # The rank-th prediction for the first position, completed with the best guess for the rest
+            token_ids = [span[0][rank].item()] + [tokens[0].item() for tokens in span[1:]]
+            pieces = tokenizer.convert_ids_to_tokens(token_ids)
+            if pieces[0].startswith("##") or any(p in tokenizer.all_special_tokens for p in pieces):
+                continue
+            word = tokenizer.convert_tokens_to_string(pieces).strip()
+            
+            # Skip punctuation, stray characters and restatements of the answer
+            if not any(c.isalnum() for c in word) or (len(word) < 2 and len(answer) > 1):
+                continue
+            if word.lower() == answer or word.lower() in answer.split() or word in distractors:
+                continue
+            
+            distractors.append(word)
+            if len(distractors) == num_distractors:
+                break
         
-        return distractors[:num_distractors]
+        return distractors
     
-    def _rank_distractors(self, question: str, correct_answer: str, distractors: List[str]) -> List[str]:
+    def _rank_distractors(self, question: str, correct_answer: str, distractors: List[str],
+                          embeddings: EmbeddingLookup) -> List[str]:
         """Rank distractors based on semantic similarity and plausibility."""
         # Get embeddings
-        question_embedding = self.sentence_transformer.encode([question])[0]
-        answer_embedding = self.sentence_transformer.encode([correct_answer])[0]
-        distractor_embeddings = self.sentence_transformer.encode(distractors)
+        question_embedding = embeddings[question]
+        answer_embedding = embeddings[correct_answer]
+        distractor_embeddings = embeddings.matrix(distractors)
         
         # Calculate similarities
         question_similarities = cosine_similarity([question_embedding], distractor_embeddings)[0]
@@ -0,0 +1,92 @@
+from typing import Dict, Iterable, List, Optional
+import threading
+
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+from models.instrumentation import instrumentation
+from models.registry import default_device, registry
+
+MODEL_NAME = "all-MiniLM-L6-v2"
+
+registry.register(MODEL_NAME, lambda: SentenceTransformer(MODEL_NAME, device=str(default_device())))
+
+
+class EmbeddingLookup:
+    """Vectors for a set of strings, keyed by the string itself."""
+
+    def __init__(self, service: "EmbeddingService", vectors: Optional[Dict[str, np.ndarray]] = None):
+        self.service = service
+        self.vectors = vectors if vectors is not None else {}
+
+    def __getitem__(self, text: str) -> np.ndarray:
+        return self.vectors[text]
+
+    def __contains__(self, text: str) -> bool:
+        return text in self.vectors
+
+    def __len__(self) -> int:
+        return len(self.vectors)
+
+    def ensure(self, texts: Iterable[str]) -> "EmbeddingLookup":
+        """Encode any of the given strings that are not in the lookup yet, in one batched call."""
+        missing = [text for text in texts if text not in self.vectors]
+        if missing:
+            self.vectors.update(self.service.encode_unique(missing))
+        return self
+
+    def matrix(self, texts: List[str]) -> np.ndarray:
+        """Stack the vectors for texts into a (len(texts), dim) array."""
+        self.ensure(texts)
+        if not texts:
+            return np.zeros((0, self.service.dimension), dtype=np.float32)
+        return np.stack([self.vectors[text] for text in texts])
+
+
+class EmbeddingService:
+    """Deduplicating, batched front end for the shared SentenceTransformer."""
+
+    def __init__(self, model_name: str = MODEL_NAME, batch_size: int = 64):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+
+        # Metrics
+        self.encode_calls = 0
+        self.texts_requested = 0
+        self.texts_encoded = 0
+
+    @property
+    def model(self) -> SentenceTransformer:
+        return registry.get(self.model_name)
+
+    @property
+    def dimension(self) -> int:
+        return self.model.get_sentence_embedding_dimension()
+
+    def embed(self, texts: Iterable[str]) -> EmbeddingLookup:
+        """Encode every distinct string once and return a lookup keyed by string."""
+        return EmbeddingLookup(self).ensure(texts)
+
+    def encode_unique(self, texts: Iterable[str]) -> Dict[str, np.ndarray]:
+        """Encode the distinct strings among texts in a single model call."""
+        texts = list(texts)
+        unique = list(dict.fromkeys(texts))
+        with self._lock:
+            self.texts_requested += len(texts)
+            if not unique:
+                return {}
+            self.encode_calls += 1
+            self.texts_encoded += len(unique)
+
+        with instrumentation.span("embeddings.encode"):
+            vectors = self.model.encode(unique, batch_size=self.batch_size, convert_to_numpy=True)
+        return dict(zip(unique, vectors))
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "encode_calls": self.encode_calls,
+                "texts_requested": self.texts_requested,
+                "texts_encoded": self.texts_encoded,
+            }
@@ -0,0 +1,166 @@
+import contextvars
+import re
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+# Histogram buckets in seconds, from tokenization-sized to generation-sized work
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_NOOP = nullcontext()
+
+# Spans finished while handling the current request, for the Server-Timing header
+_request_spans: contextvars.ContextVar[Optional[List[Tuple[str, float]]]] = contextvars.ContextVar(
+    "request_spans", default=None
+)
+
+
+class _Histogram:
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        index = bisect_left(BUCKETS, value)
+        if index < len(BUCKETS):
+            self.counts[index] += 1
+        self.total += value
+        self.count += 1
+
+
+class Instrumentation:
+    """Timing spans, counters and scrape-time collectors, rendered in Prometheus text format.
+
+    When disabled, span() returns a shared no-op context manager and count() returns
+    at once, so instrumented code pays a single attribute check.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._histograms: Dict[str, _Histogram] = {}
+        self._counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+        self._collectors: List[Callable[[], Iterator[Tuple[str, Dict[str, str], float]]]] = []
+        self._lock = threading.Lock()
+
+    def span(self, stage: str):
+        """Time a block as one observation of pipeline_stage_seconds{stage=...}."""
+        if not self.enabled:
+            return _NOOP
+        return self._span(stage)
+
+    @contextmanager
+    def _span(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def observe(self, stage: str, seconds: float):
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = _Histogram()
+            histogram.observe(seconds)
+        spans = _request_spans.get()
+        if spans is not None:
+            spans.append((stage, seconds))
+
+    def count(self, name: str, value: float = 1, **labels: str):
+        """Add value to the counter name{labels}."""
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def add_collector(self, collect: Callable[[], Iterator[Tuple[str, Dict[str, str], float]]]):
+        """Register a callable yielding (name, labels, value) gauges, evaluated on every scrape."""
+        self._collectors.append(collect)
+
+    def start_request(self) -> contextvars.Token:
+        """Collect spans finished in this context (and contexts copied from it) for Server-Timing."""
+        return _request_spans.set([])
+
+    def finish_request(self, token: contextvars.Token) -> str:
+        """Return the Server-Timing header value for the request and stop collecting."""
+        spans = _request_spans.get() or []
+        _request_spans.reset(token)
+
+        totals: Dict[str, float] = {}
+        for stage, seconds in spans:
+            totals[stage] = totals.get(stage, 0.0) + seconds
+        return ", ".join(f"{_metric_name(stage)};dur={1000.0 * seconds:.1f}" for stage, seconds in totals.items())
+
+    def render_prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            histograms = {stage: (list(h.counts), h.total, h.count) for stage, h in self._histograms.items()}
+            counters = dict(self._counters)
+
+        if histograms:
+            lines.append("# HELP pipeline_stage_seconds Time spent in each pipeline stage.")
+            lines.append("# TYPE pipeline_stage_seconds histogram")
+            for stage, (counts, total, count) in sorted(histograms.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(BUCKETS, counts):
+                    cumulative += bucket_count
+                    lines.append(f'pipeline_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'pipeline_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {count}')
+                lines.append(f'pipeline_stage_seconds_sum{{stage="{stage}"}} {total}')
+                lines.append(f'pipeline_stage_seconds_count{{stage="{stage}"}} {count}')
+
+        typed = set()
+        for (name, labels), value in sorted(counters.items()):
+            if name not in typed:
+                lines.append(f"# TYPE {name} counter")
+                typed.add(name)
+            lines.append(f"{name}{_format_labels(dict(labels))} {value}")
+
+        for collect in self._collectors:
+            for name, labels, value in collect():
+                if name not in typed:
+                    lines.append(f"# TYPE {name} gauge")
+                    typed.add(name)
+                lines.append(f"{name}{_format_labels(labels)} {float(value)}")
+
+        return "\n".join(lines) + "\n"
+
+
+def stats_gauges(prefix: str, stats: Dict, labels: Optional[Dict[str, str]] = None) -> Iterator[Tuple[str, Dict[str, str], float]]:
+    """Turn a nested stats() dict into gauges; keys that are not names (e.g. batch sizes) become a label."""
+    labels = labels or {}
+    for key, value in stats.items():
+        if isinstance(key, str) and re.fullmatch(r"[A-Za-z_]\w*", key):
+            name, key_labels = f"{prefix}_{key}", labels
+        else:
+            name, key_labels = prefix, {**labels, "key": str(key)}
+        if isinstance(value, dict):
+            yield from stats_gauges(name, value, key_labels)
+        elif isinstance(value, (int, float)):
+            yield _metric_name(name), key_labels, float(value)
+
+
+def _metric_name(name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_]", "_", name)
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    pairs = []
+    for key, value in sorted(labels.items()):
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{key}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+# Shared by every component in the process
+instrumentation = Instrumentation()
@@ -0,0 +1,146 @@
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List
+
+import nltk
+
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+
+
+def _digest(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+class _LRUCache:
+    """A thread-safe LRU map with hit and miss counters."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, keys: List) -> List:
+        with self._lock:
+            values = []
+            for key in keys:
+                value = self._entries.get(key)
+                if value is None:
+                    self.misses += 1
+                else:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                values.append(value)
+            return values
+
+    def set_many(self, items: Dict):
+        with self._lock:
+            self._entries.update(items)
+            for key in items:
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+class Document:
+    """A segmented text: its sentences with whitespace collapsed, in order."""
+
+    __slots__ = ("text", "sentences")
+
+    def __init__(self, text: str, sentences: List[str]):
+        self.text = text
+        self.sentences = sentences
+
+    def joined(self) -> str:
+        return " ".join(self.sentences)
+
+
+class TextPreprocessor:
+    """Sentence segmentation and per-sentence token ids, shared by every model and cached by content hash.
+
+    Documents are segmented paragraph by paragraph, and token ids are cached per
+    (tokenizer, sentence), so a document resubmitted after small edits only segments the
+    paragraphs and tokenizes the sentences that changed.
+    """
+
+    def __init__(self, max_paragraphs: int = 20000, max_sentences: int = 200000):
+        self._paragraphs = _LRUCache(max_paragraphs)
+        self._tokens = _LRUCache(max_sentences)
+        self._punkt_ready = False
+
+    def ensure_nltk_data(self):
+        """Download the NLTK data needed for sentence splitting if it is missing."""
+        if self._punkt_ready:
+            return
+        try:
+            nltk.data.find('tokenizers/punkt')
+        except LookupError:
+            nltk.download('punkt')
+        self._punkt_ready = True
+
+    def segment(self, text: str) -> Document:
+        """Split text into sentences, reusing the sentences of paragraphs seen before."""
+        paragraphs = [p for p in _PARAGRAPH_BREAK.split(text) if p.strip()]
+        keys = [_digest(p) for p in paragraphs]
+        cached = self._paragraphs.get_many(keys)
+
+        new = {}
+        sentences = []
+        for key, paragraph, paragraph_sentences in zip(keys, paragraphs, cached):
+            if paragraph_sentences is None:
+                paragraph_sentences = new.get(key)
+            if paragraph_sentences is None:
+                self.ensure_nltk_data()
+                paragraph_sentences = tuple(" ".join(s.split()) for s in nltk.sent_tokenize(paragraph))
+                new[key] = paragraph_sentences
+            sentences.extend(paragraph_sentences)
+        if new:
+            self._paragraphs.set_many(new)
+        return Document(text, sentences)
+
+    def token_ids(self, tokenizer_name: str, tokenizer, sentences: List[str], leading_space: bool = True) -> List[List[int]]:
+        """Token ids of each sentence without special tokens, tokenizing only the uncached ones.
+
+        With leading_space, each sentence is tokenized as it appears after a space, which
+        for byte-level BPE is exactly its share of the tokens of the joined text.
+        """
+        keys = [(tokenizer_name, leading_space, _digest(s)) for s in sentences]
+        ids = self._tokens.get_many(keys)
+        missing = {}
+        for key, sentence, sentence_ids in zip(keys, sentences, ids):
+            if sentence_ids is None and key not in missing:
+                missing[key] = " " + sentence if leading_space else sentence
+        if missing:
+            encoded = tokenizer(list(missing.values()), add_special_tokens=False)["input_ids"]
+            new = dict(zip(missing, (tuple(e) for e in encoded)))
+            self._tokens.set_many(new)
+            ids = [sentence_ids if sentence_ids is not None else new[key] for key, sentence_ids in zip(keys, ids)]
+        return [list(sentence_ids) for sentence_ids in ids]
+
+    def encode_joined(self, tokenizer_name: str, tokenizer, sentences: List[str], leading_space: bool = False) -> List[int]:
+        """Token ids of " ".join(sentences) (preceded by a space with leading_space), built from the cache."""
+        if not sentences:
+            return []
+        first = self.token_ids(tokenizer_name, tokenizer, sentences[:1], leading_space=leading_space)[0]
+        rest = self.token_ids(tokenizer_name, tokenizer, sentences[1:])
+        return first + [token for sentence_ids in rest for token in sentence_ids]
+
+    def stats(self) -> Dict:
+        return {"paragraphs": self._paragraphs.stats(), "tokens": self._tokens.stats()}
+
+
+# Shared by every component in the process
+preprocessor = TextPreprocessor()
@@ -1,24 +1,30 @@
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
-from sentence_transformers import SentenceTransformer
-from typing import List, Dict
-import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
+from typing import List, Dict, Optional
+
+from models.embedding_service import EmbeddingLookup, EmbeddingService
+from models.instrumentation import instrumentation
+from models.registry import default_device
 
 class SiameseNetwork(nn.Module):
-    def __init__(self, embedding_dim=384):
+    def __init__(self, embedding_dim=384, embedding_service: Optional[EmbeddingService] = None):
         super(SiameseNetwork, self).__init__()
-        self.embedding = SentenceTransformer('all-MiniLM-L6-v2')
+        # The encoder is shared through the registry, so it is not part of this module's state
+        self.embedding_service = embedding_service or EmbeddingService()
         self.fc1 = nn.Linear(embedding_dim * 2, 256)
         self.fc2 = nn.Linear(256, 128)
         self.fc3 = nn.Linear(128, 1)
         
     def forward(self, x1, x2):
         # Get embeddings
-        e1 = self.embedding.encode(x1, convert_to_tensor=True)
-        e2 = self.embedding.encode(x2, convert_to_tensor=True)
-        
+        embeddings = self.embedding_service.embed(list(x1) + list(x2))
+        e1 = torch.from_numpy(embeddings.matrix(list(x1))).to(self.fc1.weight.device)
+        e2 = torch.from_numpy(embeddings.matrix(list(x2))).to(self.fc1.weight.device)
+        return self.score_embeddings(e1, e2)
+    
+    def score_embeddings(self, e1: torch.Tensor, e2: torch.Tensor) -> torch.Tensor:
+        """Score pairs of precomputed embeddings, one row per pair."""
         # Concatenate embeddings
         combined = torch.cat((e1, e2), dim=1)
         
@@ -30,59 +36,95 @@ class SiameseNetwork(nn.Module):
         return x
 
 class QualityRanker:
-    def __init__(self):
-        self.model = SiameseNetwork()
-        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    def __init__(self, embedding_service: Optional[EmbeddingService] = None, siamese_weight: Optional[float] = None):
+        self.embedding_service = embedding_service or EmbeddingService()
+        self.model = SiameseNetwork(embedding_service=self.embedding_service)
+        self.device = default_device()
         self.model.to(self.device)
-        self.sentence_transformer = SentenceTransformer('all-MiniLM-L6-v2')
+        self.model.eval()
         
-        # Load pre-trained weights if available
+        # Load pre-trained weights if available; older checkpoints also contain the encoder
+        weights_loaded = False
         try:
-            self.model.load_state_dict(torch.load('models/quality_ranker_weights.pth'))
-            self.model.eval()
+            state_dict = torch.load('models/quality_ranker_weights.pth', map_location=self.device)
+            state_dict = {k: v for k, v in state_dict.items() if not k.startswith('embedding.')}
+            self.model.load_state_dict(state_dict)
+            weights_loaded = True
         except:
             print("No pre-trained weights found. Using untrained model.")
+        
+        # Share of the final score given to the Siamese head; an untrained head is not used
+        if siamese_weight is None:
+            siamese_weight = 0.5 if weights_loaded else 0.0
+        self.siamese_weight = siamese_weight
     
-    def rank(self, questions: List[Dict]) -> List[Dict]:
-        """Rank questions based on quality metrics."""
-        # Calculate quality scores
-        scored_questions = []
+    def rank(self, questions: List[Dict], embeddings: Optional[EmbeddingLookup] = None) -> List[Dict]:
+        """Rank questions based on quality metrics, scoring the whole batch at once."""
+        if not questions:
+            return []
+        
+        # Encode every question, answer and distractor not already embedded in one call
+        texts = []
         for q in questions:
-            quality_score = self._calculate_quality_score(q)
-            q['quality_score'] = quality_score
-            scored_questions.append(q)
+            texts.append(q['question'])
+            texts.append(q['correct_answer'])
+            texts.extend(q['distractors'])
+        if embeddings is None:
+            embeddings = self.embedding_service.embed(texts)
+        else:
+            embeddings.ensure(texts)
+        
+        # Calculate quality scores
+        with instrumentation.span("quality_ranker.score"):
+            scores = self._calculate_quality_scores(questions, embeddings)
+        for q, quality_score in zip(questions, scores.tolist()):
+            q['quality_score'] = float(quality_score)
         
         # Sort questions by quality score
-        ranked_questions = sorted(scored_questions, key=lambda x: x['quality_score'], reverse=True)
+        ranked_questions = sorted(questions, key=lambda x: x['quality_score'], reverse=True)
         
         return ranked_questions
     
-    def _calculate_quality_score(self, question: Dict) -> float:
-        """Calculate quality score for a question using multiple metrics."""
+    def _calculate_quality_scores(self, questions: List[Dict], embeddings: EmbeddingLookup) -> torch.Tensor:
+        """Calculate the quality score of every question from stacked embedding tensors."""
+        question_vectors = torch.from_numpy(embeddings.matrix([q['question'] for q in questions]))
+        answer_vectors = torch.from_numpy(embeddings.matrix([q['correct_answer'] for q in questions]))
+        
+        # Distractors padded to (questions, max distractors, dim) with a mask for the padding
+        width = max(len(q['distractors']) for q in questions)
+        distractor_vectors = torch.zeros(len(questions), max(width, 1), question_vectors.shape[1])
+        mask = torch.zeros(len(questions), max(width, 1))
+        for i, q in enumerate(questions):
+            if q['distractors']:
+                distractor_vectors[i, :len(q['distractors'])] = torch.from_numpy(embeddings.matrix(q['distractors']))
+                mask[i, :len(q['distractors'])] = 1.0
+        
         # 1. Question clarity score
-        clarity_score = self._calculate_clarity_score(question['question'])
+        clarity_scores = torch.tensor([self._calculate_clarity_score(q['question']) for q in questions])
         
         # 2. Answer distinctiveness score
-        distinctiveness_score = self._calculate_distinctiveness_score(
-            question['question'],
-            question['correct_answer'],
-            question['distractors']
-        )
+        distinctiveness_scores = self._calculate_distinctiveness_scores(answer_vectors, distractor_vectors, mask)
         
         # 3. Semantic coherence score
-        coherence_score = self._calculate_coherence_score(
-            question['question'],
-            question['correct_answer']
-        )
+        coherence_scores = self._calculate_coherence_scores(question_vectors, answer_vectors)
         
         # Combine scores with weights
-        final_score = (
-            0.4 * clarity_score +
-            0.3 * distinctiveness_score +
-            0.3 * coherence_score
+        final_scores = (
+            0.4 * clarity_scores +
+            0.3 * distinctiveness_scores +
+            0.3 * coherence_scores
         )
         
-        return final_score
+        # 4. Learned question/answer score from the Siamese head, one batched pass
+        if self.siamese_weight > 0:
+            with torch.inference_mode():
+                head_scores = self.model.score_embeddings(
+                    question_vectors.to(self.device),
+                    answer_vectors.to(self.device)
+                ).squeeze(1).cpu()
+            final_scores = (1 - self.siamese_weight) * final_scores + self.siamese_weight * head_scores
+        
+        return final_scores
     
     def _calculate_clarity_score(self, question: str) -> float:
         """Calculate how clear and well-formed the question is."""
@@ -107,27 +149,20 @@ class QualityRanker:
         
         return score
     
-    def _calculate_distinctiveness_score(self, question: str, correct_answer: str, distractors: List[str]) -> float:
-        """Calculate how distinct the correct answer is from distractors."""
-        # Get embeddings
-        correct_embedding = self.sentence_transformer.encode([correct_answer])[0]
-        distractor_embeddings = self.sentence_transformer.encode(distractors)
-        
-        # Calculate similarities
-        similarities = cosine_similarity([correct_embedding], distractor_embeddings)[0]
-        
-        # Lower similarity means higher distinctiveness
-        distinctiveness = 1 - np.mean(similarities)
+    def _calculate_distinctiveness_scores(self, answers: torch.Tensor, distractors: torch.Tensor,
+                                          mask: torch.Tensor) -> torch.Tensor:
+        """Calculate how distinct each correct answer is from its distractors."""
+        # Cosine similarity of each answer to each of its distractors
+        similarities = torch.einsum(
+            'nd,nkd->nk',
+            F.normalize(answers, dim=-1),
+            F.normalize(distractors, dim=-1)
+        )
         
-        return distinctiveness
+        # Lower mean similarity means higher distinctiveness; padding is left out of the mean
+        mean_similarity = (similarities * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1.0)
+        return 1 - mean_similarity
     
-    def _calculate_coherence_score(self, question: str, answer: str) -> float:
-        """Calculate semantic coherence between question and answer."""
-        # Get embeddings
-        question_embedding = self.sentence_transformer.encode([question])[0]
-        answer_embedding = self.sentence_transformer.encode([answer])[0]
-        
-        # Calculate similarity
-        similarity = cosine_similarity([question_embedding], [answer_embedding])[0][0]
-        
-        return similarity 
\ No newline at end of file
+    def _calculate_coherence_scores(self, questions: torch.Tensor, answers: torch.Tensor) -> torch.Tensor:
+        """Calculate semantic coherence between each question and its answer."""
+        return F.cosine_similarity(questions, answers, dim=-1)
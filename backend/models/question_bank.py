@@ -0,0 +1,281 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import hnswlib
+except ImportError:  # optional; the brute-force index is used instead
+    hnswlib = None
+
+from models.difficulty_adjuster import DifficultyAdjuster
+from models.embedding_service import EmbeddingLookup, EmbeddingService
+from models.instrumentation import instrumentation
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS questions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    question_id TEXT NOT NULL UNIQUE,
+    question TEXT NOT NULL,
+    correct_answer TEXT NOT NULL,
+    distractors TEXT NOT NULL,
+    quality_score REAL NOT NULL,
+    difficulty TEXT NOT NULL,
+    embedding BLOB NOT NULL,
+    created_at TEXT NOT NULL
+);
+"""
+
+
+def question_id_for(question: str, answer: str) -> str:
+    """Stable id from the question and its answer, so regenerated duplicates collapse."""
+    return hashlib.sha256(f"{question}\0{answer}".encode("utf-8")).hexdigest()[:16]
+
+
+class VectorIndex:
+    """Inner-product search over unit vectors: HNSW when hnswlib is installed, else a NumPy matrix."""
+
+    def __init__(self, dimension: int, use_hnsw: Optional[bool] = None, initial_capacity: int = 1024):
+        self.dimension = dimension
+        self.use_hnsw = hnswlib is not None if use_hnsw is None else use_hnsw and hnswlib is not None
+        self._count = 0
+
+        if self.use_hnsw:
+            self._hnsw = hnswlib.Index(space="ip", dim=dimension)
+            self._hnsw.init_index(max_elements=initial_capacity, ef_construction=200, M=16)
+            self._hnsw.set_ef(64)
+        else:
+            self._matrix = np.zeros((initial_capacity, dimension), dtype=np.float32)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def add(self, vectors: np.ndarray) -> np.ndarray:
+        """Append unit vectors and return their rows."""
+        rows = np.arange(self._count, self._count + len(vectors))
+        needed = self._count + len(vectors)
+        if self.use_hnsw:
+            if needed > self._hnsw.get_max_elements():
+                self._hnsw.resize_index(max(needed, 2 * self._hnsw.get_max_elements()))
+            self._hnsw.add_items(vectors, rows)
+        else:
+            if needed > len(self._matrix):
+                grown = np.zeros((max(needed, 2 * len(self._matrix)), self.dimension), dtype=np.float32)
+                grown[:self._count] = self._matrix[:self._count]
+                self._matrix = grown
+            self._matrix[self._count:needed] = vectors
+        self._count = needed
+        return rows
+
+    def search(self, vector: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (rows, similarities) of the k nearest vectors, most similar first."""
+        k = min(k, self._count)
+        if k == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        if self.use_hnsw:
+            labels, distances = self._hnsw.knn_query(vector, k=k)
+            return labels[0].astype(np.int64), 1.0 - distances[0]
+
+        similarities = self._matrix[:self._count] @ vector
+        best = np.argpartition(-similarities, k - 1)[:k]
+        best = best[np.argsort(-similarities[best])]
+        return best, similarities[best]
+
+
+class QuestionBank:
+    """Every generated question with its distractors, score and embedding, searchable by topic.
+
+    Questions are persisted in SQLite and mirrored into an in-memory vector index,
+    so retrieving questions for a passage is one embedding call plus one search.
+    Each worker process picks up questions added by the others on refresh.
+    """
+
+    def __init__(
+        self,
+        path: str = "models/question_bank.db",
+        embedding_service: Optional[EmbeddingService] = None,
+        difficulty_adjuster: Optional[DifficultyAdjuster] = None,
+        min_similarity: float = 0.5,
+        min_quality: float = 0.0,
+        candidate_factor: int = 10,
+        refresh_interval_s: float = 30.0,
+        use_hnsw: Optional[bool] = None
+    ):
+        self.path = path
+        self.embedding_service = embedding_service or EmbeddingService()
+        self.difficulty_adjuster = difficulty_adjuster
+        self.min_similarity = min_similarity
+        self.min_quality = min_quality
+        self.candidate_factor = candidate_factor
+        self.refresh_interval = refresh_interval_s
+        self.use_hnsw = use_hnsw
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30.0, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+        # Built on first use, since the dimension comes from the embedding model
+        self._index: Optional[VectorIndex] = None
+        self._records: List[Dict] = []
+        self._known_ids = set()
+        self._last_row = 0
+        self._last_refresh: Optional[float] = None
+
+        # Metrics
+        self.retrievals = 0
+        self.questions_served = 0
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def add(self, questions: List[Dict], embeddings: Optional[EmbeddingLookup] = None) -> List[Dict]:
+        """Store scored questions, setting their question_id; questions already in the bank are skipped."""
+        if not questions:
+            return questions
+        if embeddings is None:
+            embeddings = self.embedding_service.embed(q["question"] for q in questions)
+        vectors = self._normalize(embeddings.matrix([q["question"] for q in questions]))
+
+        now = datetime.now().isoformat()
+        rows = []
+        for q, vector in zip(questions, vectors):
+            q["question_id"] = question_id_for(q["question"], q["correct_answer"])
+            rows.append((
+                q["question_id"],
+                q["question"],
+                q["correct_answer"],
+                json.dumps(q.get("distractors", [])),
+                float(q.get("quality_score", 0.0)),
+                q.get("difficulty", "medium"),
+                vector.astype(np.float32).tobytes(),
+                now
+            ))
+
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO questions (question_id, question, correct_answer, distractors, "
+                "quality_score, difficulty, embedding, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            self._load_new_rows()
+
+        # Track the new questions so feedback on them updates their difficulty
+        if self.difficulty_adjuster is not None:
+            for q in questions:
+                self.difficulty_adjuster.add_question(q["question_id"], q.get("difficulty", "medium"))
+        return questions
+
+    def retrieve(self, text: str, k: int, target_difficulty: Optional[str] = None,
+                 exclude: Optional[List[str]] = None) -> List[Dict]:
+        """Return up to k stored questions relevant to text, preferring the target difficulty."""
+        self._maybe_refresh()
+        with self._lock:
+            self.retrievals += 1
+            if self._index is None or len(self._index) == 0 or k <= 0:
+                return []
+
+        vector = self._normalize(self.embedding_service.encode_unique([text])[text][None, :])[0]
+        with self._lock, instrumentation.span("question_bank.search"):
+            rows, similarities = self._index.search(vector, k * self.candidate_factor)
+        records = self._records
+
+        excluded = set(exclude or ())
+        candidates = [
+            records[row] for row, similarity in zip(rows, similarities)
+            if similarity >= self.min_similarity
+            and records[row]["quality_score"] >= self.min_quality
+            and records[row]["question_id"] not in excluded
+        ]
+        if not candidates:
+            return []
+
+        if target_difficulty is not None and self.difficulty_adjuster is not None:
+            # Thompson-sample the relevant questions whose success rate matches the target
+            chosen = self.difficulty_adjuster.select_questions(
+                target_difficulty, k, [c["question_id"] for c in candidates]
+            )
+            by_id = {c["question_id"]: c for c in candidates}
+            selected = [by_id[qid] for qid in chosen]
+            if len(selected) < k:
+                # Questions the adjuster does not track yet still count as relevant
+                taken = set(chosen)
+                selected.extend(c for c in candidates if c["question_id"] not in taken)
+                selected = selected[:k]
+        else:
+            selected = candidates[:k]
+
+        with self._lock:
+            self.questions_served += len(selected)
+        return [{**record, "distractors": list(record["distractors"])} for record in selected]
+
+    def refresh(self):
+        """Load questions other worker processes have added since the last refresh."""
+        with self._lock:
+            self._load_new_rows()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "questions": len(self._records),
+                "index": "hnsw" if self._index is not None and self._index.use_hnsw else "brute_force",
+                "retrievals": self.retrievals,
+                "questions_served": self.questions_served,
+            }
+
+    def close(self):
+        self._conn.close()
+
+    def _maybe_refresh(self):
+        if self._last_refresh is None or time.monotonic() - self._last_refresh > self.refresh_interval:
+            self.refresh()
+
+    def _load_new_rows(self):
+        """Append rows past the last one seen to the in-memory index (lock held)."""
+        self._last_refresh = time.monotonic()
+        rows = self._conn.execute(
+            "SELECT id, question_id, question, correct_answer, distractors, quality_score, difficulty, embedding "
+            "FROM questions WHERE id > ? ORDER BY id",
+            (self._last_row,)
+        ).fetchall()
+        if not rows:
+            return
+
+        records, vectors = [], []
+        for row_id, qid, question, answer, distractors, quality_score, difficulty, embedding in rows:
+            self._last_row = max(self._last_row, row_id)
+            if qid in self._known_ids:
+                continue
+            self._known_ids.add(qid)
+            records.append({
+                "question_id": qid,
+                "question": question,
+                "correct_answer": answer,
+                "distractors": json.loads(distractors),
+                "quality_score": quality_score,
+                "difficulty": difficulty,
+            })
+            vectors.append(np.frombuffer(embedding, dtype=np.float32))
+        if not records:
+            return
+
+        if self._index is None:
+            self._index = VectorIndex(len(vectors[0]), use_hnsw=self.use_hnsw)
+        self._index.add(np.stack(vectors))
+        self._records.extend(records)
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
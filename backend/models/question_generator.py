@@ -1,16 +1,58 @@
 from transformers import GPT2LMHeadModel, GPT2Tokenizer
 import torch
-from typing import List, Dict
+from typing import List, Dict, Optional
+import itertools
 import json
 import random
+import threading
+import weakref
+
+from models.batching import BatchScheduler
+from models.backends import inference_device, load_model
+from models.instrumentation import instrumentation
+from models.preprocessing import preprocessor
+from models.registry import registry
+
+MODEL_NAME = "gpt2-medium"
+
+def _load_tokenizer() -> GPT2Tokenizer:
+    tokenizer = GPT2Tokenizer.from_pretrained(MODEL_NAME)
+    # GPT-2 has no pad token; pad on the left so generation continues from the prompt
+    tokenizer.pad_token = tokenizer.eos_token
+    tokenizer.padding_side = "left"
+    return tokenizer
+
+registry.register(MODEL_NAME, lambda: load_model(GPT2LMHeadModel, MODEL_NAME))
+registry.register(f"{MODEL_NAME}:tokenizer", _load_tokenizer)
 
 class QuestionGenerator:
-    def __init__(self):
-        self.model_name = "gpt2-medium"
-        self.tokenizer = GPT2Tokenizer.from_pretrained(self.model_name)
-        self.model = GPT2LMHeadModel.from_pretrained(self.model_name)
-        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        self.model.to(self.device)
+    def __init__(self, max_batch_size: int = 8, max_wait_ms: float = 10.0):
+        self.model_name = MODEL_NAME
+        self.device = inference_device()
+        
+        # Sampling settings; also part of the result cache key
+        self.generation_kwargs = {
+            "max_new_tokens": 100,
+            "temperature": 0.7,
+            "top_p": 0.9,
+            "do_sample": True
+        }
+        
+        # Cheaper settings served under load (see app.budget), best first; with
+        # stop_at_question_mark a sample ends at its first "?". Also part of the result cache key
+        self.quality_tiers = {
+            "full": {},
+            "reduced": {"max_new_tokens": 48, "stop_at_question_mark": True},
+            "fast": {"max_new_tokens": 24, "stop_at_question_mark": True}
+        }
+        
+        # Prompts from concurrent requests are generated together in padded batches
+        self.scheduler = BatchScheduler(
+            self._generate_batch,
+            max_batch_size=max_batch_size,
+            max_wait_ms=max_wait_ms,
+            name="question-generator"
+        )
         
         # Few-shot examples for question generation
         self.few_shot_examples = [
@@ -25,50 +67,68 @@ class QuestionGenerator:
                 "answer": "86 billion"
             }
         ]
+        
+        # Seeded requests get a batch of their own so their samples do not depend on other traffic
+        self._seeded_groups = itertools.count()
+        
+        # The instruction and examples are the same for every prompt: their GPT-2 keys and
+        # values are computed once per loaded model and shared by every row of every batch
+        self.prompt_prefix = self._create_prefix()
+        self._prefix_cache = None
+        self._prefix_lock = threading.Lock()
+        self._question_mark_ids = None
     
-    def _create_prompt(self, text: str) -> str:
-        """Create a prompt with few-shot examples."""
-        prompt = "Generate a multiple-choice question from the following text:\n\n"
+    @property
+    def model(self):
+        return registry.get(self.model_name)
+    
+    @property
+    def tokenizer(self):
+        return registry.get(f"{self.model_name}:tokenizer")
+    
+    def _create_prefix(self) -> str:
+        """Create the instruction and few-shot examples that start every prompt."""
+        prefix = "Generate a multiple-choice question from the following text:\n\n"
         
         # Add few-shot examples
         for example in self.few_shot_examples:
-            prompt += f"Text: {example['text']}\n"
-            prompt += f"Question: {example['question']}\n"
-            prompt += f"Answer: {example['answer']}\n\n"
-        
-        # Add the target text
-        prompt += f"Text: {text}\n"
-        prompt += "Question:"
-        return prompt
+            prefix += f"Text: {example['text']}\n"
+            prefix += f"Question: {example['question']}\n"
+            prefix += f"Answer: {example['answer']}\n\n"
+        
+        # Split before the last newline: GPT-2 tokenizes "\n\n" at the end of a string as one
+        # token but as two before more text, so this keeps the tokens of prefix + suffix
+        # identical to those of the whole prompt
+        return prefix[:-1]
     
-    def generate(self, text: str, num_questions: int = 3) -> List[Dict]:
-        """Generate multiple-choice questions from the given text."""
-        questions = []
+    def _create_prompt(self, text: str) -> str:
+        """Create the part of the prompt that follows the shared prefix."""
+        return f"\nText: {text}\nQuestion:"
+    
+    def generate(self, text: str, num_questions: int = 3, seed: Optional[int] = None,
+                 quality_tier: str = "full") -> List[Dict]:
+        """Generate multiple-choice questions from the given text.
         
-        for _ in range(num_questions):
-            # Create prompt
-            prompt = self._create_prompt(text)
-            
-            # Tokenize and generate
-            inputs = self.tokenizer.encode(
-                prompt,
-                return_tensors="pt",
-                max_length=512,
-                truncation=True
-            ).to(self.device)
-            
-            # Generate question
-            output = self.model.generate(
-                inputs,
-                max_length=100,
-                num_return_sequences=1,
-                temperature=0.7,
-                top_p=0.9,
-                do_sample=True
-            )
-            
-            # Decode and process output
-            generated_text = self.tokenizer.decode(output[0], skip_special_tokens=True)
+        With a seed, sampling and the initial difficulty labels are reproducible.
+        """
+        # Each sample is queued separately so it can share a batch with other requests of
+        # the same quality tier; identical texts in a batch are prefilled once
+        with instrumentation.span("question_generator.generate"):
+            if seed is None:
+                group = None if quality_tier == "full" else quality_tier
+                generated_texts = self.scheduler.run([(text, None, quality_tier)] * num_questions, group=group)
+                rng = random
+            else:
+                group = ("seeded", next(self._seeded_groups))
+                # A batch is seeded from its first item, so each item gets its own seed: when
+                # the samples span several batches, the later ones do not repeat the first
+                generated_texts = self.scheduler.run(
+                    [(text, seed + i, quality_tier) for i in range(num_questions)], group=group
+                )
+                rng = random.Random(seed)
+        
+        questions = []
+        for generated_text in generated_texts:
             question = generated_text.split("Question:")[-1].strip()
             
             # Extract answer (this is a simplified version - in practice, you'd want more robust extraction)
@@ -77,11 +137,180 @@ class QuestionGenerator:
             questions.append({
                 "question": question,
                 "correct_answer": answer,
-                "difficulty": random.choice(["easy", "medium", "hard"])
+                "difficulty": rng.choice(["easy", "medium", "hard"])
             })
         
         return questions
     
+    def _generate_batch(self, items: List[tuple]) -> List[str]:
+        """Sample one continuation per (text, seed, quality_tier) item in a single padded generate call.
+        
+        The shared prefix comes from the per-model cache and each distinct text is
+        prefilled once, so a request's samples only pay for their own new tokens. Rows are
+        laid out as [prefix][padding][prompt] with the padding masked out, which gives every
+        token the position it has in the unpadded prompt.
+        """
+        model, tokenizer = self.model, self.tokenizer
+        if not isinstance(model, torch.nn.Module):
+            # ONNX Runtime models manage their own cache; prefill every row
+            return self._generate_batch_uncached(items)
+        
+        texts = [text for text, _, _ in items]
+        # Seeded items are never batched with other requests, and tiers are never mixed;
+        # the batch samples from the seed of its first item
+        _, seed, quality_tier = items[0]
+        distinct = list(dict.fromkeys(texts))
+        rows = torch.tensor([distinct.index(text) for text in texts], device=self.device)
+        
+        prefix_ids, prefix_past = self._prefix_state(model, tokenizer)
+        prefix_length = prefix_ids.shape[1]
+        with instrumentation.span("question_generator.tokenize"):
+            inputs = self._encode_prompts(tokenizer, distinct, max_length=512 - prefix_length)
+        
+        count = len(distinct)
+        input_ids = torch.cat([prefix_ids.expand(count, -1), inputs["input_ids"]], dim=1)
+        attention_mask = torch.cat([torch.ones_like(prefix_ids).expand(count, -1), inputs["attention_mask"]], dim=1)
+        position_ids = (attention_mask.cumsum(-1) - 1).masked_fill(attention_mask == 0, 1)
+        
+        # Generate questions; max_new_tokens keeps the budget per row independent of padding.
+        # A seeded batch draws from a forked RNG so the global generator is left untouched.
+        devices = [self.device] if self.device.type == "cuda" else []
+        with instrumentation.span("question_generator.sample"), torch.no_grad(), \
+                torch.random.fork_rng(devices=devices, enabled=seed is not None):
+            if seed is not None:
+                torch.manual_seed(seed)
+            
+            # Prefill every distinct prompt but its last token on top of the prefix,
+            # then give each sample its own copy of the cache; generate feeds the last token
+            past = model(
+                input_ids=input_ids[:, prefix_length:-1],
+                attention_mask=attention_mask[:, :-1],
+                position_ids=position_ids[:, prefix_length:-1],
+                past_key_values=tuple((k.expand(count, -1, -1, -1), v.expand(count, -1, -1, -1)) for k, v in prefix_past),
+                use_cache=True
+            ).past_key_values
+            outputs = model.generate(
+                input_ids.index_select(0, rows),
+                attention_mask=attention_mask.index_select(0, rows),
+                past_key_values=tuple((k.index_select(0, rows), v.index_select(0, rows)) for k, v in past),
+                num_return_sequences=1,
+                pad_token_id=tokenizer.eos_token_id,
+                **self.tier_generation_kwargs(quality_tier, tokenizer)
+            )
+        
+        prompt_length = input_ids.shape[1]
+        prefilled = int(inputs["attention_mask"].sum())
+        instrumentation.count("pipeline_tokens_total", prefilled, model="gpt2", kind="prompt")
+        instrumentation.count(
+            "pipeline_tokens_total",
+            prefix_length * len(items) + int(inputs["attention_mask"][rows].sum()) - prefilled,
+            model="gpt2",
+            kind="prompt_cached"
+        )
+        instrumentation.count("pipeline_tokens_total", (outputs.shape[1] - prompt_length) * len(items), model="gpt2", kind="generated")
+        # The prefix is not decoded; the text still ends with "Question:" and the sample
+        return tokenizer.batch_decode(outputs[:, prefix_length:], skip_special_tokens=True)
+    
+    def _generate_batch_uncached(self, items: List[tuple]) -> List[str]:
+        """Sample one continuation per (text, seed, quality_tier) item, prefilling the full prompt of every row."""
+        prompts = [self.prompt_prefix + self._create_prompt(text) for text, _, _ in items]
+        _, seed, quality_tier = items[0]
+        
+        with instrumentation.span("question_generator.tokenize"):
+            inputs = self.tokenizer(
+                prompts,
+                return_tensors="pt",
+                padding=True,
+                max_length=512,
+                truncation=True
+            ).to(self.device)
+        
+        devices = [self.device] if self.device.type == "cuda" else []
+        with instrumentation.span("question_generator.sample"), torch.no_grad(), \
+                torch.random.fork_rng(devices=devices, enabled=seed is not None):
+            if seed is not None:
+                torch.manual_seed(seed)
+            outputs = self.model.generate(
+                inputs["input_ids"],
+                attention_mask=inputs["attention_mask"],
+                num_return_sequences=1,
+                pad_token_id=self.tokenizer.eos_token_id,
+                **self.tier_generation_kwargs(quality_tier, self.tokenizer)
+            )
+        
+        prompt_length = inputs["input_ids"].shape[1]
+        instrumentation.count("pipeline_tokens_total", int(inputs["attention_mask"].sum()), model="gpt2", kind="prompt")
+        instrumentation.count("pipeline_tokens_total", (outputs.shape[1] - prompt_length) * len(items), model="gpt2", kind="generated")
+        return self.tokenizer.batch_decode(outputs, skip_special_tokens=True)
+    
+    def tier_generation_kwargs(self, quality_tier: str, tokenizer) -> dict:
+        """The generate() settings of a quality tier."""
+        overrides = dict(self.quality_tiers[quality_tier])
+        if overrides.pop("stop_at_question_mark", False):
+            # Every token ending in "?" finishes its row like the end-of-text token
+            overrides["eos_token_id"] = [tokenizer.eos_token_id] + self._question_mark_token_ids(tokenizer)
+        return dict(self.generation_kwargs, **overrides)
+    
+    def _question_mark_token_ids(self, tokenizer) -> List[int]:
+        cached = self._question_mark_ids
+        if cached is None or cached[0]() is not tokenizer:
+            # Byte-level BPE keeps printable ASCII as is, so "?" is spelled the same in the vocabulary
+            ids = sorted(i for token, i in tokenizer.get_vocab().items() if token.endswith("?"))
+            cached = self._question_mark_ids = (weakref.ref(tokenizer), ids)
+        return cached[1]
+    
+    def _encode_prompts(self, tokenizer, texts: List[str], max_length: int) -> dict:
+        """Left-padded token ids of the prompt of each text, truncated to max_length.
+        
+        Equivalent to tokenizing the prompts, but the text is segmented once and only
+        sentences the cache has not seen are tokenized.
+        """
+        name = f"{self.model_name}:tokenizer"
+        # The space after "Text:" belongs to the first token of the text
+        head, tail = self._create_prompt("\0").split("\0")
+        head_ids, tail_ids = preprocessor.token_ids(name, tokenizer, [head.rstrip(" "), tail], leading_space=False)
+        
+        rows = []
+        for text in texts:
+            try:
+                document = preprocessor.segment(text)
+            except LookupError:
+                # No punkt sentence model (e.g. offline); prompts never needed it
+                document = None
+            if document is not None and document.sentences and document.joined() == text:
+                # The text follows "Text: ", so every sentence is tokenized after a space
+                text_ids = preprocessor.encode_joined(name, tokenizer, document.sentences, leading_space=True)
+            else:
+                # Whitespace that segmentation would not reproduce; tokenize the text as is
+                text_ids = preprocessor.token_ids(name, tokenizer, [text])[0]
+            rows.append((head_ids + text_ids + tail_ids)[:max_length])
+        
+        width = max(len(ids) for ids in rows)
+        input_ids = torch.full((len(rows), width), tokenizer.pad_token_id, dtype=torch.long)
+        attention_mask = torch.zeros((len(rows), width), dtype=torch.long)
+        for i, ids in enumerate(rows):
+            input_ids[i, width - len(ids):] = torch.tensor(ids)
+            attention_mask[i, width - len(ids):] = 1
+        return {"input_ids": input_ids.to(self.device), "attention_mask": attention_mask.to(self.device)}
+    
+    def _prefix_state(self, model, tokenizer) -> tuple:
+        """Token ids and past key values of the shared prefix, computed once per loaded model."""
+        cached = self._prefix_cache
+        if cached is not None and cached[0]() is model:
+            return cached[1], cached[2]
+        
+        with self._prefix_lock:
+            cached = self._prefix_cache
+            if cached is not None and cached[0]() is model:
+                return cached[1], cached[2]
+            prefix_ids = tokenizer(self.prompt_prefix, return_tensors="pt")["input_ids"].to(self.device)
+            with torch.no_grad():
+                past = model(input_ids=prefix_ids, use_cache=True).past_key_values
+            instrumentation.count("pipeline_tokens_total", prefix_ids.shape[1], model="gpt2", kind="prompt")
+            # A weak reference, so the cache does not keep an evicted model alive
+            self._prefix_cache = (weakref.ref(model), prefix_ids, past)
+            return prefix_ids, past
+    
     def _extract_answer(self, question: str) -> str:
         """Extract the answer from the generated question."""
         # This is a simplified version - in practice, you'd want more robust extraction
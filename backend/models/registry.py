@@ -0,0 +1,147 @@
+import gc
+import itertools
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import torch
+
+
+def default_device() -> torch.device:
+    return torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+
+def _current_rss() -> int:
+    """Resident set size of this process in bytes (0 where /proc is unavailable)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+
+
+def _tensor_bytes(obj: Any) -> Optional[int]:
+    """Bytes held by the parameters and buffers of a torch module, if obj is one."""
+    if isinstance(obj, torch.nn.Module):
+        tensors = itertools.chain(obj.parameters(), obj.buffers())
+        return sum(t.numel() * t.element_size() for t in tensors)
+    return None
+
+
+class _Entry:
+    def __init__(self, loader: Callable[[], Any], evictable: bool):
+        self.loader = loader
+        self.evictable = evictable
+        self.obj = None
+        self.lock = threading.Lock()
+        self.last_used = 0.0
+        self.load_seconds = 0.0
+        self.rss_delta = 0
+        self.loads = 0
+
+
+class ModelRegistry:
+    """Process-wide cache that loads each model once, on first use, and shares it by name."""
+
+    def __init__(self):
+        self._entries: Dict[str, _Entry] = {}
+        self._lock = threading.Lock()
+        self._eviction_thread = None
+
+    def register(self, name: str, loader: Callable[[], Any], evictable: bool = True):
+        """Register a loader; re-registering a name replaces the loader and drops the loaded object."""
+        with self._lock:
+            self._entries[name] = _Entry(loader, evictable)
+
+    def get(self, name: str) -> Any:
+        """Return the shared object for name, loading it if needed."""
+        entry = self._entries[name]
+        entry.last_used = time.monotonic()
+        obj = entry.obj
+        if obj is not None:
+            return obj
+
+        with entry.lock:
+            if entry.obj is None:
+                rss_before = _current_rss()
+                start = time.perf_counter()
+                entry.obj = entry.loader()
+                entry.load_seconds = time.perf_counter() - start
+                entry.rss_delta = max(_current_rss() - rss_before, 0)
+                entry.loads += 1
+            return entry.obj
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._entries and self._entries[name].obj is not None
+
+    def names(self) -> List[str]:
+        return list(self._entries)
+
+    def preload(self, names: Optional[Iterable[str]] = None):
+        """Load the given models (default: all registered) up front."""
+        for name in (names if names is not None else self.names()):
+            self.get(name)
+
+    def prepare_for_fork(self, names: Optional[Iterable[str]] = None):
+        """Load models in the parent so forked workers share their pages copy-on-write.
+
+        gc.freeze() moves everything allocated so far into a permanent generation,
+        so the collector in the children never writes to those objects and the
+        pages holding them stay shared.
+        """
+        self.preload(names)
+        gc.collect()
+        gc.freeze()
+
+    def evict(self, name: str) -> bool:
+        """Drop the loaded object for name; returns whether anything was evicted."""
+        entry = self._entries[name]
+        with entry.lock:
+            if entry.obj is None:
+                return False
+            entry.obj = None
+        gc.collect()
+        return True
+
+    def evict_idle(self, max_idle_seconds: float) -> List[str]:
+        """Evict evictable models that have not been used for max_idle_seconds."""
+        now = time.monotonic()
+        evicted = []
+        for name, entry in list(self._entries.items()):
+            if entry.evictable and entry.obj is not None and now - entry.last_used > max_idle_seconds:
+                if self.evict(name):
+                    evicted.append(name)
+        return evicted
+
+    def start_idle_eviction(self, max_idle_seconds: float, interval: float = 60.0):
+        """Evict idle models periodically from a background thread."""
+        if self._eviction_thread is not None:
+            return
+
+        def loop():
+            while True:
+                time.sleep(interval)
+                self.evict_idle(max_idle_seconds)
+
+        self._eviction_thread = threading.Thread(target=loop, name="model-eviction", daemon=True)
+        self._eviction_thread.start()
+
+    def memory_report(self) -> Dict:
+        """Per-model memory: tensor bytes and the RSS growth observed while loading."""
+        models = {}
+        for name, entry in self._entries.items():
+            obj = entry.obj
+            models[name] = {
+                "loaded": obj is not None,
+                "tensor_bytes": _tensor_bytes(obj) if obj is not None else None,
+                "rss_delta_bytes": entry.rss_delta if entry.loads else None,
+                "load_seconds": round(entry.load_seconds, 3),
+                "loads": entry.loads,
+                "idle_seconds": round(time.monotonic() - entry.last_used, 1) if entry.last_used else None,
+            }
+        return {"process_rss_bytes": _current_rss(), "models": models}
+
+
+# Shared by every component in the process
+registry = ModelRegistry()
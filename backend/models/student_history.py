@@ -0,0 +1,240 @@
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# Per-attempt columns and per-student counters, with their dtypes
+_ATTEMPT_COLUMNS = {"student": np.int32, "question": np.int32, "correct": np.bool_, "timestamp": np.int64}
+_STUDENT_COLUMNS = {"attempts": np.int32, "successes": np.int32, "recent": np.float32}
+
+
+class StudentHistory:
+    """Student attempts in flat NumPy columns, with running counts per student.
+
+    Student and question ids map to integer rows, so an attempt takes 17 bytes: two
+    int32 ids, a bool outcome and an int64 timestamp in milliseconds. Each student's
+    attempts, successes and exponentially weighted recent accuracy are updated as
+    attempts arrive, so reading them is O(1). With a retention window, older attempts
+    are dropped and subtracted from the counts.
+
+    Attempts are applied in the order of their store row ids, and rows at or below
+    last_id are skipped, so the history can be synced from the store repeatedly.
+    """
+
+    def __init__(self, retention_s: float = 0.0, recent_weight: float = 0.1, initial_capacity: int = 4096):
+        self.retention_s = retention_s
+        self.recent_weight = recent_weight
+        self.last_id = 0
+
+        self._attempts = {name: np.zeros(initial_capacity, dtype=dtype) for name, dtype in _ATTEMPT_COLUMNS.items()}
+        self._students = {name: np.zeros(initial_capacity, dtype=dtype) for name, dtype in _STUDENT_COLUMNS.items()}
+        self._length = 0
+        self._student_index: Dict[str, int] = {}
+        self._student_ids: List[str] = []
+        self._question_index: Dict[str, int] = {}
+        self._question_ids: List[str] = []
+        self._lock = threading.Lock()
+
+        # Metrics
+        self.expired = 0
+
+    def __len__(self) -> int:
+        return self._length
+
+    def append(self, rows: Iterable[Tuple[int, str, str, bool, int]]) -> int:
+        """Apply (row_id, student_id, question_id, correct, timestamp_ms) rows in order; returns how many were new."""
+        with self._lock:
+            rows = [row for row in rows if row[0] > self.last_id]
+            if not rows:
+                return 0
+            self._reserve(self._length + len(rows))
+            students = np.fromiter((self._student_row(row[1]) for row in rows), dtype=np.int32, count=len(rows))
+            correct = np.fromiter((row[3] for row in rows), dtype=np.bool_, count=len(rows))
+            span = slice(self._length, self._length + len(rows))
+            self._attempts["student"][span] = students
+            self._attempts["question"][span] = [self._question_row(row[2]) for row in rows]
+            self._attempts["correct"][span] = correct
+            self._attempts["timestamp"][span] = [row[4] for row in rows]
+            self._update_counts(students, correct)
+            self._length += len(rows)
+            self.last_id = rows[-1][0]
+            return len(rows)
+
+    def accuracy(self, student_id: str) -> Optional[Dict]:
+        """The student's attempts and accuracy in the retention window, and recent accuracy; None if unknown."""
+        row = self._student_index.get(student_id)
+        if row is None:
+            return None
+        with self._lock:
+            attempts = int(self._students["attempts"][row])
+            successes = int(self._students["successes"][row])
+            recent = float(self._students["recent"][row])
+        return {
+            "attempts": attempts,
+            "accuracy": successes / attempts if attempts else None,
+            "recent_accuracy": recent,
+        }
+
+    def expire(self, now_ms: Optional[int] = None) -> int:
+        """Drop attempts older than the retention window and return how many were dropped."""
+        if self.retention_s <= 0:
+            return 0
+        now_ms = now_ms if now_ms is not None else int(time.time() * 1000)
+        cutoff = now_ms - int(self.retention_s * 1000)
+        with self._lock:
+            n = self._length
+            old = self._attempts["timestamp"][:n] < cutoff
+            dropped = int(old.sum())
+            if dropped == 0:
+                return 0
+            students = self._attempts["student"][:n][old]
+            size = len(self._student_ids)
+            self._students["attempts"][:size] -= np.bincount(students, minlength=size).astype(np.int32)
+            self._students["successes"][:size] -= np.bincount(
+                students, weights=self._attempts["correct"][:n][old], minlength=size
+            ).astype(np.int32)
+            # Compact the kept attempts to the front, in order
+            keep = ~old
+            for name, column in self._attempts.items():
+                column[:n - dropped] = column[:n][keep]
+            self._length = n - dropped
+            self.expired += dropped
+            return dropped
+
+    def save(self, directory: str):
+        """Write a snapshot that load() maps back into memory, replacing the previous one.
+
+        Each snapshot is written to a new subdirectory and then named in CURRENT, so
+        readers and concurrent writers only ever see a complete snapshot.
+        """
+        os.makedirs(directory, exist_ok=True)
+        snapshot = uuid.uuid4().hex
+        target = os.path.join(directory, snapshot)
+        os.makedirs(target)
+        with self._lock:
+            # Columns keep their spare capacity, so appends after load() stay in the mapping
+            for name, column in {**self._attempts, **self._students}.items():
+                np.save(os.path.join(target, f"{name}.npy"), column)
+            meta = {
+                "length": self._length,
+                "last_id": self.last_id,
+                "students": self._student_ids,
+                "questions": self._question_ids,
+            }
+        with open(os.path.join(target, "meta.json"), "w") as f:
+            json.dump(meta, f)
+
+        current = os.path.join(directory, "CURRENT")
+        previous = self._current_snapshot(directory)
+        with open(f"{current}.{snapshot}", "w") as f:
+            f.write(snapshot)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(f"{current}.{snapshot}", current)
+        if previous is not None:
+            shutil.rmtree(os.path.join(directory, previous), ignore_errors=True)
+
+    def load(self, directory: str) -> bool:
+        """Map the latest snapshot in copy-on-write mode; returns False if there is none.
+
+        Pages are read from the file as they are touched and only the ones written to
+        are copied, so a large history costs little memory until it is used.
+        """
+        snapshot = self._current_snapshot(directory)
+        if snapshot is None:
+            return False
+        source = os.path.join(directory, snapshot)
+        try:
+            with open(os.path.join(source, "meta.json")) as f:
+                meta = json.load(f)
+            attempts = {name: np.load(os.path.join(source, f"{name}.npy"), mmap_mode="c") for name in _ATTEMPT_COLUMNS}
+            students = {name: np.load(os.path.join(source, f"{name}.npy"), mmap_mode="c") for name in _STUDENT_COLUMNS}
+        except (OSError, ValueError):
+            return False
+
+        with self._lock:
+            self._attempts = attempts
+            self._students = students
+            self._length = meta["length"]
+            self.last_id = meta["last_id"]
+            self._student_ids = meta["students"]
+            self._student_index = {student_id: row for row, student_id in enumerate(self._student_ids)}
+            self._question_ids = meta["questions"]
+            self._question_index = {question_id: row for row, question_id in enumerate(self._question_ids)}
+        return True
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "attempts": self._length,
+                "students": len(self._student_ids),
+                "questions": len(self._question_ids),
+                "capacity": len(self._attempts["student"]),
+                "expired": self.expired,
+                "bytes": sum(c.nbytes for c in self._attempts.values()) + sum(c.nbytes for c in self._students.values()),
+            }
+
+    def _update_counts(self, students: np.ndarray, correct: np.ndarray):
+        """Add new outcomes, in order, to the counts and recent accuracy of their students (lock held).
+
+        After k outcomes x_1..x_k, recent accuracy r becomes (1-w)^k r + sum_j w (1-w)^(k-j) x_j,
+        so the whole batch is applied at once.
+        """
+        size = len(self._student_ids)
+        counts = np.bincount(students, minlength=size)
+        self._students["attempts"][:size] += counts.astype(np.int32)
+        self._students["successes"][:size] += np.bincount(students, weights=correct, minlength=size).astype(np.int32)
+
+        # Position of each outcome among its student's new outcomes, counted from the last
+        order = np.argsort(students, kind="stable")
+        starts = np.cumsum(counts) - counts
+        rank = np.empty(len(students), dtype=np.int64)
+        rank[order] = np.arange(len(students)) - starts[students[order]]
+        decay = 1.0 - self.recent_weight
+        weights = self.recent_weight * decay ** (counts[students] - 1 - rank)
+        recent = self._students["recent"]
+        recent[:size] = decay ** counts * recent[:size] + np.bincount(students, weights=weights * correct, minlength=size)
+
+    def _reserve(self, length: int):
+        """Double the attempt columns until length fits (lock held)."""
+        capacity = len(self._attempts["student"])
+        if length <= capacity:
+            return
+        while capacity < length:
+            capacity *= 2
+        for name, column in self._attempts.items():
+            grown = np.zeros(capacity, dtype=column.dtype)
+            grown[:self._length] = column[:self._length]
+            self._attempts[name] = grown
+
+    def _student_row(self, student_id: str) -> int:
+        """The row of a student, adding one with a neutral recent accuracy if needed (lock held)."""
+        row = self._student_index.get(student_id)
+        if row is None:
+            row = self._student_index[student_id] = len(self._student_ids)
+            self._student_ids.append(student_id)
+            if row == len(self._students["attempts"]):
+                for name, column in self._students.items():
+                    self._students[name] = np.concatenate([column, np.zeros_like(column)])
+            self._students["recent"][row] = 0.5
+        return row
+
+    def _question_row(self, question_id: str) -> int:
+        row = self._question_index.get(question_id)
+        if row is None:
+            row = self._question_index[question_id] = len(self._question_ids)
+            self._question_ids.append(question_id)
+        return row
+
+    @staticmethod
+    def _current_snapshot(directory: str) -> Optional[str]:
+        try:
+            with open(os.path.join(directory, "CURRENT")) as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
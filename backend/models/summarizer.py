@@ -1,54 +1,255 @@
-from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
+from transformers import AutoModelForSeq2SeqLM, AutoTokenizer, StoppingCriteria, StoppingCriteriaList, TextIteratorStreamer
+import threading
 import torch
-from typing import List
-import nltk
+from typing import Iterator, List
 from rouge_score import rouge_scorer
 
+from models.backends import inference_device, load_model
+from models.instrumentation import instrumentation
+from models.preprocessing import preprocessor
+from models.registry import registry
+
+MODEL_NAME = "facebook/bart-large-cnn"  # Using BART instead of T5
+
+registry.register(MODEL_NAME, lambda: load_model(AutoModelForSeq2SeqLM, MODEL_NAME))
+registry.register(f"{MODEL_NAME}:tokenizer", lambda: AutoTokenizer.from_pretrained(MODEL_NAME))
+
+# Beam-search settings that generate() warns about on every greedy call
+_BEAM_SEARCH_ONLY = ("length_penalty", "early_stopping")
+
+def _greedy(generation_kwargs: dict) -> dict:
+    """The settings with a single beam and without the beam-search-only ones."""
+    kwargs = {k: v for k, v in generation_kwargs.items() if k not in _BEAM_SEARCH_ONLY}
+    kwargs["num_beams"] = 1
+    return kwargs
+
+class _StopWhenSet(StoppingCriteria):
+    """Stop generation once the event is set."""
+    
+    def __init__(self, event: threading.Event):
+        self.event = event
+    
+    def __call__(self, input_ids, scores, **kwargs) -> bool:
+        return self.event.is_set()
+
 class TextSummarizer:
-    def __init__(self):
-        self.model_name = "facebook/bart-large-cnn"  # Using BART instead of T5
-        self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
-        self.model = AutoModelForSeq2SeqLM.from_pretrained(self.model_name)
-        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        self.model.to(self.device)
-        
-        # Download required NLTK data
-        try:
-            nltk.data.find('tokenizers/punkt')
-        except LookupError:
-            nltk.download('punkt')
+    def __init__(self, max_input_tokens: int = 1024, chunk_overlap: int = 1, chunk_batch_size: int = 4,
+                 max_reduce_depth: int = 4):
+        self.model_name = MODEL_NAME
+        self.device = inference_device()
+        
+        # Long documents are summarized chunk by chunk (map), then the joined partial
+        # summaries are summarized again (reduce) until they fit in one input window
+        self.max_input_tokens = max_input_tokens
+        self.chunk_overlap = chunk_overlap  # sentences repeated at the start of the next chunk
+        self.chunk_batch_size = chunk_batch_size
+        self.max_reduce_depth = max_reduce_depth
+        
+        # Beam search settings; also part of the result cache key
+        self.generation_kwargs = {
+            "min_length": 40,
+            "length_penalty": 2.0,
+            "num_beams": 4,
+            "early_stopping": True
+        }
+        
+        # Cheaper settings served under load (see app.budget), best first; "max_length" caps
+        # the requested length. Also part of the result cache key
+        self.quality_tiers = {
+            "full": {},
+            "reduced": {"num_beams": 2, "max_length": 120},
+            "fast": {"num_beams": 1, "max_length": 100}
+        }
+    
+    @property
+    def model(self):
+        return registry.get(self.model_name)
+    
+    @property
+    def tokenizer(self):
+        return registry.get(f"{self.model_name}:tokenizer")
+    
+    def ensure_nltk_data(self):
+        """Download the NLTK data needed for sentence splitting if it is missing."""
+        # The punkt sentence model is fetched on first use (or by the startup loader), not at import
+        preprocessor.ensure_nltk_data()
     
     def preprocess_text(self, text: str) -> List[str]:
         """Split text into sentences and prepare for summarization."""
-        sentences = nltk.sent_tokenize(text)
-        return sentences
+        return preprocessor.segment(text).sentences
     
-    def summarize(self, text: str, max_length: int = 150) -> str:
-        """Generate a summary using BART model."""
+    def summarize(self, text: str, max_length: int = 150, quality_tier: str = "full") -> str:
+        """Generate a summary using BART model.
+        
+        Text that does not fit in one input window is summarized with chunked map-reduce
+        instead of being truncated.
+        """
+        generation_kwargs = self.tier_generation_kwargs(quality_tier, max_length)
+        
         # Preprocess text
         sentences = self.preprocess_text(text)
+        sentences = self._reduce_to_window(sentences, generation_kwargs)
+        return self._generate_summaries([sentences], generation_kwargs)[0]
+    
+    def summarize_batch(self, texts: List[str], max_length: int = 150, quality_tier: str = "full") -> List[str]:
+        """Summarize several documents, sharing beam-search batches between them."""
+        generation_kwargs = self.tier_generation_kwargs(quality_tier, max_length)
+        inputs = [self._reduce_to_window(self.preprocess_text(text), generation_kwargs) for text in texts]
+        summaries = []
+        for i in range(0, len(inputs), self.chunk_batch_size):
+            summaries.extend(self._generate_summaries(inputs[i:i + self.chunk_batch_size], generation_kwargs))
+        return summaries
+    
+    def tier_generation_kwargs(self, quality_tier: str, max_length: int = 150) -> dict:
+        """The generate() settings of a quality tier, including max_length."""
+        overrides = dict(self.quality_tiers[quality_tier])
+        max_length = min(max_length, overrides.pop("max_length", max_length))
+        kwargs = dict(self.generation_kwargs, max_length=max_length, **overrides)
+        return _greedy(kwargs) if kwargs.get("num_beams", 1) == 1 else kwargs
+    
+    def summarize_stream(self, text: str, max_length: int = 150) -> Iterator[str]:
+        """Yield the summary in pieces as tokens are decoded.
+        
+        Beam search only settles on its output at the end, so the streamed pass decodes
+        greedily. Long documents are reduced first; only the final pass is streamed.
+        """
+        sentences = self._reduce_to_window(self.preprocess_text(text), self.tier_generation_kwargs("full", max_length))
+        inputs = self._encode([sentences])
+        
+        streamer = TextIteratorStreamer(self.tokenizer, skip_special_tokens=True)
+        stop = threading.Event()
+        errors = []
+        generation_kwargs = _greedy(self.generation_kwargs)
+        
+        def run():
+            try:
+                with instrumentation.span("summarizer.stream"), torch.no_grad():
+                    self.model.generate(
+                        inputs["input_ids"],
+                        attention_mask=inputs["attention_mask"],
+                        max_length=max_length,
+                        streamer=streamer,
+                        stopping_criteria=StoppingCriteriaList([_StopWhenSet(stop)]),
+                        **generation_kwargs
+                    )
+            except Exception as e:
+                errors.append(e)
+                streamer.end()
+        
+        thread = threading.Thread(target=run, name="summary-stream", daemon=True)
+        thread.start()
+        try:
+            for piece in streamer:
+                if piece:
+                    yield piece
+        finally:
+            # Stops generation early if the consumer goes away
+            stop.set()
+        
+        thread.join()
+        if errors:
+            raise errors[0]
+    
+    def _reduce_to_window(self, sentences: List[str], generation_kwargs: dict) -> List[str]:
+        """Map-reduce sentences into partial summaries until they fit in one input window."""
+        # Leave room for the <s> and </s> special tokens
+        budget = self.max_input_tokens - 2
+        for _ in range(self.max_reduce_depth):
+            token_counts = self._token_counts(sentences)
+            if sum(token_counts) <= budget:
+                break
+            
+            # Map: summarize the chunks a few at a time so memory stays bounded
+            partial_summaries = []
+            batch = []
+            for chunk in self._chunk_sentences(sentences, token_counts, budget):
+                batch.append(chunk)
+                if len(batch) == self.chunk_batch_size:
+                    partial_summaries.extend(self._generate_summaries(batch, generation_kwargs))
+                    batch = []
+            if batch:
+                partial_summaries.extend(self._generate_summaries(batch, generation_kwargs))
+            
+            # Reduce: the partial summaries become the sentences of the next level
+            sentences = partial_summaries
         
-        # Prepare input
-        input_text = " ".join(sentences)
-        inputs = self.tokenizer(
-            input_text,
-            max_length=1024,
-            truncation=True,
-            return_tensors="pt"
-        ).to(self.device)
+        return sentences
+    
+    def _token_counts(self, sentences: List[str]) -> List[int]:
+        """Token length of every sentence as part of the joined text; only new sentences are tokenized."""
+        if not sentences:
+            return []
+        with instrumentation.span("summarizer.tokenize"):
+            encoded = preprocessor.token_ids(f"{self.model_name}:tokenizer", self.tokenizer, sentences)
+        return [len(ids) for ids in encoded]
+    
+    def _encode(self, chunks: List[List[str]]) -> dict:
+        """Padded input ids and attention mask of each chunk of sentences, joined by spaces.
+        
+        Equivalent to tokenizing the joined texts with truncation, but built from the
+        cached token ids of the sentences.
+        """
+        tokenizer = self.tokenizer
+        with instrumentation.span("summarizer.tokenize"):
+            rows = []
+            for sentences in chunks:
+                ids = preprocessor.encode_joined(f"{self.model_name}:tokenizer", tokenizer, sentences)
+                rows.append(tokenizer.build_inputs_with_special_tokens(ids[:self.max_input_tokens - 2]))
+        
+        width = max(len(ids) for ids in rows)
+        input_ids = torch.full((len(rows), width), tokenizer.pad_token_id, dtype=torch.long)
+        attention_mask = torch.zeros((len(rows), width), dtype=torch.long)
+        for i, ids in enumerate(rows):
+            span = slice(width - len(ids), width) if tokenizer.padding_side == "left" else slice(0, len(ids))
+            input_ids[i, span] = torch.tensor(ids)
+            attention_mask[i, span] = 1
+        return {"input_ids": input_ids.to(self.device), "attention_mask": attention_mask.to(self.device)}
+    
+    def _chunk_sentences(self, sentences: List[str], token_counts: List[int], budget: int):
+        """Yield runs of sentences that fit in budget tokens, overlapping by chunk_overlap sentences."""
+        chunk, counts = [], []
+        for sentence, count in zip(sentences, token_counts):
+            # A single sentence longer than the budget is split on words
+            if count > budget:
+                if chunk:
+                    yield chunk
+                    chunk, counts = [], []
+                words = sentence.split()
+                pieces = -(-count // budget)
+                step = max(1, -(-len(words) // pieces))
+                for i in range(0, len(words), step):
+                    yield [" ".join(words[i:i + step])]
+                continue
+            
+            if chunk and sum(counts) + count > budget:
+                yield chunk
+                # Carry the last sentences over for context, if they leave room for this one
+                keep = self.chunk_overlap if self.chunk_overlap > 0 else 0
+                chunk, counts = chunk[len(chunk) - keep:], counts[len(counts) - keep:]
+                if sum(counts) + count > budget:
+                    chunk, counts = [], []
+            
+            chunk.append(sentence)
+            counts.append(count)
+        
+        if chunk:
+            yield chunk
+    
+    def _generate_summaries(self, chunks: List[List[str]], generation_kwargs: dict) -> List[str]:
+        """Summarize several inputs, each a list of sentences, in one padded beam-search call."""
+        inputs = self._encode(chunks)
         
         # Generate summary
-        summary_ids = self.model.generate(
-            inputs["input_ids"],
-            max_length=max_length,
-            min_length=40,
-            length_penalty=2.0,
-            num_beams=4,
-            early_stopping=True
-        )
-        
-        summary = self.tokenizer.decode(summary_ids[0], skip_special_tokens=True)
-        return summary
+        with instrumentation.span("summarizer.generate"), torch.no_grad():
+            summary_ids = self.model.generate(
+                inputs["input_ids"],
+                attention_mask=inputs["attention_mask"],
+                **generation_kwargs
+            )
+        instrumentation.count("pipeline_tokens_total", int(inputs["attention_mask"].sum()), model="bart", kind="prompt")
+        instrumentation.count("pipeline_tokens_total", summary_ids.numel(), model="bart", kind="generated")
+        
+        return self.tokenizer.batch_decode(summary_ids, skip_special_tokens=True)
     
     def evaluate_summary(self, original_text: str, summary: str) -> dict:
         """Evaluate summary quality using ROUGE scores."""
@@ -0,0 +1,134 @@
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+
+class ThompsonSampler:
+    """Beta-Bernoulli posteriors over question success rates, stored in flat NumPy arrays.
+
+    Question ids map to integer rows, so an update is two array writes and a
+    draw for any set of questions is a single vectorized ``Generator.beta`` call.
+    """
+
+    def __init__(
+        self,
+        prior_successes: float = 1.0,
+        prior_failures: float = 1.0,
+        initial_capacity: int = 1024,
+        seed: Optional[int] = None
+    ):
+        self.prior_successes = prior_successes
+        self.prior_failures = prior_failures
+
+        self._successes = np.zeros(initial_capacity, dtype=np.float64)
+        self._failures = np.zeros(initial_capacity, dtype=np.float64)
+        self._index: Dict[str, int] = {}
+        self._ids: List[str] = []
+        self._lock = threading.Lock()
+        self.rng = np.random.default_rng(seed)
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, question_id: str) -> bool:
+        return question_id in self._index
+
+    def add(self, question_id: str, successes: float = 0, failures: float = 0) -> int:
+        """Start tracking a question (existing counts are kept) and return its row."""
+        with self._lock:
+            row = self._index.get(question_id)
+            if row is None:
+                row = self._append(question_id)
+                self._successes[row] = successes
+                self._failures[row] = failures
+            return row
+
+    def load(self, estimates: Dict[str, Dict]):
+        """Replace the counts with {question_id: {"successes": s, "failures": f}} from the store."""
+        with self._lock:
+            for qid, estimate in estimates.items():
+                row = self._index.get(qid)
+                if row is None:
+                    row = self._append(qid)
+                self._successes[row] = estimate["successes"]
+                self._failures[row] = estimate["failures"]
+
+    def update(self, question_id: str, correct: bool):
+        """Add one outcome; unknown questions are ignored."""
+        row = self._index.get(question_id)
+        if row is None:
+            return
+        # Held so a concurrent resize cannot drop the write
+        with self._lock:
+            if correct:
+                self._successes[row] += 1
+            else:
+                self._failures[row] += 1
+
+    def update_counts(self, counts: Dict[str, Tuple[int, int]]):
+        """Add aggregated (successes, failures) per question; unknown questions are ignored."""
+        rows, successes, failures = [], [], []
+        for qid, (s, f) in counts.items():
+            row = self._index.get(qid)
+            if row is not None:
+                rows.append(row)
+                successes.append(s)
+                failures.append(f)
+        if rows:
+            with self._lock:
+                np.add.at(self._successes, rows, successes)
+                np.add.at(self._failures, rows, failures)
+
+    def rows(self, question_ids: Iterable[str]) -> np.ndarray:
+        """Rows of the given ids, with -1 for questions that are not tracked."""
+        return np.array([self._index.get(qid, -1) for qid in question_ids], dtype=np.int64)
+
+    def sample(self, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Draw one success probability per row (all questions when rows is None)."""
+        successes, failures = self._counts(rows)
+        return self.rng.beta(successes + self.prior_successes, failures + self.prior_failures)
+
+    def mean(self, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Posterior mean success probability per row."""
+        successes, failures = self._counts(rows)
+        a = successes + self.prior_successes
+        return a / (a + failures + self.prior_failures)
+
+    def select(self, target: float, k: int, candidates: Optional[Iterable[str]] = None) -> List[str]:
+        """Pick the k questions whose sampled success probability is closest to target."""
+        if candidates is None:
+            rows = np.arange(len(self._ids))
+        else:
+            rows = self.rows(candidates)
+            rows = rows[rows >= 0]
+
+        distance = np.abs(self.sample(rows) - target)
+        k = min(k, len(distance))
+        if k <= 0:
+            return []
+        # Partial sort: only the k best draws are ordered
+        best = np.argpartition(distance, k - 1)[:k]
+        best = best[np.argsort(distance[best])]
+        return [self._ids[row] for row in rows[best]]
+
+    def stats(self) -> Dict:
+        return {"questions": len(self._ids), "capacity": len(self._successes)}
+
+    def _counts(self, rows: Optional[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+        with self._lock:
+            n = len(self._ids)
+            successes, failures = self._successes[:n], self._failures[:n]
+        if rows is None:
+            return successes, failures
+        return successes[rows], failures[rows]
+
+    def _append(self, question_id: str) -> int:
+        """Give a new id the next row, doubling the arrays when they are full (lock held)."""
+        row = len(self._ids)
+        if row == len(self._successes):
+            self._successes = np.concatenate([self._successes, np.zeros_like(self._successes)])
+            self._failures = np.concatenate([self._failures, np.zeros_like(self._failures)])
+        self._index[question_id] = row
+        self._ids.append(question_id)
+        return row
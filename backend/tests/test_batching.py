@@ -0,0 +1,69 @@
+import threading
+
+import pytest
+
+from models.batching import BatchScheduler
+
+
+def test_items_are_batched_with_their_own_group_only():
+    batches = []
+    release = threading.Event()
+
+    def process(payloads):
+        release.wait(5)
+        batches.append(list(payloads))
+        return [p * 10 for p in payloads]
+
+    scheduler = BatchScheduler(process, max_batch_size=4, max_wait_ms=200)
+    # The first item holds the worker while the rest queue up behind it
+    first = scheduler.submit(0, group="a")
+    futures = {
+        "a": scheduler.submit_many([1, 2, 3], group="a"),
+        "b": scheduler.submit_many([4, 5], group="b"),
+    }
+    release.set()
+
+    assert first.result(5) == 0
+    assert [f.result(5) for f in futures["a"]] == [10, 20, 30]
+    assert [f.result(5) for f in futures["b"]] == [40, 50]
+    group_of = {0: "a", 1: "a", 2: "a", 3: "a", 4: "b", 5: "b"}
+    assert all(len({group_of[p] for p in batch}) == 1 for batch in batches)
+    assert max(map(len, batches)) <= 4
+    assert scheduler.stats()["items"] == 6
+
+
+def test_batch_is_capped_at_max_batch_size():
+    sizes = []
+    scheduler = BatchScheduler(lambda payloads: sizes.append(len(payloads)) or payloads, max_batch_size=3, max_wait_ms=50)
+    assert scheduler.run(list(range(7))) == list(range(7))
+    assert max(sizes) <= 3
+    assert sum(sizes) == 7
+
+
+def test_batch_failure_is_raised_to_every_caller():
+    def process(payloads):
+        raise RuntimeError("model failed")
+
+    scheduler = BatchScheduler(process, max_batch_size=4, max_wait_ms=20)
+    for future in scheduler.submit_many([1, 2]):
+        with pytest.raises(RuntimeError, match="model failed"):
+            future.result(5)
+
+
+def test_cancelled_items_are_skipped():
+    seen = []
+    release = threading.Event()
+
+    def process(payloads):
+        release.wait(5)
+        seen.extend(payloads)
+        return payloads
+
+    scheduler = BatchScheduler(process, max_batch_size=1, max_wait_ms=0)
+    first = scheduler.submit("first")
+    dropped = scheduler.submit("dropped")
+    assert dropped.cancel()
+    release.set()
+    assert first.result(5) == "first"
+    assert scheduler.run(["last"], timeout=5) == ["last"]
+    assert "dropped" not in seen
@@ -0,0 +1,113 @@
+import pytest
+
+from app import budget as budget_module
+from app.budget import LatencyBudget
+
+
+class Pool:
+    def __init__(self, concurrency=1):
+        self.concurrency = concurrency
+        self.pending = 0
+
+    def stats(self):
+        return {"pending": self.pending, "concurrency": self.concurrency}
+
+
+class Executor:
+    def __init__(self, **pools):
+        self.pools = pools
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(budget_module.time, "perf_counter", clock)
+    return clock
+
+
+def make_budget(target_ms=0.0, concurrency=1):
+    pool = Pool(concurrency)
+    budget = LatencyBudget(Executor(summarizer=pool), {"summarizer": ["full", "reduced", "fast"]},
+                           {"summarizer": target_ms}, smoothing=0.5)
+    return budget, pool
+
+
+def served_in(budget, clock, tier, seconds, size=1.0):
+    with budget.measure("summarizer", tier, size=size):
+        clock.now += seconds
+
+
+def test_best_tier_without_a_target():
+    budget, _ = make_budget()
+    assert budget.choose("summarizer") == "full"
+
+
+def test_unmeasured_tiers_are_assumed_to_fit(clock):
+    budget, _ = make_budget(target_ms=100)
+    assert budget.choose("summarizer") == "full"
+    served_in(budget, clock, "full", 0.5)
+    # Too slow at full quality, and reduced has not been measured yet
+    assert budget.choose("summarizer") == "reduced"
+
+
+def test_tier_follows_the_queue(clock):
+    budget, pool = make_budget(target_ms=1000, concurrency=2)
+    served_in(budget, clock, "full", 0.4)
+    served_in(budget, clock, "reduced", 0.2)
+    served_in(budget, clock, "fast", 0.1)
+    assert budget.choose("summarizer") == "full"
+
+    # Two full rounds queued ahead: 3 x 0.4s misses the target, 3 x 0.2s fits
+    pool.pending = 5
+    assert budget.choose("summarizer") == "reduced"
+
+    # Nothing fits; the cheapest tier is served
+    pool.pending = 40
+    assert budget.choose("summarizer") == "fast"
+
+
+def test_request_budget_and_size(clock):
+    budget, _ = make_budget(target_ms=1000)
+    served_in(budget, clock, "full", 0.4)
+    served_in(budget, clock, "reduced", 0.2)
+    served_in(budget, clock, "fast", 0.1)
+
+    # The smaller of the request's budget and the group's target applies
+    assert budget.choose("summarizer", budget_ms=300) == "reduced"
+    assert budget.choose("summarizer", budget_ms=5000) == "full"
+    # Service times are per unit of work
+    assert budget.choose("summarizer", size=8) == "fast"
+
+
+def test_service_time_is_smoothed_and_excludes_queueing(clock):
+    budget, pool = make_budget()
+    served_in(budget, clock, "full", 0.2)
+    served_in(budget, clock, "full", 0.4)
+    assert budget.stats()["summarizer"]["tiers"]["full"]["service_ms"] == 300.0
+
+    # One round queued ahead: half of the time was spent waiting
+    pool.pending = 1
+    served_in(budget, clock, "reduced", 0.2)
+    assert budget.stats()["summarizer"]["tiers"]["reduced"]["service_ms"] == 100.0
+
+
+def test_failed_requests_are_not_measured(clock):
+    budget, _ = make_budget()
+    with pytest.raises(RuntimeError):
+        with budget.measure("summarizer", "full"):
+            clock.now += 10
+            raise RuntimeError("worker crashed")
+    assert budget.stats()["summarizer"]["tiers"]["full"]["service_ms"] is None
+
+
+def test_tiers_from_best():
+    budget, _ = make_budget()
+    assert budget.tiers_from_best("summarizer", "reduced") == ["full", "reduced"]
@@ -0,0 +1,140 @@
+import asyncio
+
+import pytest
+
+from app.coalescing import RequestCoalescer
+from app.executor import ClientDisconnected
+
+
+class Computation:
+    """A compute() that runs until released, counting its runs and cancellations."""
+
+    def __init__(self, result="summary"):
+        self.result = result
+        self.runs = 0
+        self.cancelled = 0
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.runs += 1
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return {"value": self.result}
+
+
+class Client:
+    def __init__(self):
+        self.gone = False
+
+    async def is_disconnected(self):
+        return self.gone
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_identical_requests_share_one_run():
+    async def scenario():
+        coalescer = RequestCoalescer()
+        compute = Computation()
+        waiters = [
+            asyncio.ensure_future(coalescer.run("summary", text, {}, compute))
+            for text in ("Plants need light.", "Plants  need\nlight.", "Plants need light.")
+        ]
+        await asyncio.sleep(0)
+        compute.release.set()
+        results = await asyncio.gather(*waiters)
+        # Every waiter gets a copy of its own
+        results[0]["value"] = "changed"
+        return compute.runs, results, coalescer.stats()
+
+    runs, results, stats = run(scenario())
+    assert runs == 1
+    assert [r["value"] for r in results[1:]] == ["summary", "summary"]
+    assert stats["summary"]["coalesced"] == 2
+    assert stats["in_flight"] == 0
+
+
+def test_disconnected_waiter_leaves_the_shared_run():
+    async def scenario():
+        coalescer = RequestCoalescer(disconnect_poll_interval=0.01)
+        compute = Computation()
+        leaving, staying = Client(), Client()
+        first = asyncio.ensure_future(coalescer.run("q", "text", {}, compute, leaving.is_disconnected))
+        second = asyncio.ensure_future(coalescer.run("q", "text", {}, compute, staying.is_disconnected))
+        await asyncio.sleep(0.02)
+        leaving.gone = True
+        with pytest.raises(ClientDisconnected):
+            await first
+        compute.release.set()
+        return compute, await second
+
+    compute, result = run(scenario())
+    assert result == {"value": "summary"}
+    assert (compute.runs, compute.cancelled) == (1, 0)
+
+
+def test_run_is_cancelled_when_every_waiter_is_gone():
+    async def scenario():
+        coalescer = RequestCoalescer(disconnect_poll_interval=0.01)
+        compute = Computation()
+        clients = [Client(), Client()]
+        waiters = [
+            asyncio.ensure_future(coalescer.run("q", "text", {}, compute, client.is_disconnected))
+            for client in clients
+        ]
+        await asyncio.sleep(0.02)
+        waiters[1].cancel()
+        clients[0].gone = True
+        outcomes = await asyncio.gather(*waiters, return_exceptions=True)
+        await asyncio.sleep(0)
+        return compute, outcomes, coalescer.stats()
+
+    compute, outcomes, stats = run(scenario())
+    assert isinstance(outcomes[0], ClientDisconnected)
+    assert isinstance(outcomes[1], asyncio.CancelledError)
+    assert compute.cancelled == 1
+    assert stats["q"]["cancelled"] == 1
+    assert stats["in_flight"] == 0
+
+
+def test_disconnect_cancels_the_run_when_coalescing_is_off():
+    async def scenario():
+        coalescer = RequestCoalescer(enabled=False, disconnect_poll_interval=0.01)
+        compute = Computation()
+        client = Client()
+        waiter = asyncio.ensure_future(coalescer.run("q", "text", {}, compute, client.is_disconnected))
+        await asyncio.sleep(0.02)
+        client.gone = True
+        with pytest.raises(ClientDisconnected):
+            await waiter
+        await asyncio.sleep(0)
+        return compute
+
+    compute = run(scenario())
+    assert (compute.runs, compute.cancelled) == (1, 1)
+
+
+def test_errors_reach_every_waiter():
+    async def scenario():
+        coalescer = RequestCoalescer()
+
+        async def compute():
+            await asyncio.sleep(0.01)
+            raise ValueError("model failed")
+
+        waiters = [asyncio.ensure_future(coalescer.run("q", "text", {}, compute)) for _ in range(3)]
+        return await asyncio.gather(*waiters, return_exceptions=True), coalescer.stats()
+
+    outcomes, stats = run(scenario())
+    assert all(isinstance(outcome, ValueError) for outcome in outcomes)
+    assert stats["q"] == {"runs": 1, "coalesced": 2, "errors": 1, "cancelled": 0}
+
+
+def test_unknown_normalization_is_rejected():
+    with pytest.raises(ValueError):
+        RequestCoalescer(normalization="bogus")
@@ -0,0 +1,78 @@
+import threading
+
+import pytest
+
+from models.difficulty_store import DifficultyStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = DifficultyStore(
+        path=str(tmp_path / "difficulty.db"),
+        legacy_estimates_path=str(tmp_path / "missing.json"),
+        legacy_history_path=str(tmp_path / "missing.json")
+    )
+    yield store
+    store.close()
+
+
+def test_queued_writes_share_a_commit(store):
+    store.add_question("q", "medium").result(5)
+    commits = store.commits
+    # Hold the writer so the updates queue up behind the flush
+    release = threading.Event()
+    store.next_difficulty = lambda s, f, d: release.wait(5) and d
+    blocker = store.update("q", True)
+    futures = [store.update("q", i % 2 == 0) for i in range(100)]
+    release.set()
+    for future in [blocker] + futures:
+        future.result(5)
+
+    assert store.get("q")["successes"] + store.get("q")["failures"] == 101
+    assert store.get("q")["successes"] == 51
+    # At most the blocked write, then one commit for everything that queued up behind it
+    assert store.commits - commits <= 2
+
+
+def test_idle_store_commits_right_away(store):
+    store.add_question("q", "medium").result(5)
+    # No batching window by default
+    assert store.commit_interval == 0
+    store.update("q", False).result(1)
+    assert store.get("q")["failures"] == 1
+
+
+def test_counts_and_attempts_commit_together(store):
+    store.add_question("q", "medium").result(5)
+    attempts = [("s1", "q", True, "2026-01-01T00:00:00"), ("s1", "q", False, "2026-01-01T00:01:00")]
+    store.apply_counts({"q": (3, 2)}, attempts).result(5)
+    assert store.get("q")["successes"] == 3
+    assert [a["correct"] for a in store.student_history("s1")] == [True, False]
+
+    # A failing batch writes neither
+    store.next_difficulty = lambda s, f, d: 1 / 0
+    with pytest.raises(ZeroDivisionError):
+        store.apply_counts({"q": (1, 0)}, [("s2", "q", True, "2026-01-01T00:02:00")]).result(5)
+    assert store.get("q")["successes"] == 3
+    assert store.student_history("s2") == []
+
+
+def test_attempt_hook_runs_once_per_batch(store):
+    calls = []
+    store.on_attempts_committed = lambda: calls.append(store.last_attempt_id())
+    release = threading.Event()
+    store.add_question("q", "medium").result(5)
+    store.next_difficulty = lambda s, f, d: release.wait(5) and d
+    blocker = store.update("q", True)
+    futures = [store.record_attempt("s", "q", True) for _ in range(10)]
+    release.set()
+    for future in [blocker] + futures:
+        future.result(5)
+    # Once per batch, after its attempts are committed and before their futures resolve
+    assert 1 <= len(calls) <= 2
+    assert calls[-1] == 10
+
+
+def test_unknown_questions_are_ignored(store):
+    store.update("missing", True).result(5)
+    assert store.get("missing") is None
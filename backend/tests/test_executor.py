@@ -0,0 +1,136 @@
+import asyncio
+import itertools
+import threading
+import time
+
+import pytest
+
+from app.executor import ClientDisconnected, ExecutorOverloaded, InferenceExecutor, InferenceTimeout
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def make_executor(**pool):
+    executor = InferenceExecutor(disconnect_poll_interval=0.01)
+    executor.add_pool("model", **pool)
+    return executor
+
+
+def test_full_pool_sheds_load():
+    release = threading.Event()
+    executor = make_executor(concurrency=1, max_queue=1)
+    pool = executor.pools["model"]
+    try:
+        running = pool.submit(release.wait)
+        queued = pool.submit(release.wait)
+        with pytest.raises(ExecutorOverloaded):
+            pool.submit(release.wait)
+        assert pool.stats()["rejected"] == 1
+        assert pool.stats()["pending"] == 2
+    finally:
+        release.set()
+    running.result(timeout=5)
+    queued.result(timeout=5)
+    assert pool.stats()["pending"] == 0
+    executor.shutdown()
+
+
+def test_run_times_out_and_drops_queued_work():
+    release = threading.Event()
+    calls = []
+
+    async def scenario():
+        executor = make_executor(concurrency=1, timeout=0.05)
+        blocker = executor.pools["model"].submit(release.wait)
+        with pytest.raises(InferenceTimeout):
+            await executor.run("model", calls.append, "never")
+        release.set()
+        blocker.result(timeout=5)
+        stats = executor.pools["model"].stats()
+        executor.shutdown()
+        return stats
+
+    stats = run(scenario())
+    # The timed-out call had not started, so it is cancelled rather than run later
+    assert calls == []
+    assert stats["timed_out"] == 1
+    assert stats["cancelled"] == 1
+
+
+def test_run_gives_up_when_the_client_disconnects():
+    release = threading.Event()
+
+    async def scenario():
+        executor = make_executor(concurrency=1)
+        gone = asyncio.Event()
+
+        async def is_disconnected():
+            return gone.is_set()
+
+        task = asyncio.ensure_future(executor.run("model", release.wait, is_disconnected=is_disconnected))
+        await asyncio.sleep(0.02)
+        assert not task.done()
+        gone.set()
+        with pytest.raises(ClientDisconnected):
+            await task
+        release.set()
+        executor.shutdown()
+
+    run(scenario())
+
+
+def test_run_returns_the_result():
+    async def scenario():
+        executor = make_executor(concurrency=2)
+        results = await asyncio.gather(*(executor.run("model", pow, n, 2) for n in range(4)))
+        executor.shutdown()
+        return results
+
+    assert run(scenario()) == [0, 1, 4, 9]
+
+
+def test_stream_closes_the_generator_when_the_consumer_stops():
+    closed = threading.Event()
+
+    def numbers():
+        # Endless, so only the executor closing it ends it
+        try:
+            for n in itertools.count():
+                yield n
+                time.sleep(0.001)
+        finally:
+            closed.set()
+
+    async def scenario():
+        executor = make_executor(concurrency=1)
+        received = []
+        stream = executor.stream("model", numbers)
+        async for item in stream:
+            received.append(item)
+            if len(received) == 3:
+                break
+        await stream.aclose()
+        executor.shutdown()
+        return received
+
+    assert run(scenario()) == [0, 1, 2]
+    assert closed.wait(5)
+
+
+def test_stream_raises_the_generator_error():
+    def failing():
+        yield 1
+        raise ValueError("bad input")
+
+    async def scenario():
+        executor = make_executor(concurrency=1)
+        received = []
+        with pytest.raises(ValueError):
+            async for item in executor.stream("model", failing):
+                received.append(item)
+        executor.shutdown()
+        return received
+
+    assert run(scenario()) == [1]
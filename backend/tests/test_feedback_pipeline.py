@@ -0,0 +1,129 @@
+import asyncio
+from concurrent.futures import Future
+
+import pytest
+
+from app.feedback_pipeline import FeedbackAggregator, FeedbackOverloaded
+
+
+class Adjuster:
+    """Records update_counts calls; the first `failures` of them fail."""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.writes = []
+
+    def update_counts(self, counts, attempts=()):
+        future = Future()
+        if self.failures > 0:
+            self.failures -= 1
+            future.set_exception(OSError("database is locked"))
+        else:
+            self.writes.append((counts, list(attempts)))
+            future.set_result(None)
+        return future
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_events_are_flushed_as_aggregated_counts():
+    async def scenario():
+        adjuster = Adjuster()
+        aggregator = FeedbackAggregator(adjuster, flush_interval_ms=10)
+        aggregator.start()
+        aggregator.submit([("q1", True, "s1"), ("q1", False, None), ("q2", True, "s2")])
+        aggregator.submit([("q1", True, None)])
+        await asyncio.sleep(0.1)
+        await aggregator.stop()
+        return adjuster, aggregator.stats()
+
+    adjuster, stats = run(scenario())
+    assert len(adjuster.writes) == 1
+    counts, attempts = adjuster.writes[0]
+    assert counts == {"q1": (2, 1), "q2": (1, 0)}
+    # Only events with a student id become attempts
+    assert [(student, qid, correct) for student, qid, correct, _ in attempts] == [("s1", "q1", True), ("s2", "q2", True)]
+    assert stats["flushed"] == 4
+    assert stats["flushes"] == 1
+    assert stats["pending"] == 0
+
+
+def test_threshold_flushes_before_the_interval():
+    async def scenario():
+        adjuster = Adjuster()
+        aggregator = FeedbackAggregator(adjuster, flush_interval_ms=60000, flush_threshold=2)
+        aggregator.start()
+        aggregator.submit([("q1", True, None), ("q2", False, None)])
+        await asyncio.sleep(0.05)
+        writes = list(adjuster.writes)
+        await aggregator.stop()
+        return writes
+
+    assert run(scenario()) == [({"q1": (1, 0), "q2": (0, 1)}, [])]
+
+
+def test_failed_flush_is_retried():
+    async def scenario():
+        adjuster = Adjuster(failures=1)
+        aggregator = FeedbackAggregator(adjuster, flush_interval_ms=10, max_flush_attempts=3)
+        aggregator.start()
+        aggregator.submit([("q1", True, None)])
+        await asyncio.sleep(0.1)
+        await aggregator.stop()
+        return adjuster, aggregator.stats()
+
+    adjuster, stats = run(scenario())
+    assert adjuster.writes == [({"q1": (1, 0)}, [])]
+    assert stats["flush_failures"] == 1
+    assert stats["flushed"] == 1
+    assert stats["dropped"] == 0
+
+
+def test_events_are_dropped_after_the_last_attempt():
+    async def scenario():
+        adjuster = Adjuster(failures=2)
+        aggregator = FeedbackAggregator(adjuster, flush_interval_ms=10, max_flush_attempts=2)
+        aggregator.start()
+        aggregator.submit([("q1", True, None), ("q2", True, None)])
+        await asyncio.sleep(0.1)
+        # Events arriving after the drop are flushed as usual
+        aggregator.submit([("q3", False, None)])
+        await asyncio.sleep(0.1)
+        await aggregator.stop()
+        return adjuster, aggregator.stats()
+
+    adjuster, stats = run(scenario())
+    assert adjuster.writes == [({"q3": (0, 1)}, [])]
+    assert stats["flush_failures"] == 2
+    assert stats["dropped"] == 2
+    assert stats["flushed"] == 1
+    assert stats["pending"] == 0
+
+
+def test_stop_flushes_what_is_queued():
+    async def scenario():
+        adjuster = Adjuster()
+        aggregator = FeedbackAggregator(adjuster, flush_interval_ms=60000)
+        aggregator.start()
+        aggregator.submit([("q1", False, None)])
+        await aggregator.stop()
+        return adjuster
+
+    assert run(scenario()).writes == [({"q1": (0, 1)}, [])]
+
+
+def test_submit_sheds_load_when_full():
+    async def scenario():
+        aggregator = FeedbackAggregator(Adjuster(), max_pending=2, flush_interval_ms=60000)
+        aggregator.start()
+        aggregator.submit([("q1", True, None)])
+        with pytest.raises(FeedbackOverloaded):
+            aggregator.submit([("q2", True, None), ("q3", True, None)])
+        await aggregator.stop()
+        return aggregator.stats()
+
+    stats = run(scenario())
+    assert stats["rejected"] == 2
+    assert stats["flushed"] == 1
@@ -0,0 +1,121 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+from app.executor import ExecutorOverloaded
+from app.jobs import JobManager, JobNotFound
+
+DOCUMENTS = [{"id": f"doc{i}", "text": f"Text {i}."} for i in range(5)]
+
+
+class Processor:
+    """Echo each document, optionally stalling on one batch until it is released."""
+
+    def __init__(self, stall_on=None):
+        self.batches = []
+        self.stall_on = stall_on
+        self.stalled = asyncio.Event()
+
+    async def __call__(self, documents, options):
+        self.batches.append([d["id"] for d in documents])
+        if self.stall_on is not None and documents[0]["id"] == self.stall_on:
+            self.stalled.set()
+            await asyncio.Event().wait()
+        return [{"id": d["id"], "summary": d["text"].upper()} for d in documents]
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def results(manager, job_id):
+    return [json.loads(line) for line in b"".join(manager.results(job_id)).splitlines()]
+
+
+async def wait_until_finished(manager, job_id, timeout=5.0):
+    for _ in range(int(timeout / 0.01)):
+        if manager.status(job_id)["status"] in ("completed", "failed"):
+            return manager.status(job_id)
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+def test_job_runs_in_checkpointed_batches(tmp_path):
+    async def scenario():
+        processor = Processor()
+        manager = JobManager(str(tmp_path), processor, batch_size=2)
+        manager.start()
+        job_id = manager.create(DOCUMENTS, {"summarize": True})["job_id"]
+        status = await wait_until_finished(manager, job_id)
+        await manager.stop()
+        return manager, processor, job_id, status
+
+    manager, processor, job_id, status = run(scenario())
+    assert processor.batches == [["doc0", "doc1"], ["doc2", "doc3"], ["doc4"]]
+    assert (status["status"], status["processed"], status["progress"]) == ("completed", 5, 1.0)
+    assert [r["id"] for r in results(manager, job_id)] == [d["id"] for d in DOCUMENTS]
+
+
+def test_interrupted_job_resumes_after_its_last_checkpoint(tmp_path):
+    async def interrupted():
+        processor = Processor(stall_on="doc2")
+        manager = JobManager(str(tmp_path), processor, batch_size=2)
+        manager.start()
+        job_id = manager.create(DOCUMENTS, {})["job_id"]
+        await asyncio.wait_for(processor.stalled.wait(), 5)
+        await manager.stop()
+        return manager, job_id
+
+    manager, job_id = run(interrupted())
+    assert manager.status(job_id)["processed"] == 2
+    assert [r["id"] for r in results(manager, job_id)] == ["doc0", "doc1"]
+    # Output written after the checkpoint, e.g. by a process that died mid-batch, is dropped
+    with open(os.path.join(tmp_path, job_id, "output.jsonl"), "ab") as f:
+        f.write(b'{"id": "partial"')
+
+    async def resumed():
+        processor = Processor()
+        manager = JobManager(str(tmp_path), processor, batch_size=2)
+        manager.start()
+        status = await wait_until_finished(manager, job_id)
+        await manager.stop()
+        return manager, processor, status
+
+    manager, processor, status = run(resumed())
+    assert processor.batches == [["doc2", "doc3"], ["doc4"]]
+    assert status["status"] == "completed"
+    assert [r["id"] for r in results(manager, job_id)] == [d["id"] for d in DOCUMENTS]
+
+
+def test_overloaded_batches_are_retried(tmp_path):
+    calls = []
+
+    async def flaky(documents, options):
+        calls.append(len(documents))
+        if len(calls) < 3:
+            raise ExecutorOverloaded("queue is full")
+        return [{"id": d["id"]} for d in documents]
+
+    async def scenario():
+        manager = JobManager(str(tmp_path), flaky, batch_size=8, retry_delay_s=0.01)
+        manager.start()
+        job_id = manager.create(DOCUMENTS, {})["job_id"]
+        status = await wait_until_finished(manager, job_id)
+        await manager.stop()
+        return status
+
+    assert run(scenario())["status"] == "completed"
+    assert calls == [5, 5, 5]
+
+
+def test_invalid_documents_are_rejected(tmp_path):
+    manager = JobManager(str(tmp_path), Processor())
+    with pytest.raises(ValueError):
+        manager.create([{"id": "a", "text": " "}], {})
+    with pytest.raises(ValueError):
+        manager.create([], {})
+    assert os.listdir(tmp_path) == []
+    with pytest.raises(JobNotFound):
+        manager.status("../../etc")
@@ -0,0 +1,114 @@
+import re
+import tempfile
+
+import pytest
+
+from benchmarks import stand_ins
+from models import preprocessing
+from models.preprocessing import TextPreprocessor
+
+DOCUMENT = (
+    "Plants need light. They turn it into sugar.\n\n"
+    "Roots take up water.  Leaves  lose it again.\n\n"
+    "Seeds spread with the wind."
+)
+
+
+class CountingTokenizer:
+    """Wraps a tokenizer, recording every text it is asked to encode."""
+
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+        self.encoded = []
+
+    def __call__(self, texts, **kwargs):
+        self.encoded.extend(texts)
+        return self.tokenizer(texts, **kwargs)
+
+
+@pytest.fixture(scope="module")
+def bart_tokenizer():
+    _, tokenizer = stand_ins.bart(tempfile.mkdtemp())
+    return tokenizer
+
+
+@pytest.fixture
+def segmented(monkeypatch):
+    """Paragraphs passed to the sentence splitter; punkt is replaced by a punctuation split."""
+    paragraphs = []
+
+    def sent_tokenize(text):
+        paragraphs.append(text)
+        return [s for s in re.split(r"(?<=[.!?])\s+", text.strip()) if s]
+
+    monkeypatch.setattr(preprocessing.nltk, "sent_tokenize", sent_tokenize)
+    return paragraphs
+
+
+def make_preprocessor(**kwargs):
+    preprocessor = TextPreprocessor(**kwargs)
+    preprocessor._punkt_ready = True
+    return preprocessor
+
+
+def test_segment_collapses_whitespace(segmented):
+    document = make_preprocessor().segment(DOCUMENT)
+    assert document.sentences == [
+        "Plants need light.", "They turn it into sugar.",
+        "Roots take up water.", "Leaves lose it again.",
+        "Seeds spread with the wind.",
+    ]
+    assert document.joined().startswith("Plants need light. They turn")
+
+
+def test_only_edited_paragraphs_are_segmented_again(segmented):
+    preprocessor = make_preprocessor()
+    preprocessor.segment(DOCUMENT)
+    assert len(segmented) == 3
+
+    edited = DOCUMENT.replace("Seeds spread with the wind.", "Seeds spread with the wind. Some float.")
+    sentences = preprocessor.segment(edited).sentences
+    assert segmented[3:] == ["Seeds spread with the wind. Some float."]
+    assert sentences[-2:] == ["Seeds spread with the wind.", "Some float."]
+    assert preprocessor.stats()["paragraphs"]["hits"] == 2
+
+
+def test_only_new_sentences_are_tokenized(bart_tokenizer):
+    preprocessor = make_preprocessor()
+    tokenizer = CountingTokenizer(bart_tokenizer)
+    sentences = ["Plants need light.", "Roots take up water.", "Plants need light."]
+    ids = preprocessor.token_ids("bart", tokenizer, sentences)
+    # A sentence repeated within one call is tokenized once
+    assert tokenizer.encoded == [" Plants need light.", " Roots take up water."]
+    assert ids[0] == ids[2]
+
+    tokenizer.encoded.clear()
+    preprocessor.token_ids("bart", tokenizer, ["Roots take up water.", "Seeds spread."])
+    assert tokenizer.encoded == [" Seeds spread."]
+
+    # Token ids are cached per tokenizer
+    preprocessor.token_ids("other", tokenizer, ["Seeds spread."])
+    assert tokenizer.encoded[-1] == " Seeds spread."
+
+
+def test_joined_ids_match_tokenizing_the_joined_text(bart_tokenizer):
+    preprocessor = make_preprocessor()
+    sentences = ["Plants need light.", "They turn it into sugar.", "Roots take up water."]
+    joined = " ".join(sentences)
+    expected = bart_tokenizer(joined, add_special_tokens=False)["input_ids"]
+    assert preprocessor.encode_joined("bart", bart_tokenizer, sentences) == expected
+    expected = bart_tokenizer(" " + joined, add_special_tokens=False)["input_ids"]
+    assert preprocessor.encode_joined("bart", bart_tokenizer, sentences, leading_space=True) == expected
+    assert preprocessor.encode_joined("bart", bart_tokenizer, []) == []
+
+
+def test_caches_are_bounded(bart_tokenizer):
+    preprocessor = make_preprocessor(max_sentences=2)
+    tokenizer = CountingTokenizer(bart_tokenizer)
+    preprocessor.token_ids("bart", tokenizer, ["One.", "Two.", "Three."])
+    assert preprocessor.stats()["tokens"]["entries"] == 2
+
+    tokenizer.encoded.clear()
+    # The least recently used sentence was evicted
+    preprocessor.token_ids("bart", tokenizer, ["One.", "Three."])
+    assert tokenizer.encoded == [" One."]
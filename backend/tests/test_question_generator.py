@@ -0,0 +1,65 @@
+import tempfile
+
+import pytest
+import torch
+from transformers import GPT2LMHeadModel
+
+from benchmarks import stand_ins
+from models.question_generator import QuestionGenerator
+from models.registry import registry
+
+TEXTS = [
+    "Water boils at 100 degrees Celsius at sea level.",
+    "The mitochondria is the powerhouse of the cell.",
+    "Paris is the capital of France.",
+]
+
+
+@pytest.fixture(scope="module")
+def generator():
+    torch.manual_seed(0)
+    model, tokenizer = stand_ins.gpt2(tempfile.mkdtemp())
+    # Larger weights than the default init, so greedy samples differ between texts
+    model.config.initializer_range = 0.5
+    model = GPT2LMHeadModel(model.config).eval()
+    registry.register("test-gpt2", lambda: model)
+    registry.register("test-gpt2:tokenizer", lambda: tokenizer)
+    generator = QuestionGenerator()
+    generator.model_name = "test-gpt2"
+    # Greedy decoding, so both paths must pick the same tokens
+    generator.generation_kwargs = {"max_new_tokens": 12, "do_sample": False}
+    return generator
+
+
+def test_prefix_and_prompt_tokenize_like_the_full_prompt(generator):
+    tokenizer = generator.tokenizer
+    for text in TEXTS:
+        full = tokenizer(generator.prompt_prefix + generator._create_prompt(text))["input_ids"]
+        split = tokenizer(generator.prompt_prefix)["input_ids"] + tokenizer(generator._create_prompt(text))["input_ids"]
+        assert full == split
+
+
+def test_cached_prefix_matches_uncached_prompt(generator):
+    # Repeated and differently sized texts exercise the per-text prefill and the padding
+    items = [(text, None, "full") for text in [TEXTS[0], TEXTS[1], TEXTS[0], TEXTS[2], TEXTS[1]]]
+    cached = generator._generate_batch(items)
+    uncached = generator._generate_batch_uncached(items)
+    samples = [c.split("Question:")[-1] for c in cached]
+    assert samples == [u.split("Question:")[-1] for u in uncached]
+    assert len(set(samples)) == 3
+
+
+def test_prefix_state_is_computed_once_per_model(generator):
+    first = generator._prefix_state(generator.model, generator.tokenizer)
+    second = generator._prefix_state(generator.model, generator.tokenizer)
+    assert first[1] is second[1]
+
+
+def test_seeded_batches_draw_different_samples(generator, monkeypatch):
+    monkeypatch.setattr(generator, "generation_kwargs", {"max_new_tokens": 12, "do_sample": True})
+    monkeypatch.setattr(generator.scheduler, "max_batch_size", 2)
+    first = [q["question"] for q in generator.generate(TEXTS[0], num_questions=4, seed=7)]
+    again = [q["question"] for q in generator.generate(TEXTS[0], num_questions=4, seed=7)]
+    assert first == again
+    # The second batch is not a copy of the first
+    assert first[2:] != first[:2]
@@ -0,0 +1,120 @@
+import json
+
+from app import result_cache
+from app.result_cache import ResultCache, make_key
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_values_are_copies():
+    cache = ResultCache()
+    cache.set("k", {"questions": [1]})
+    cache.get("k")["questions"].append(2)
+    assert cache.get("k") == {"questions": [1]}
+
+
+def test_least_recently_used_entry_is_evicted_by_size():
+    entry = len(json.dumps("x" * 10))
+    cache = ResultCache(max_bytes=3 * entry)
+    for key in "abc":
+        cache.set(key, "x" * 10)
+    cache.get("a")  # b is now the least recently used
+    cache.set("d", "x" * 10)
+
+    assert cache.get("b") is None
+    assert all(cache.get(key) is not None for key in "acd")
+    stats = cache.stats()
+    assert stats["evictions"] == 1
+    assert stats["bytes"] == 3 * entry
+
+
+def test_value_larger_than_the_cache_is_not_stored():
+    cache = ResultCache(max_bytes=8)
+    cache.set("big", "x" * 100)
+    assert cache.get("big") is None
+    assert cache.stats()["bytes"] == 0
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(result_cache.time, "time", clock)
+    cache = ResultCache(ttl_seconds=10)
+    cache.set("k", 1)
+    clock.now += 9
+    assert cache.get("k") == 1
+    clock.now += 2
+    assert cache.get("k") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_disk_tier_survives_a_new_cache(tmp_path, monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(result_cache.time, "time", clock)
+    ResultCache(ttl_seconds=10, disk_dir=str(tmp_path)).set("k", [1, 2])
+
+    cache = ResultCache(ttl_seconds=10, disk_dir=str(tmp_path))
+    assert cache.get("k") == [1, 2]
+    assert cache.stats()["disk_hits"] == 1
+    assert cache.get("k") == [1, 2]
+    assert cache.stats()["hits"] == 1
+
+    clock.now += 11
+    assert ResultCache(ttl_seconds=10, disk_dir=str(tmp_path)).get("k") is None
+
+
+def test_get_first_counts_one_lookup():
+    cache = ResultCache()
+    cache.set("reduced", "summary")
+    assert cache.get_first(["fast", "reduced", "full"]) == (1, "summary")
+    assert cache.get_first(["fast", "full"]) == (-1, None)
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["hit_rate"]) == (1, 1, 0.5)
+
+
+def test_keys_ignore_whitespace_but_not_parameters():
+    key = make_key("summary", "Plants  need\nlight.", "bart", {"max_length": 150})
+    assert key == make_key("summary", "Plants need light.", "bart", {"max_length": 150})
+    assert key != make_key("summary", "Plants need light.", "bart", {"max_length": 100})
+
+
+def disk_files(directory):
+    return sorted(path.name for path in directory.rglob("*.json"))
+
+
+def test_disk_tier_is_trimmed_to_its_limit(tmp_path, monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(result_cache.time, "time", clock)
+    entry = len(json.dumps({"expires_at": 0.0, "value": "x" * 100}))
+    cache = ResultCache(ttl_seconds=100, disk_dir=str(tmp_path), max_disk_bytes=3 * entry)
+    for key in ("aa1", "bb2", "cc3", "dd4"):
+        cache.set(key, "x" * 100)
+        clock.now += 1
+
+    # Writing the fourth entry went over the limit; the oldest ones were removed
+    stats = cache.stats()
+    assert stats["disk_bytes"] <= 0.9 * 3 * entry
+    assert stats["disk_evictions"] == 2
+    assert disk_files(tmp_path) == ["cc3.json", "dd4.json"]
+    assert ResultCache(disk_dir=str(tmp_path)).get("aa1") is None
+
+
+def test_sweep_removes_expired_entries(tmp_path, monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(result_cache.time, "time", clock)
+    cache = ResultCache(ttl_seconds=10, disk_dir=str(tmp_path), sweep_interval_s=60)
+    cache.set("aa1", 1)
+    clock.now += 30
+    cache.set("bb2", 2)
+    assert disk_files(tmp_path) == ["aa1.json", "bb2.json"]
+
+    # The next write after the interval sweeps away what has expired
+    clock.now += 31
+    cache.set("cc3", 3)
+    assert disk_files(tmp_path) == ["cc3.json"]
+    assert cache.stats()["disk_evictions"] == 0
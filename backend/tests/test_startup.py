@@ -0,0 +1,98 @@
+import threading
+import time
+
+import pytest
+
+from app.startup import ComponentNotReady, StartupManager
+from models.registry import ModelRegistry
+
+
+def make_registry(loads, gate=None):
+    registry = ModelRegistry()
+
+    def loader(name):
+        def load():
+            if gate is not None:
+                gate.wait(5)
+            loads.append(name)
+            return name
+        return load
+
+    for name in ("encoder", "generator"):
+        registry.register(name, loader(name))
+    return registry
+
+
+def test_groups_become_ready_after_loading_and_warm_up():
+    loads, warmed = [], []
+    gate = threading.Event()
+    manager = StartupManager(make_registry(loads, gate))
+    manager.add_group("questions", ["encoder", "generator"], warmup=lambda: warmed.append("questions"))
+    manager.add_group("feedback", [])
+    manager.start()
+
+    # A group without models does not wait for the others
+    deadline = time.monotonic() + 5
+    while not manager.is_ready("feedback") and time.monotonic() < deadline:
+        time.sleep(0.01)
+    manager.require("feedback")
+    with pytest.raises(ComponentNotReady, match="still loading"):
+        manager.require("questions")
+    assert not manager.status()["ready"]
+
+    gate.set()
+    manager.wait()
+    manager.require("questions")
+    status = manager.status()
+    assert status["ready"]
+    assert status["components"]["questions"]["state"] == "ready"
+    assert status["components"]["questions"]["ready_seconds"] is not None
+    assert sorted(loads) == ["encoder", "generator"]
+    assert warmed == ["questions"]
+
+
+def test_shared_models_are_loaded_once():
+    loads = []
+    manager = StartupManager(make_registry(loads))
+    manager.add_group("summary", ["encoder"])
+    manager.add_group("questions", ["encoder", "generator"])
+    manager.start()
+    manager.wait()
+    assert sorted(loads) == ["encoder", "generator"]
+    assert manager.status()["ready"]
+
+
+def test_failed_group_reports_its_error():
+    def prepare():
+        raise OSError("punkt data missing")
+
+    manager = StartupManager(make_registry([]))
+    manager.add_group("summary", ["encoder"], prepare=prepare)
+    manager.add_group("questions", ["generator"])
+    manager.start()
+    manager.wait()
+
+    with pytest.raises(ComponentNotReady, match="punkt data missing"):
+        manager.require("summary")
+    manager.require("questions")
+    status = manager.status()
+    assert not status["ready"]
+    assert status["components"]["summary"] == {"state": "failed", "ready_seconds": None, "error": "punkt data missing"}
+
+
+def test_warm_up_can_be_skipped():
+    warmed = []
+    manager = StartupManager(make_registry([]), warmup=False)
+    manager.add_group("questions", ["generator"], warmup=lambda: warmed.append("questions"))
+    manager.start()
+    manager.wait()
+    manager.require("questions")
+    assert warmed == []
+
+
+def test_everything_is_ready_without_background_startup():
+    manager = StartupManager(make_registry([]))
+    manager.add_group("questions", ["generator"])
+    # Models then load on first use
+    manager.require("questions")
+    assert manager.status()["ready"]
@@ -0,0 +1,73 @@
+import numpy as np
+
+from models.student_history import StudentHistory
+
+DAY_MS = 24 * 3600 * 1000
+
+
+def sequential_ewma(outcomes, weight, start=0.5):
+    recent = start
+    for correct in outcomes:
+        recent = (1 - weight) * recent + weight * correct
+    return recent
+
+
+def test_batched_ewma_matches_sequential_updates():
+    rng = np.random.default_rng(0)
+    history = StudentHistory(recent_weight=0.1)
+    outcomes = {"ann": [], "ben": [], "cy": []}
+    row_id = 0
+    # Interleaved students in batches of different sizes
+    for size in (1, 7, 30, 2):
+        rows = []
+        for _ in range(size):
+            row_id += 1
+            student = str(rng.choice(list(outcomes)))
+            correct = bool(rng.random() < 0.6)
+            outcomes[student].append(correct)
+            rows.append((row_id, student, "q", correct, 0))
+        assert history.append(rows) == size
+
+    for student, seen in outcomes.items():
+        accuracy = history.accuracy(student)
+        assert accuracy["attempts"] == len(seen)
+        assert accuracy["accuracy"] == sum(seen) / len(seen)
+        np.testing.assert_allclose(accuracy["recent_accuracy"], sequential_ewma(seen, 0.1), rtol=1e-5)
+
+
+def test_rows_already_applied_are_skipped():
+    history = StudentHistory()
+    assert history.append([(1, "s", "q", True, 0), (2, "s", "q", False, 0)]) == 2
+    assert history.append([(2, "s", "q", False, 0), (3, "s", "q", True, 0)]) == 1
+    assert history.accuracy("s")["attempts"] == 3
+    assert history.accuracy("unknown") is None
+
+
+def test_expired_attempts_leave_the_counts():
+    history = StudentHistory(retention_s=24 * 3600)
+    now = 10 * DAY_MS
+    history.append([
+        (1, "s", "q1", True, now - 3 * DAY_MS),
+        (2, "s", "q2", True, now - 2 * DAY_MS),
+        (3, "s", "q3", False, now - 1000),
+    ])
+    assert history.expire(now_ms=now) == 2
+    accuracy = history.accuracy("s")
+    assert (accuracy["attempts"], accuracy["accuracy"]) == (1, 0.0)
+    assert len(history) == 1
+
+
+def test_snapshot_round_trip(tmp_path):
+    history = StudentHistory(initial_capacity=2)
+    history.append([(i, f"s{i % 3}", "q", i % 2 == 0, 0) for i in range(1, 11)])
+    history.save(str(tmp_path))
+
+    loaded = StudentHistory()
+    assert loaded.load(str(tmp_path))
+    assert loaded.last_id == 10
+    for student in ("s0", "s1", "s2"):
+        assert loaded.accuracy(student) == history.accuracy(student)
+    # Appends after a load only touch the copy-on-write mapping
+    loaded.append([(11, "s0", "q", True, 0)])
+    assert loaded.accuracy("s0")["attempts"] == history.accuracy("s0")["attempts"] + 1
+    assert StudentHistory().load(str(tmp_path / "missing")) is False
@@ -0,0 +1,84 @@
+from models.summarizer import TextSummarizer
+
+
+class WordCountSummarizer(TextSummarizer):
+    """Counts a token per word and "summarizes" a chunk to its first word, recording each batch."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.batches = []
+
+    def _token_counts(self, sentences):
+        return [len(sentence.split()) for sentence in sentences]
+
+    def _generate_summaries(self, chunks, generation_kwargs):
+        self.batches.append(chunks)
+        return [chunk[0].split()[0] for chunk in chunks]
+
+
+def chunks_of(summarizer, sentences, budget):
+    return list(summarizer._chunk_sentences(sentences, summarizer._token_counts(sentences), budget))
+
+
+def test_chunks_fit_the_budget_and_overlap():
+    summarizer = WordCountSummarizer(chunk_overlap=1)
+    sentences = ["a b", "c d", "e f", "g h", "i j"]
+    chunks = chunks_of(summarizer, sentences, budget=5)
+    assert chunks == [["a b", "c d"], ["c d", "e f"], ["e f", "g h"], ["g h", "i j"]]
+
+
+def test_overlap_is_dropped_when_it_leaves_no_room():
+    summarizer = WordCountSummarizer(chunk_overlap=1)
+    chunks = chunks_of(summarizer, ["a b c", "d e f", "g"], budget=4)
+    # Carrying "a b c" over would leave no room for "d e f"; "d e f" is carried into "g"
+    assert chunks == [["a b c"], ["d e f", "g"]]
+
+
+def test_no_overlap():
+    summarizer = WordCountSummarizer(chunk_overlap=0)
+    chunks = chunks_of(summarizer, ["a b", "c d", "e f"], budget=4)
+    assert chunks == [["a b", "c d"], ["e f"]]
+
+
+def test_long_sentence_is_split_on_words():
+    summarizer = WordCountSummarizer(chunk_overlap=1)
+    chunks = chunks_of(summarizer, ["x", "a b c d e f g", "y"], budget=3)
+    assert chunks == [["x"], ["a b c"], ["d e f"], ["g"], ["y"]]
+    assert all(sum(summarizer._token_counts(chunk)) <= 3 for chunk in chunks)
+
+
+def test_short_text_is_not_reduced():
+    summarizer = WordCountSummarizer(max_input_tokens=12)
+    sentences = ["a b c", "d e f"]
+    assert summarizer._reduce_to_window(sentences, {}) == sentences
+    assert summarizer.batches == []
+
+
+def test_map_reduce_until_the_text_fits():
+    # A budget of 2 tokens: one two-word sentence per chunk
+    summarizer = WordCountSummarizer(max_input_tokens=4, chunk_overlap=0, chunk_batch_size=2)
+    sentences = [f"s{i} w" for i in range(5)]
+    reduced = summarizer._reduce_to_window(sentences, {})
+
+    # Level 1 maps the five sentences in batches of at most two chunks
+    assert [len(batch) for batch in summarizer.batches[:3]] == [2, 2, 1]
+    # Further levels reduce the one-word summaries, two to a chunk, until two words are left
+    assert summarizer.batches[3:] == [[["s0", "s1"], ["s2", "s3"]], [["s4"]], [["s0", "s2"], ["s4"]]]
+    assert reduced == ["s0", "s4"]
+
+
+def test_reduce_depth_is_bounded():
+    summarizer = WordCountSummarizer(max_input_tokens=4, chunk_overlap=0, max_reduce_depth=1)
+    reduced = summarizer._reduce_to_window(["a b", "c d", "e f"], {})
+    # One level of map-reduce, even though the result still does not fit
+    assert reduced == ["a", "c", "e"]
+    assert len(summarizer.batches) == 1
+
+
+def test_greedy_tier_drops_beam_search_settings():
+    summarizer = TextSummarizer()
+    fast = summarizer.tier_generation_kwargs("fast", max_length=150)
+    assert fast["num_beams"] == 1 and fast["max_length"] == 100
+    # generate() would warn about these on every greedy call
+    assert "length_penalty" not in fast and "early_stopping" not in fast
+    assert summarizer.tier_generation_kwargs("reduced")["length_penalty"] == 2.0
@@ -0,0 +1,45 @@
+import numpy as np
+
+from models.thompson import ThompsonSampler
+
+
+def test_posterior_mean_is_beta_mean():
+    sampler = ThompsonSampler(prior_successes=1, prior_failures=1)
+    sampler.add("q1")
+    sampler.add("q2", successes=4, failures=1)
+    sampler.update("q1", True)
+    sampler.update_counts({"q1": (2, 3), "unknown": (5, 5)})
+
+    # Beta(1 + s, 1 + f) has mean (1 + s) / (2 + s + f)
+    np.testing.assert_allclose(sampler.mean(sampler.rows(["q1", "q2"])), [4 / 8, 5 / 7])
+    assert sampler.rows(["unknown"]).tolist() == [-1]
+
+
+def test_samples_follow_the_posterior():
+    sampler = ThompsonSampler(seed=0)
+    sampler.add("q", successes=30, failures=10)
+    draws = np.concatenate([sampler.sample() for _ in range(20000)])
+    a, b = 31, 11
+    np.testing.assert_allclose(draws.mean(), a / (a + b), atol=0.005)
+    np.testing.assert_allclose(draws.var(), a * b / ((a + b) ** 2 * (a + b + 1)), rtol=0.1)
+
+
+def test_select_prefers_questions_near_the_target():
+    sampler = ThompsonSampler(seed=0)
+    sampler.load({
+        "easy": {"successes": 900, "failures": 100},
+        "medium": {"successes": 500, "failures": 500},
+        "hard": {"successes": 100, "failures": 900},
+    })
+    assert sampler.select(0.8, 1) == ["easy"]
+    assert sampler.select(0.2, 2) == ["hard", "medium"]
+    assert sampler.select(0.5, 5, candidates=["hard", "unknown"]) == ["hard"]
+
+
+def test_arrays_grow_past_initial_capacity():
+    sampler = ThompsonSampler(initial_capacity=2)
+    for i in range(5):
+        sampler.add(f"q{i}", successes=i)
+    assert len(sampler) == 5
+    assert sampler.stats()["capacity"] >= 5
+    np.testing.assert_allclose(sampler.mean(sampler.rows(["q4"])), [5 / 6])